@@ -0,0 +1,273 @@
+"""
+class statistics for final_project.py with numpy
+
+load_snapshot() reads every result once into a ResultSnapshot, four flat
+arrays (int32 student and subject ids, int32 points, float32 percents) of
+16 bytes per result instead of a tuple per row. the statistics are computed
+from the arrays without a Python loop over the results:
+
+    snapshot = analytics.snapshot(session)
+    print_subject_statistics(subject_statistics(snapshot))
+    student_statistics(snapshot)
+
+snapshot() keeps the last snapshot of every database. a refresh checks one
+aggregate of the whole results table, if that changed it compares per-subject
+aggregates and reloads only the results of the subjects that changed.
+"""
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import final_project as fp
+
+
+SNAPSHOT_FETCH_SIZE = 50000
+PERCENTILES = (10, 25, 50, 75, 90)
+# a percent below GRADE_BOUNDS[0] is an F, from GRADE_BOUNDS[-1] on an A
+GRADE_BOUNDS = (0.5, 0.6, 0.7, 0.8, 0.9)
+GRADES = ("F", "E", "D", "C", "B", "A")
+
+SubjectStatistics = namedtuple("SubjectStatistics", ["subject_name", "count", "mean", "std", "min", "max", "percentiles", "grades"])
+StudentStatistics = namedtuple("StudentStatistics", ["id_numbers", "count", "mean", "std", "min", "max"])
+
+class ResultSnapshot:
+    """
+    every result of a database as columns, row i of all four arrays is one result.\n
+    percents of results without a percent are NaN. subject_names and id_numbers map the
+    subject_id and student_id keys to names.
+    """
+    def __init__(self, student_ids, subject_ids, points, percents, subject_names:dict, id_numbers:dict, fingerprint=None, subject_fingerprints=None):
+        self.student_ids = student_ids
+        self.subject_ids = subject_ids
+        self.points = points
+        self.percents = percents
+        self.subject_names = subject_names
+        self.id_numbers = id_numbers
+        self.fingerprint = fingerprint
+        self.subject_fingerprints = subject_fingerprints
+        self.loaded_at = time.time()
+        self._by_subject = None
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @property
+    def nbytes(self):
+        return self.student_ids.nbytes + self.subject_ids.nbytes + self.points.nbytes + self.percents.nbytes
+
+    def by_subject(self):
+        """(subject_ids, percents) of the results with a percent, sorted by subject and percent."""
+        if self._by_subject == None:
+            valid = ~np.isnan(self.percents)
+            subject_ids, percents = self.subject_ids[valid], self.percents[valid]
+            # one sort on subject_id + percent shifted into [0, 1)
+            offset = percents.min() if len(percents) else 0
+            span = float(percents.max() - offset) + 1 if len(percents) else 1
+            order = np.argsort(subject_ids * span + (percents - offset))
+            self._by_subject = (subject_ids[order], percents[order])
+        return self._by_subject
+
+# plain sums miss updates that cancel out (one result +5 points, another -5), the sums
+# weighted by result_id and the sum of squares change unless the same rows get the same values
+FINGERPRINT = """COUNT(*), MAX(result_id), SUM(points), SUM(student_id), SUM(percent),
+    SUM(points * points), SUM(result_id * points), SUM(result_id * student_id), SUM(result_id * percent)"""
+
+def fingerprint_values(row) -> tuple:
+    return tuple(None if value == None else float(value) for value in row)
+
+def results_fingerprint(session) -> tuple:
+    """changes whenever a result is written, deleted or gets another percent."""
+    with fp.open_cursor(session) as cursor:
+        cursor.execute("SELECT {} FROM results".format(FINGERPRINT))
+        return fingerprint_values(cursor.fetchone())
+
+def subject_fingerprints(session) -> dict:
+    """{subject_id: fingerprint} like results_fingerprint() for every subject."""
+    with fp.open_cursor(session) as cursor:
+        # subject_id + 0: grouping through the subject_id index would read the rows in index
+        # order, one random table lookup per result, a plain scan is several times faster
+        cursor.execute("SELECT subject_id + 0, {} FROM results GROUP BY subject_id + 0".format(FINGERPRINT))
+        return {row[0]: fingerprint_values(row[1:]) for row in cursor.fetchall()}
+
+def load_columns(session, subject_ids=None, fetch_size:int=SNAPSHOT_FETCH_SIZE):
+    """(student_ids, subject_ids, points, percents) arrays of all results, or of the given subjects only."""
+    command = "SELECT student_id, subject_id, IFNULL(points, -1), IFNULL(percent, -1) FROM results"
+    params = ()
+    if subject_ids != None:
+        subject_ids = list(subject_ids)
+        if not subject_ids:
+            return (np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32))
+        command += " WHERE subject_id IN ({})".format(", ".join(["%s"] * len(subject_ids)))
+        params = tuple(subject_ids)
+
+    chunks = []
+    with fp.open_cursor(session, buffered=False) as cursor:
+        # NULL points and percents come as -1, the percents are turned into NaN below
+        cursor.execute(command, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    table = np.concatenate(chunks) if chunks else np.empty((0, 4))
+
+    percents = table[:, 3].astype(np.float32)
+    percents[percents < 0] = np.nan
+    return table[:, 0].astype(np.int32), table[:, 1].astype(np.int32), table[:, 2].astype(np.int32), percents
+
+def load_names(session):
+    """{subject_id: subject_name} and {student_id: id_number}."""
+    with fp.open_cursor(session) as cursor:
+        cursor.execute("SELECT subject_id, subject_name FROM subjects")
+        subject_names = dict(cursor.fetchall())
+        cursor.execute("SELECT student_id, id_number FROM students")
+        id_numbers = dict(cursor.fetchall())
+    return subject_names, id_numbers
+
+def load_snapshot(session, fetch_size:int=SNAPSHOT_FETCH_SIZE) -> ResultSnapshot:
+    """reads all results through an unbuffered cursor, fetch_size rows at a time."""
+    # the fingerprints come first: a write between them and the rows makes the snapshot
+    # look changed on the next refresh, the other way round it would look current forever
+    fingerprint = results_fingerprint(session)
+    subjects = subject_fingerprints(session)
+    return ResultSnapshot(*load_columns(session, fetch_size=fetch_size), *load_names(session), fingerprint, subjects)
+
+def refresh_snapshot(session, snapshot:ResultSnapshot) -> ResultSnapshot:
+    """
+    returns snapshot if no result changed since it was loaded, otherwise a new snapshot
+    that reuses the rows of the unchanged subjects and reloads the others.
+    """
+    fingerprint = results_fingerprint(session)
+    if fingerprint == snapshot.fingerprint:
+        return snapshot
+    subjects = subject_fingerprints(session)
+    changed = [subject_id for subject_id in set(subjects) | set(snapshot.subject_fingerprints)
+               if subjects.get(subject_id) != snapshot.subject_fingerprints.get(subject_id)]
+    if len(changed) * 2 > len(subjects):
+        return ResultSnapshot(*load_columns(session), *load_names(session), fingerprint, subjects)
+
+    keep = ~np.isin(snapshot.subject_ids, np.array(changed, dtype=np.int32))
+    fresh = load_columns(session, [subject_id for subject_id in changed if subject_id in subjects])
+    columns = [np.concatenate((old[keep], new)) for old, new in
+               zip((snapshot.student_ids, snapshot.subject_ids, snapshot.points, snapshot.percents), fresh)]
+    return ResultSnapshot(*columns, *load_names(session), fingerprint, subjects)
+
+SNAPSHOTS = {}
+SNAPSHOTS_LOCK = threading.Lock()
+
+def snapshot(session, max_age:float=0) -> ResultSnapshot:
+    """
+    the snapshot of the database of session. a cached snapshot younger than max_age
+    seconds is returned as it is, an older one is refreshed with refresh_snapshot().
+    """
+    scope = fp.cache_scope(session)
+    with SNAPSHOTS_LOCK:
+        cached = SNAPSHOTS.get(scope)
+    if cached == None:
+        fresh = load_snapshot(session)
+    elif time.time() - cached.loaded_at < max_age:
+        return cached
+    else:
+        fresh = refresh_snapshot(session, cached)
+        if fresh is cached:
+            cached.loaded_at = time.time()
+            return cached
+    with SNAPSHOTS_LOCK:
+        SNAPSHOTS[scope] = fresh
+    return fresh
+
+def clear_snapshots():
+    with SNAPSHOTS_LOCK:
+        SNAPSHOTS.clear()
+
+def group_bounds(sorted_keys):
+    """keys, start and end index of every run of equal keys in a sorted array."""
+    if len(sorted_keys) == 0:
+        return sorted_keys, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = np.r_[starts[1:], len(sorted_keys)]
+    return sorted_keys[starts], starts, ends
+
+def group_percentiles(sorted_values, starts, ends, percentiles=PERCENTILES):
+    """percentiles (linear interpolation, like np.percentile) of every group of sorted_values, one column per percentile."""
+    counts = (ends - starts).astype(np.float64)
+    columns = []
+    for q in percentiles:
+        position = starts + (counts - 1) * q / 100
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, ends - 1)
+        fraction = position - low
+        columns.append(sorted_values[low] * (1 - fraction) + sorted_values[high] * fraction)
+    return np.column_stack(columns) if columns else np.empty((len(starts), 0))
+
+def subject_statistics(snapshot:ResultSnapshot, percentiles=PERCENTILES) -> dict:
+    """
+    returns {subject_name: SubjectStatistics} of the percents of every subject with results:
+    count, mean, std, min, max, percentiles as {p: value} and grades as {grade: count}.
+    """
+    subject_ids, percents = snapshot.by_subject()
+    keys, starts, ends = group_bounds(subject_ids)
+    if len(keys) == 0:
+        return {}
+    values = percents.astype(np.float64)
+    counts = ends - starts
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+    squares = np.add.reduceat(values * values, starts)
+    stds = np.sqrt(np.maximum(squares / counts - means * means, 0))
+    quantiles = group_percentiles(values, starts, ends, percentiles)
+
+    group = np.repeat(np.arange(len(keys)), counts)
+    grades = np.searchsorted(GRADE_BOUNDS, values, side="right")
+    histogram = np.bincount(group * len(GRADES) + grades, minlength=len(keys) * len(GRADES)).reshape(len(keys), len(GRADES))
+
+    statistics = {}
+    for i, subject_id in enumerate(keys.tolist()):
+        name = snapshot.subject_names.get(subject_id, subject_id)
+        statistics[name] = SubjectStatistics(
+            name, int(counts[i]), float(means[i]), float(stds[i]), float(values[starts[i]]), float(values[ends[i] - 1]),
+            dict(zip(percentiles, quantiles[i].tolist())), dict(zip(GRADES, histogram[i].tolist())))
+    return statistics
+
+def student_statistics(snapshot:ResultSnapshot) -> StudentStatistics:
+    """
+    count, mean, std, min and max of the percents of every student with results,
+    as arrays in the order of id_numbers.
+    """
+    valid = ~np.isnan(snapshot.percents)
+    student_ids = snapshot.student_ids[valid]
+    values = snapshot.percents[valid].astype(np.float64)
+    size = int(student_ids.max()) + 1 if len(student_ids) else 0
+    counts = np.bincount(student_ids, minlength=size)
+    present = np.flatnonzero(counts)
+    sums = np.bincount(student_ids, weights=values, minlength=size)
+    squares = np.bincount(student_ids, weights=values * values, minlength=size)
+    minimums = np.full(size, np.inf)
+    np.minimum.at(minimums, student_ids, values)
+    maximums = np.full(size, -np.inf)
+    np.maximum.at(maximums, student_ids, values)
+
+    counts = counts[present]
+    means = sums[present] / counts
+    stds = np.sqrt(np.maximum(squares[present] / counts - means * means, 0))
+    id_numbers = np.array([snapshot.id_numbers.get(student_id, str(student_id)) for student_id in present.tolist()], dtype=object)
+    return StudentStatistics(id_numbers, counts, means, stds, minimums[present], maximums[present])
+
+def print_subject_statistics(statistics:dict):
+    if not statistics:
+        print("no results in database.")
+        return
+    print("Subject\t\tCount\tMean\tStd\tMin\tMedian\tMax\t" + "\t".join(GRADES))
+    for name, stats in sorted(statistics.items(), key=lambda item: str(item[0])):
+        median = stats.percentiles.get(50, float("nan"))
+        print("{}\t{}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{}".format(
+            name, stats.count, stats.mean, stats.std, stats.min, median, stats.max,
+            "\t".join(str(stats.grades[grade]) for grade in GRADES)))
+
+if __name__ == "__main__":
+    pool = fp.create_pool("localhost", "root", "longpassword", pool_size=1)
+    with pool.connection() as session:
+        print_subject_statistics(subject_statistics(snapshot(session)))
+    pool.close()
@@ -0,0 +1,152 @@
+"""
+benchmark suite for final_project.py
+
+generates a school of every requested size with populate_synthetic_data(),
+times the hot paths on it and writes the timings as JSON, so runs before and
+after a change can be compared. with --backend mysql every size gets its
+own database school_bench_<size>, which has to be empty before the run.
+
+    python benchmark.py
+    python benchmark.py --sizes small,medium --repeat 20 --output bench.json
+    python benchmark.py --backend mysql --host localhost --user root --password longpassword
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import final_project as fp
+
+
+SIZES = {
+    "tiny": {"students": 100, "subjects": 10, "results": 1000},
+    "small": {"students": 1000, "subjects": 50, "results": 20000},
+    "medium": {"students": 10000, "subjects": 200, "results": 200000},
+    "large": {"students": 100000, "subjects": 500, "results": 2000000},
+}
+
+def percentile(samples:list, fraction:float):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples:list):
+    """timing statistics of a list of durations in seconds, reported in milliseconds."""
+    return {
+        "runs": len(samples),
+        "min_ms": min(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+def time_calls(function, arguments:list):
+    """calls function once per entry of arguments and returns the durations, output is discarded."""
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in arguments:
+            start = time.perf_counter()
+            function(*args)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def make_backend(options, size_name:str):
+    if options.backend == "sqlite":
+        return fp.SQLiteBackend(options.sqlite_path.format(size=size_name) if options.sqlite_path else ":memory:")
+    return fp.MySQLBackend(options.host, options.user, options.password, "school_bench_{}".format(size_name))
+
+def run_size(options, size_name:str):
+    size = SIZES[size_name]
+    rng = random.Random(options.seed)
+    backend = make_backend(options, size_name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend.bootstrap()
+    pool = backend.create_pool(1)
+    report = {"size": size_name, **size, "operations": {}}
+    operations = report["operations"]
+    with pool.connection() as session:
+        start = time.perf_counter()
+        written = fp.populate_synthetic_data(session, seed=options.seed, batch_size=options.batch_size, **size)
+        elapsed = time.perf_counter() - start
+        report["rows"] = written
+        operations["bulk_load"] = {
+            **summarize([elapsed]),
+            "rows_per_second": sum(written.values()) / elapsed if elapsed else None,
+        }
+
+        id_numbers = ["ST{:08d}".format(rng.randrange(size["students"])) for _ in range(options.repeat)]
+        subject_names = ["Subject {:04d}".format(rng.randrange(size["subjects"])) for _ in range(options.repeat)]
+        usernames = [rng.randrange(size["students"]) for _ in range(options.repeat)]
+
+        operations["rank_students"] = summarize(time_calls(fp.rank_students, [(session,)] * max(1, options.repeat // 10)))
+        operations["fetch_result"] = summarize(time_calls(fp.fetch_result, [(session, id_number) for id_number in id_numbers]))
+        operations["fetch_result_subject"] = summarize(time_calls(fp.fetch_result, list(zip([session] * options.repeat, id_numbers, subject_names))))
+        operations["total_ave"] = summarize(time_calls(fp.total_ave, [(session, id_number) for id_number in id_numbers]))
+        # the generated users have cheap hashes that the first login raises to PASSWORD_ITERATIONS:
+        # login_rehash times these first logins, login the ones after it
+        operations["login_rehash"] = summarize(time_calls(fp.login, [(session, "parent_{:06d}".format(i), "password{}".format(i))
+                                                                     for i in sorted(set(usernames))]))
+        operations["login"] = summarize(time_calls(fp.login, [(session, "parent_{:06d}".format(i), "password{}".format(i)) for i in usernames]))
+        operations["insert_results"] = summarize(time_calls(fp.insert_results,
+            [(session, id_number, subject_name, str(rng.randint(0, 50))) for id_number, subject_name in zip(id_numbers, subject_names)]))
+    pool.close()
+    if options.backend == "sqlite":
+        backend.close()
+    return report
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="time the hot paths of final_project.py on generated data")
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--sizes", default="tiny,small", help="comma separated, from: {}".format(", ".join(SIZES)))
+    parser.add_argument("--repeat", type=int, default=50, help="calls per timed operation")
+    parser.add_argument("--batch-size", type=int, default=fp.BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sqlite-path", default="", help="file per size, e.g. bench_{size}.db (default: in memory)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--output", default="", help="write the JSON report to this file instead of stdout")
+    options = parser.parse_args(argv)
+
+    sizes = [name.strip() for name in options.sizes.split(",") if name.strip()]
+    unknown = [name for name in sizes if name not in SIZES]
+    if unknown:
+        parser.error("unknown size(s): {}".format(", ".join(unknown)))
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": options.backend,
+        "seed": options.seed,
+        "repeat": options.repeat,
+        "batch_size": options.batch_size,
+        "results": [],
+    }
+    for size_name in sizes:
+        print("benchmarking {} ...".format(size_name), file=sys.stderr)
+        report["results"].append(run_size(options, size_name))
+
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,1200 @@
 import mysql.connector
-from mysql.connector.errors import DatabaseError, Error
+from mysql.connector.errors import DatabaseError, Error, PoolError
+from mysql.connector.constants import ClientFlag
 import random
+import sys
+import csv
+import threading
+import queue
+import time
+import asyncio
+import json
+import hashlib
+import hmac
+import secrets
+import base64
+import socket
+import re
+import bisect
+import itertools
+import sqlite3
+import os
+import mmap
+import array
+import contextvars
+from collections import namedtuple, deque, OrderedDict
+from decimal import Decimal
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor, Future
 
 
 DB_NAME = "school_database"
 
-def connect_db(host:str, username:str, password:str):
+def connect_db(host:str, username:str, password:str, database:str=None):
+    """
+    opens one connection to the server.\n
+    if database is given the connection selects it right away
+    and the functions don't need to run "use DB_NAME" first.
+    """
     try:
         session = mysql.connector.connect(
         host=host,
         user=username,
-        password=password
+        password=password,
+        database=database,
+        client_flags=[ClientFlag.FOUND_ROWS]
         )
+        # cache_scope() tells the databases apart by it
+        session.school_database = database or DB_NAME
         print("connect_db: OK")
         return session
     except DatabaseError as de:
         print("Failed to connect to database.\nerror: {}".format(de))
         exit(1)
 
-# CREATE TABELES
-def create_databases(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str):
+# INSTRUMENTATION
+# off by default, enable_instrumentation() switches it on at runtime.
+# every statement that goes through a cursor from new_cursor()/open_cursor() is timed and
+# counted under its statement template and under the logical operations (the functions
+# decorated with @instrumented) that are running in the current thread.
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG_SIZE = 200
+
+class StatementStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        # buckets[i] counts statements faster than LATENCY_BUCKETS_MS[i], the last one the rest
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms:float, failed:bool):
+        self.count += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile_ms(self, fraction:float):
+        """upper bound of the bucket holding the given fraction of the statements."""
+        target = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(LATENCY_BUCKETS_MS[i], self.max_ms) if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return 0.0
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.total_ms = 0.0
+
+class Instrumentation:
+    """collected statistics, use the module functions below instead of this class directly."""
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_ms = SLOW_QUERY_MS
+        self.explain = True
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.statements = {}
+            self.operations = {}
+            self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def record_statement(self, template:str, elapsed_ms:float, failed:bool):
+        with self.lock:
+            stats = self.statements.get(template)
+            if stats == None:
+                stats = self.statements[template] = StatementStats()
+            stats.add(elapsed_ms, failed)
+        for frame in self.stack():
+            frame[1] += 1
+
+    def record_rows(self, template:str, rows:int):
+        with self.lock:
+            stats = self.statements.get(template)
+            if stats != None:
+                stats.rows += rows
+
+    def record_operation(self, name:str, statements:int, elapsed_ms:float, failed:bool):
+        with self.lock:
+            stats = self.operations.get(name)
+            if stats == None:
+                stats = self.operations[name] = OperationStats()
+            stats.calls += 1
+            stats.errors += failed
+            stats.statements += statements
+            stats.max_statements = max(stats.max_statements, statements)
+            stats.total_ms += elapsed_ms
+
+INSTRUMENTATION = Instrumentation()
+
+def enable_instrumentation(slow_query_ms:float=SLOW_QUERY_MS, explain:bool=True):
+    """
+    starts collecting statistics.\n
+    statements slower than slow_query_ms are added to the slow query log,
+    with the EXPLAIN output of the statement if explain is True.
+    """
+    INSTRUMENTATION.slow_query_ms = slow_query_ms
+    INSTRUMENTATION.explain = explain
+    INSTRUMENTATION.enabled = True
+
+def disable_instrumentation():
+    """stops collecting, the statistics collected so far are kept."""
+    INSTRUMENTATION.enabled = False
+
+def reset_instrumentation():
+    INSTRUMENTATION.reset()
+
+@lru_cache(maxsize=1024)
+def statement_template(command:str) -> str:
+    """the statement with whitespace collapsed and literal values replaced by ?, used as key of the statistics."""
+    command = re.sub(r"'(?:[^'\\]|\\.)*'", "?", command)
+    command = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?\b", "?", command)
+    command = command.replace("%s", "?")
+    return " ".join(command.split()).rstrip(";")
+
+EXPLAIN_SERIAL = itertools.count()
+
+def explain_statement(session, command:str, params) -> list:
+    """the EXPLAIN rows of command, empty list for statements that can't be explained."""
+    if not re.match(r"\s*(select|insert|update|delete|replace)\b", command, re.IGNORECASE):
+        return []
+    if dialect(session) == "sqlite":
+        # sqlite3 reuses the compiled EXPLAIN of a statement text it has seen before, even after
+        # indexes were added or dropped, so every EXPLAIN gets a text of its own
+        command += "\n-- plan {}".format(next(EXPLAIN_SERIAL))
+    prefix = "EXPLAIN QUERY PLAN " if dialect(session) == "sqlite" else "EXPLAIN "
+    cursor = None
     try:
-        cursor = session.cursor()
-        print("Creating database {}".format(DB_NAME))
-        cursor.execute("create database {}".format(DB_NAME))
-        print("create_database: OK")
-    except DatabaseError as de:
-        if de.errno == 1007:
-            print("create_database: database {} already exists.".format(DB_NAME))
+        cursor = session.cursor(buffered=True)
+        cursor.execute(prefix + command, params)
+        return [tuple(row) for row in cursor.fetchall()]
+    except Error as e:
+        return [("EXPLAIN failed: {}".format(e),)]
+    finally:
+        if cursor != None:
+            cursor.close()
+
+class InstrumentedCursor:
+    """wraps a cursor of any backend and reports every statement to INSTRUMENTATION."""
+    def __init__(self, session, cursor):
+        self.session = session
+        self.cursor = cursor
+        self.template = None
+        self.pending_explain = None
+
+    def _run(self, method, command:str, params, many:bool):
+        self._explain_pending()
+        self.template = statement_template(command)
+        failed = True
+        start = time.perf_counter()
+        try:
+            result = method(command, params)
+            failed = False
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            INSTRUMENTATION.record_statement(self.template, elapsed_ms, failed)
+            if not failed and elapsed_ms >= INSTRUMENTATION.slow_query_ms:
+                # the statement itself succeeded, a failing EXPLAIN must not turn it into an error
+                try:
+                    slow_query = {
+                        "time": time.time(), "template": self.template, "ms": elapsed_ms,
+                        "operation": ".".join(frame[0] for frame in INSTRUMENTATION.stack()), "explain": [],
+                    }
+                    INSTRUMENTATION.slow_queries.append(slow_query)
+                    if INSTRUMENTATION.explain and not many:
+                        # the connection can't run the EXPLAIN while the rows of this statement are
+                        # still unread (prepared and unbuffered cursors), it runs once they are read
+                        self.pending_explain = (slow_query, command, params)
+                        if not self.cursor.with_rows:
+                            self._explain_pending()
+                except Error:
+                    pass
+
+    def _explain_pending(self):
+        """runs the EXPLAIN of the last slow statement once its result is no longer pending."""
+        if self.pending_explain == None:
+            return
+        slow_query, command, params = self.pending_explain
+        self.pending_explain = None
+        try:
+            slow_query["explain"] = explain_statement(self.session, command, params)
+        except Error as e:
+            slow_query["explain"] = [("EXPLAIN failed: {}".format(e),)]
+
+    def execute(self, command:str, params=()):
+        return self._run(self.cursor.execute, command, params, False)
+
+    def executemany(self, command:str, rows):
+        return self._run(self.cursor.executemany, command, rows, True)
+
+    def _rows(self, rows):
+        if self.template != None:
+            INSTRUMENTATION.record_rows(self.template, len(rows))
+        return rows
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row == None:
+            self._explain_pending()
+        elif self.template != None:
+            INSTRUMENTATION.record_rows(self.template, 1)
+        return row
+
+    def fetchmany(self, size:int=1):
+        rows = self._rows(self.cursor.fetchmany(size))
+        if not rows:
+            self._explain_pending()
+        return rows
+
+    def fetchall(self):
+        rows = self._rows(self.cursor.fetchall())
+        self._explain_pending()
+        return rows
+
+    def close(self):
+        result = self.cursor.close()
+        self._explain_pending()
+        return result
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+def instrumented(function):
+    """
+    decorator for the data-access functions, every call is one logical operation.\n
+    counts the calls, the statements (round trips) they run, including the ones of
+    other operations they call, and their duration.
+    """
+    name = function.__name__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not INSTRUMENTATION.enabled:
+            return function(*args, **kwargs)
+        stack = INSTRUMENTATION.stack()
+        frame = [name, 0]
+        stack.append(frame)
+        failed = True
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            stack.pop()
+            INSTRUMENTATION.record_operation(name, frame[1], (time.perf_counter() - start) * 1000, failed)
+    return wrapper
+
+def instrumentation_counters() -> dict:
+    """
+    the statistics as a flat dict of counters, ready to be exported
+    (e.g. "operation.total_ave.statements", "statement.<template>.bucket_le_5ms").
+    """
+    counters = {}
+    with INSTRUMENTATION.lock:
+        for name, stats in INSTRUMENTATION.operations.items():
+            prefix = "operation.{}.".format(name)
+            counters[prefix + "calls"] = stats.calls
+            counters[prefix + "errors"] = stats.errors
+            counters[prefix + "statements"] = stats.statements
+            counters[prefix + "max_statements"] = stats.max_statements
+            counters[prefix + "total_ms"] = stats.total_ms
+        for template, stats in INSTRUMENTATION.statements.items():
+            prefix = "statement.{}.".format(template)
+            counters[prefix + "count"] = stats.count
+            counters[prefix + "errors"] = stats.errors
+            counters[prefix + "rows"] = stats.rows
+            counters[prefix + "total_ms"] = stats.total_ms
+            counters[prefix + "max_ms"] = stats.max_ms
+            for bound, count in zip(LATENCY_BUCKETS_MS + ("inf",), stats.buckets):
+                counters[prefix + "bucket_le_{}ms".format(bound)] = count
+        counters["slow_queries"] = len(INSTRUMENTATION.slow_queries)
+    return counters
+
+def instrumentation_report() -> str:
+    """the statistics as a printable text report, hottest operations and statements first."""
+    lines = []
+    with INSTRUMENTATION.lock:
+        operations = sorted(INSTRUMENTATION.operations.items(), key=lambda item: -item[1].total_ms)
+        statements = sorted(INSTRUMENTATION.statements.items(), key=lambda item: -item[1].total_ms)
+        slow_queries = list(INSTRUMENTATION.slow_queries)
+    lines.append("Operation\t\tCalls\tErrors\tQueries/call\tMax queries\tAvg ms\tTotal ms")
+    for name, stats in operations:
+        lines.append("{}\t\t{}\t{}\t{:.1f}\t\t{}\t\t{:.2f}\t{:.1f}".format(
+            name, stats.calls, stats.errors, stats.statements / stats.calls, stats.max_statements,
+            stats.total_ms / stats.calls, stats.total_ms))
+    lines.append("")
+    lines.append("Count\tErrors\tRows\tAvg ms\tp50 ms\tp95 ms\tp99 ms\tMax ms\tStatement")
+    for template, stats in statements:
+        lines.append("{}\t{}\t{}\t{:.2f}\t{}\t{}\t{}\t{:.2f}\t{}".format(
+            stats.count, stats.errors, stats.rows, stats.total_ms / stats.count, stats.percentile_ms(0.5),
+            stats.percentile_ms(0.95), stats.percentile_ms(0.99), stats.max_ms, template[:120]))
+    if slow_queries:
+        lines.append("")
+        lines.append("Slow queries (>= {} ms)".format(INSTRUMENTATION.slow_query_ms))
+        for entry in slow_queries:
+            lines.append("{:.1f} ms\t{}\t{}".format(entry["ms"], entry["operation"] or "-", entry["template"][:120]))
+            for row in entry["explain"]:
+                lines.append("\t" + "\t".join(str(value) for value in row))
+    return "\n".join(lines)
+
+# CURSORS
+def new_cursor(session:'mysql.connector.connection_cext.CMySQLConnection', **kwargs):
+    """session.cursor(**kwargs), wrapped in an InstrumentedCursor while instrumentation is enabled."""
+    cursor = session.cursor(**kwargs)
+    if INSTRUMENTATION.enabled:
+        return InstrumentedCursor(session, cursor)
+    return cursor
+
+# rows read at a time by close_cursor() from a result that was not read to the end
+DRAIN_FETCH_SIZE = 1000
+
+def close_cursor(cursor):
+    """
+    reads whatever is left of the last result and closes the cursor.\n
+    a result left unread makes the next query on the same connection fail with
+    "Unread result found" (see NOTES.txt), which breaks a pooled connection for its next user.
+    the rest is read DRAIN_FETCH_SIZE rows at a time and thrown away, so an unbuffered cursor
+    closed early never holds the rest of a large result in memory.
+    """
+    try:
+        if cursor.with_rows:
+            while cursor.fetchmany(DRAIN_FETCH_SIZE):
+                pass
+    except Error:
+        pass
+    cursor.close()
+
+@contextmanager
+def open_cursor(session:'mysql.connector.connection_cext.CMySQLConnection', **kwargs):
+    """
+    with open_cursor(session) as cursor:\n
+    creates a cursor with new_cursor() and always closes it with close_cursor() when the block ends,
+    also when the block returns early or raises.\n
+    cursors are buffered unless buffered=False is given, so fetchone() never
+    leaves rows unread behind.
+    """
+    kwargs.setdefault("buffered", True)
+    cursor = new_cursor(session, **kwargs)
+    try:
+        yield cursor
+    finally:
+        close_cursor(cursor)
+
+# PREPARED STATEMENTS
+# the hot queries are sent to the server once per connection as prepared statements
+# (cursor(prepared=True)), after that only their parameters are sent and the server does
+# not parse and plan them again. every connection keeps its prepared cursors in a
+# StatementCache by statement text; the least recently used is closed, which deallocates
+# its statement on the server. statements die with their connection, so after a reconnect
+# they are prepared again. on SQLite the cursor is reused the same way and sqlite3
+# keeps the compiled statement.
+STATEMENT_CACHE_SIZE = 64
+
+PREPARED_STATS = {"prepares": 0, "reprepares": 0, "executes": 0, "evictions": 0, "reconnects": 0}
+PREPARED_STATS_LOCK = threading.Lock()
+
+def count_prepared(name:str):
+    with PREPARED_STATS_LOCK:
+        PREPARED_STATS[name] += 1
+
+def connection_identity(session):
+    """changes when the connection of session is replaced by a reconnect."""
+    if dialect(session) == "sqlite":
+        return id(session.connection)
+    return session.connection_id
+
+class StatementCache:
+    """
+    the prepared cursors of one connection, at most max_size, by statement text.\n
+    a connection is used by one thread at a time, so there is no lock.
+    """
+    def __init__(self, session, max_size:int=STATEMENT_CACHE_SIZE):
+        self.session = session
+        self.max_size = max(1, max_size)
+        self.cursors = OrderedDict()
+        self.prepared = set()
+        self.connection = connection_identity(session)
+
+    def cursor(self, command:str):
+        """
+        returns (command, cursor): the prepared cursor of command and the string it was
+        prepared with. the cursor prepares again for any other string object, even an equal one.
+        """
+        connection = connection_identity(self.session)
+        if connection != self.connection:
+            # the server dropped the statements with the old connection, there is nothing to close
+            self.cursors.clear()
+            self.connection = connection
+            count_prepared("reconnects")
+        entry = self.cursors.get(command)
+        if entry != None:
+            self.cursors.move_to_end(command)
+            return entry
+        entry = self.cursors[command] = (command, self.session.cursor(prepared=True))
+        count_prepared("reprepares" if command in self.prepared else "prepares")
+        self.prepared.add(command)
+        while len(self.cursors) > self.max_size:
+            close_cursor(self.cursors.popitem(last=False)[1][1])
+            count_prepared("evictions")
+        return entry
+
+    def discard(self, command:str):
+        """drops the cursor of command, after an error its state is unknown."""
+        entry = self.cursors.pop(command, None)
+        if entry != None:
+            try:
+                close_cursor(entry[1])
+            except Error:
+                pass
+
+    def close(self):
+        for command in list(self.cursors):
+            self.discard(command)
+
+def statement_cache(session) -> StatementCache:
+    cache = getattr(session, "statement_cache", None)
+    if cache == None:
+        cache = session.statement_cache = StatementCache(session)
+    return cache
+
+def run_prepared(session:'mysql.connector.connection_cext.CMySQLConnection', command:str, params=(), fetch:bool=True):
+    """
+    executes command with params as a prepared statement of session.\n
+    returns all rows if fetch is True, else the number of rows changed.
+    """
+    cache = statement_cache(session)
+    command, cursor = cache.cursor(command)
+    if INSTRUMENTATION.enabled:
+        cursor = InstrumentedCursor(session, cursor)
+    try:
+        cursor.execute(command, params)
+        count_prepared("executes")
+        return cursor.fetchall() if fetch else cursor.rowcount
+    except Error:
+        cache.discard(command)
+        raise
+
+def fetch_prepared(session:'mysql.connector.connection_cext.CMySQLConnection', command:str, params=()) -> list:
+    """the rows of the SELECT command, run as a prepared statement."""
+    return run_prepared(session, command, params, True)
+
+def execute_prepared(session:'mysql.connector.connection_cext.CMySQLConnection', command:str, params=()) -> int:
+    """runs the INSERT, UPDATE or DELETE command as a prepared statement, returns the number of rows changed."""
+    return run_prepared(session, command, params, False)
+
+def prepared_statement_stats() -> dict:
+    """how often statements were prepared, prepared again (after an eviction or reconnect) and executed."""
+    with PREPARED_STATS_LOCK:
+        stats = dict(PREPARED_STATS)
+    stats["reuse_ratio"] = 1 - (stats["prepares"] + stats["reprepares"]) / stats["executes"] if stats["executes"] else 0.0
+    return stats
+
+def reset_prepared_statement_stats():
+    with PREPARED_STATS_LOCK:
+        for name in PREPARED_STATS:
+            PREPARED_STATS[name] = 0
+
+# CONNECTION POOL
+POOL_SIZE = 5
+POOL_TIMEOUT = 30
+HEALTH_CHECK_INTERVAL = 10
+
+class ConnectionPool:
+    """
+    a fixed size pool of connections shared by several threads.\n
+    connect is a function without arguments that opens a new connection,
+    connections are only opened when needed and never more than pool_size.\n
+    with pool.connection() as session:\n
+    checks out a connection for the current thread. a thread that is already
+    holding a connection gets the same one back, so a function that calls
+    other data-access functions inside the block does not take a second one.\n
+    a connection idle for more than health_check_interval seconds is pinged before
+    it is handed out and replaced if it is dead. when a connection is returned its
+    open transaction is rolled back, so the next thread does not see uncommitted
+    writes or an old snapshot.\n
+    raises PoolError if no connection is free within timeout seconds.
+    """
+    def __init__(self, connect, pool_size:int=POOL_SIZE, timeout:float=POOL_TIMEOUT, health_check_interval:float=HEALTH_CHECK_INTERVAL):
+        self.connect = connect
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.opened = 0
+        self.closed = False
+
+    def _healthy(self, session, last_used:float):
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            session.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def _discard(self, session):
+        try:
+            session.close()
+        except Error:
+            pass
+        with self.lock:
+            self.opened -= 1
+
+    def acquire(self):
+        """
+        takes a connection out of the pool, use connection() instead unless
+        the connection has to outlive a with block. give it back with release().
+        """
+        if self.closed:
+            raise PoolError(msg="pool is closed")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                session, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    can_open = self.opened < self.pool_size
+                    if can_open:
+                        self.opened += 1
+                if can_open:
+                    try:
+                        return self.connect()
+                    except Exception:
+                        with self.lock:
+                            self.opened -= 1
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(msg="no free connection in the pool after {} seconds".format(self.timeout))
+                try:
+                    session, last_used = self.idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+            if self._healthy(session, last_used):
+                return session
+            self._discard(session)
+
+    def release(self, session):
+        """gives a connection from acquire() back to the pool."""
+        try:
+            session.rollback()
+        except Error:
+            self._discard(session)
+            return
+        if self.closed:
+            self._discard(session)
             return
+        self.idle.put((session, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        if getattr(self.local, "depth", 0) > 0:
+            self.local.depth += 1
+            try:
+                yield self.local.session
+            finally:
+                self.local.depth -= 1
+            return
+        session = self.acquire()
+        self.local.session = session
+        self.local.depth = 1
+        try:
+            yield session
+        finally:
+            self.local.depth = 0
+            self.local.session = None
+            self.release(session)
+
+    def close(self):
+        """closes the idle connections, connections still checked out are closed when released."""
+        self.closed = True
+        while True:
+            try:
+                session, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(session)
+
+# BACKENDS
+def dialect(session) -> str:
+    """returns "mysql" or "sqlite", the SQL dialect spoken by session."""
+    return getattr(session, "dialect", "mysql")
+
+class MySQLBackend:
+    """
+    the MySQL server the module was written for.\n
+    connect() opens a connection with database selected,
+    bootstrap() creates the database, tables, triggers and total_average function,
+    only the ones missing or changed (see bootstrap_schema()).
+    """
+    name = "mysql"
+
+    def __init__(self, host:str, username:str, password:str, database:str=DB_NAME):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.database = database
+
+    def connect(self):
+        # FOUND_ROWS: rowcount counts matched rows, insert_results() relies on it
+        session = mysql.connector.connect(host=self.host, user=self.username, password=self.password, database=self.database,
+                                          client_flags=[ClientFlag.FOUND_ROWS])
+        # cache_scope() tells the databases apart by it
+        session.school_database = self.database
+        return session
+
+    def create_pool(self, pool_size:int=POOL_SIZE):
+        return ConnectionPool(self.connect, pool_size)
+
+    def bootstrap(self):
+        try:
+            session = self.connect()
+        except DatabaseError as de:
+            # 1049: unknown database
+            if de.errno != 1049:
+                raise
+            server = connect_db(self.host, self.username, self.password)
+            try:
+                create_databases(server, self.database)
+            finally:
+                server.close()
+            session = self.connect()
+        try:
+            bootstrap_schema(session)
+        finally:
+            session.close()
+
+def create_pool(host:str, username:str, password:str, database:str=DB_NAME, pool_size:int=POOL_SIZE):
+    """
+    creates a ConnectionPool of MySQL connections,
+    every connection already has database selected.
+    """
+    return MySQLBackend(host, username, password, database).create_pool(pool_size)
+
+# SQLITE BACKEND
+# SQLite speaks almost the same SQL as the queries in this module,
+# the few MySQL only parts are rewritten by sqlite_statement()
+@lru_cache(maxsize=512)
+def sqlite_statement(command:str):
+    """
+    rewrites a MySQL statement of this module for SQLite.\n
+    returns None for statements SQLite has no use for ("use ...", "create database ...").
+    """
+    if re.match(r"\s*(use\s|create\s+database\s)", command, re.IGNORECASE):
+        return None
+    command = command.replace("%s", "?")
+    command = re.sub(r"\bINT PRIMARY KEY AUTO_INCREMENT\b", "INTEGER PRIMARY KEY", command, flags=re.IGNORECASE)
+    command = re.sub(r"\bENUM\([^)]*\)", "TEXT", command, flags=re.IGNORECASE)
+    # a SQLite writer locks the whole database, there are no row locks to take
+    command = re.sub(r"\s+FOR UPDATE\b", "", command, flags=re.IGNORECASE)
+    duplicate = re.search(r"\bON DUPLICATE KEY UPDATE\b", command, re.IGNORECASE)
+    if duplicate:
+        updates = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", command[duplicate.end():], flags=re.IGNORECASE)
+        command = command[:duplicate.start()] + "ON CONFLICT DO UPDATE SET" + updates
+    return command
+
+def sqlite_error(error:'sqlite3.Error'):
+    """turns a sqlite3 error into the mysql.connector error (and errno) the module already handles."""
+    message = str(error)
+    if isinstance(error, sqlite3.IntegrityError) and "UNIQUE" in message:
+        return mysql.connector.errors.IntegrityError(msg=message, errno=1062)
+    if isinstance(error, sqlite3.IntegrityError):
+        return mysql.connector.errors.IntegrityError(msg=message, errno=1452)
+    if "already exists" in message:
+        return mysql.connector.errors.ProgrammingError(msg=message, errno=1050)
+    if isinstance(error, sqlite3.OperationalError):
+        return mysql.connector.errors.OperationalError(msg=message)
+    return DatabaseError(msg=message)
+
+class SQLiteCursor:
+    """cursor of a SQLiteSession, runs every statement through sqlite_statement()."""
+    def __init__(self, session:'SQLiteSession'):
+        self.session = session
+        self.cursor = session.connection.cursor()
+        self.skipped = False
+
+    def execute(self, command:str, params=()):
+        statement = sqlite_statement(command)
+        self.skipped = statement == None
+        if self.skipped:
+            return
+        try:
+            self.cursor.execute(statement, tuple(params or ()))
+        except sqlite3.Error as e:
+            raise sqlite_error(e) from e
+
+    def executemany(self, command:str, rows):
+        statement = sqlite_statement(command)
+        try:
+            self.cursor.executemany(statement, rows)
+        except sqlite3.Error as e:
+            raise sqlite_error(e) from e
+
+    def fetchone(self):
+        return None if self.skipped else self.cursor.fetchone()
+
+    def fetchmany(self, size:int=1):
+        return [] if self.skipped else self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return [] if self.skipped else self.cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def with_rows(self):
+        return not self.skipped and self.cursor.description != None
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def close(self):
+        self.cursor.close()
+
+class SQLiteSession:
+    """
+    a sqlite3 connection that can be used everywhere a MySQL session is used.\n
+    errors are raised as mysql.connector errors with the MySQL errno,
+    so the existing errno checks (1050, 1062) keep working.\n
+    the total_average() and bulk_load() functions of the database are registered on every connection.
+    """
+    dialect = "sqlite"
+
+    def __init__(self, path:str=":memory:", uri:bool=False):
+        self.path = path
+        self.connection = sqlite3.connect(path, uri=uri, timeout=POOL_TIMEOUT, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.create_function("total_average", 1, self._total_average)
+        # the triggers skip their work while bulk_load() is 1, like @bulk_load on MySQL
+        self.bulk_load = False
+        self.connection.create_function("bulk_load", 0, lambda: int(self.bulk_load))
+
+    def _total_average(self, student_id):
+        # archived_stats holds the percents of the archived terms
+        row = self.connection.execute("""
+                SELECT ROUND((IFNULL(SUM(percent), 0) + IFNULL(archived_stats.percent_sum, 0))
+                             / NULLIF(COUNT(percent) + IFNULL(archived_stats.percent_count, 0), 0), 2)
+                FROM (SELECT ? AS student_id) AS student
+                LEFT JOIN results ON results.student_id = student.student_id
+                LEFT JOIN archived_stats ON archived_stats.student_id = student.student_id
+                """, (student_id,)).fetchone()
+        return row[0]
+
+    def cursor(self, **kwargs):
+        # buffered, prepared, ... have no meaning for sqlite3 cursors
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    @property
+    def in_transaction(self):
+        return self.connection.in_transaction
+
+    def ping(self, reconnect:bool=False, attempts:int=1, delay:int=0):
+        try:
+            self.connection.execute("SELECT 1")
+        except sqlite3.Error as e:
+            raise sqlite_error(e) from e
+
+    def is_connected(self):
+        try:
+            self.ping()
+            return True
+        except Error:
+            return False
+
+    def close(self):
+        self.connection.close()
+
+class SQLiteBackend:
+    """
+    embedded SQLite database, no server needed.\n
+    path is a file name, or ":memory:" for a database that lives as long as the backend.
+    an in memory database is shared by all connections of the backend (shared cache),
+    use a file when several threads write at the same time.\n
+    bootstrap() creates the same tables, triggers and total_average function as MySQL, see bootstrap_schema().
+    """
+    name = "sqlite"
+    memory_databases = 0
+
+    def __init__(self, path:str=":memory:"):
+        self.uri = path == ":memory:"
+        if self.uri:
+            SQLiteBackend.memory_databases += 1
+            self.path = "file:school_memory_{}?mode=memory&cache=shared".format(SQLiteBackend.memory_databases)
+            # the in memory database is dropped when its last connection closes
+            self.keeper = self.connect()
         else:
-            print("Faild to create database, error:".format(de))
-        exit(1)
+            self.path = path
+            self.keeper = None
+            session = self.connect()
+            session.connection.execute("PRAGMA journal_mode = WAL")
+            session.close()
+
+    def connect(self):
+        return SQLiteSession(self.path, self.uri)
+
+    def create_pool(self, pool_size:int=POOL_SIZE):
+        return ConnectionPool(self.connect, pool_size)
+
+    def bootstrap(self):
+        session = self.connect()
+        try:
+            bootstrap_schema(session)
+        finally:
+            session.close()
+
+    def close(self):
+        if self.keeper != None:
+            self.keeper.close()
+            self.keeper = None
+
+# REFERENCE DATA CACHE
+# the small, rarely changing key mappings almost every operation needs:
+# id_number -> student_id, subject_name -> (subject_id, total_points), username -> user_id.
+# entries are kept per database (cache_scope) and only found keys are cached,
+# so a student inserted by another process is seen on the next lookup.
+REFERENCE_CACHE_SIZE = 100000
+REFERENCE_CACHE_TTL = 300
+
+class LRUCache:
+    """
+    a thread-safe dict with at most max_size entries, the least recently used entry
+    is evicted first. entries older than ttl seconds are dropped on access (ttl=None keeps them).\n
+    hits, misses, evictions and expirations are counted for stats().
+    """
+    def __init__(self, max_size:int, ttl:float=None):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry != None and entry[0] != None and entry[0] < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry == None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl != None else None
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate_where(self, predicate) -> int:
+        """drops every entry for which predicate(key, value) is true, returns how many were dropped."""
+        with self.lock:
+            keys = [key for key, (expires, value) in self.entries.items() if predicate(key, value)]
+            for key in keys:
+                del self.entries[key]
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+STUDENT_KEYS = LRUCache(REFERENCE_CACHE_SIZE, REFERENCE_CACHE_TTL)
+SUBJECT_KEYS = LRUCache(REFERENCE_CACHE_SIZE, REFERENCE_CACHE_TTL)
+USER_KEYS = LRUCache(REFERENCE_CACHE_SIZE, REFERENCE_CACHE_TTL)
+
+def cache_scope(session) -> tuple:
+    """
+    identifies the database of session, so caches never mix up the rows of two databases.\n
+    a MySQL session names its database in school_database, set by connect_db() and MySQLBackend:
+    the public database property of mysql.connector costs a query on every call.
+    """
+    if dialect(session) == "sqlite":
+        return ("sqlite", session.path)
+    return ("mysql", session.server_host, session.server_port, getattr(session, "school_database", None) or DB_NAME)
+
+def cached_lookup(cache:LRUCache, session, command:str, key):
+    """
+    returns the cached value of key, or runs command (a SELECT with one %s for key)
+    and caches its first row. the value is the single column, or a tuple for several columns.
+    returns None if command finds nothing.
+    """
+    scoped_key = (cache_scope(session), key)
+    value = cache.get(scoped_key)
+    if value != None:
+        return value
+    rows = fetch_prepared(session, command, (key,))
+    if not rows:
+        return None
+    row = rows[0]
+    value = row[0] if len(row) == 1 else tuple(row)
+    cache.put(scoped_key, value)
+    return value
+
+def cached_lookup_many(cache:LRUCache, session, command:str, keys, chunk_size:int=1000) -> dict:
+    """
+    like cached_lookup() for many keys at once, the keys missing in the cache are
+    fetched with command, a SELECT key, value... WHERE key IN ({}), in chunks of chunk_size.\n
+    returns a dict key -> value of the keys that were found.
+    """
+    scope = cache_scope(session)
+    found = {}
+    missing = []
+    for key in set(keys):
+        value = cache.get((scope, key))
+        if value != None:
+            found[key] = value
+        else:
+            missing.append(key)
+    with open_cursor(session) as cursor:
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            cursor.execute(command.format(", ".join(["%s"] * len(chunk))), chunk)
+            for row in cursor.fetchall():
+                value = row[1] if len(row) == 2 else tuple(row[1:])
+                found[row[0]] = value
+                cache.put((scope, row[0]), value)
+    return found
+
+# the statements of the hot queries are module constants, plan_checks() explains the same text
+SELECT_STUDENT_KEY = "SELECT student_id FROM students WHERE id_number=%s"
+SELECT_SUBJECT_KEY = "SELECT subject_id, total_points FROM subjects WHERE subject_name=%s"
+SELECT_USER_KEY = "SELECT user_id FROM users WHERE username=%s"
+
+def student_key(session, id_number:str):
+    """student_id of the student with id_number, None if there is no such student."""
+    return cached_lookup(STUDENT_KEYS, session, SELECT_STUDENT_KEY, id_number)
+
+def subject_key(session, subject_name:str):
+    """(subject_id, total_points) of the subject, None if there is no such subject."""
+    return cached_lookup(SUBJECT_KEYS, session, SELECT_SUBJECT_KEY, subject_name)
+
+def user_key(session, username:str):
+    """user_id of the user, None if there is no such user."""
+    return cached_lookup(USER_KEYS, session, SELECT_USER_KEY, username)
+
+def invalidate_reference_data(session, id_number:str=None, subject_name:str=None, username:str=None):
+    """drops the cached keys of the given student, subject and user of the database of session."""
+    scope = cache_scope(session)
+    if id_number != None:
+        STUDENT_KEYS.invalidate((scope, id_number))
+    if subject_name != None:
+        SUBJECT_KEYS.invalidate((scope, subject_name))
+    if username != None:
+        USER_KEYS.invalidate((scope, username))
+
+def clear_reference_cache():
+    STUDENT_KEYS.clear()
+    SUBJECT_KEYS.clear()
+    USER_KEYS.clear()
+
+def reference_cache_stats() -> dict:
+    """hit/miss statistics of the reference data caches."""
+    return {"students": STUDENT_KEYS.stats(), "subjects": SUBJECT_KEYS.stats(), "users": USER_KEYS.stats()}
+
+# RESULT CACHE
+# memoized fetch_result() rows per (database, id_number). every write of a grade
+# invalidates only the student it belongs to, the other students stay cached.
+RESULT_CACHE_ROWS = 200000
+RESULT_CACHE_TTL = 300
+RECENT_INVALIDATIONS = 10000
+
+class ResultCache:
+    """
+    size bounded LRU cache of fetch_result() rows.\n
+    one entry per student holds the rows of all subjects ("") and/or of single subjects,
+    a single subject is also answered from the rows of all subjects.
+    max_rows bounds the number of cached rows, whole students are evicted, least recently used first.\n
+    a read that started before an invalidation of its student never stores its rows
+    (see ticket()), so rows read just before a write are not cached after it.
+    """
+    def __init__(self, max_rows:int=RESULT_CACHE_ROWS, ttl:float=RESULT_CACHE_TTL):
+        self.max_rows = max(1, max_rows)
+        self.ttl = ttl
+        self.entries = OrderedDict() # (scope, id_number) -> [expires, rows, bytes, {subject_name: rows}]
+        self.lock = threading.Lock()
+        self.clock = 0
+        self.invalidations = deque(maxlen=RECENT_INVALIDATIONS) # (clock, key), key None = everything
+        self.rows = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def size_of(rows:list) -> int:
+        return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows)
+
+    def get(self, scope, id_number:str, subject_name:str=""):
+        key = (scope, id_number)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry != None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            rows = None
+            if entry != None:
+                subjects = entry[3]
+                if subject_name in subjects:
+                    rows = subjects[subject_name]
+                elif subject_name and "" in subjects:
+                    rows = [row for row in subjects[""] if row[0] == subject_name]
+            if rows == None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(rows)
+
+    def ticket(self) -> int:
+        """call before reading from the database, pass the ticket to put()."""
+        with self.lock:
+            return self.clock
+
+    def put(self, scope, id_number:str, subject_name:str, rows:list, ticket:int):
+        key = (scope, id_number)
+        size = self.size_of(rows)
+        with self.lock:
+            if ticket != self.clock:
+                # something was invalidated while the rows were read, store only if it was another student
+                if not self.invalidations or self.invalidations[0][0] > ticket + 1:
+                    return
+                for clock, invalidated_key in self.invalidations:
+                    if clock > ticket and invalidated_key in (key, None, scope):
+                        return
+            entry = self.entries.get(key)
+            if entry == None:
+                entry = self.entries[key] = [time.monotonic() + self.ttl, 0, 0, {}]
+            old = entry[3].get(subject_name)
+            if old != None:
+                entry[1] -= len(old)
+                entry[2] -= self.size_of(old)
+                self.rows -= len(old)
+                self.bytes -= self.size_of(old)
+            entry[3][subject_name] = tuple(rows)
+            entry[1] += len(rows)
+            entry[2] += size
+            self.rows += len(rows)
+            self.bytes += size
+            self.entries.move_to_end(key)
+            while self.rows > self.max_rows and len(self.entries) > 1:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry != None:
+            self.rows -= entry[1]
+            self.bytes -= entry[2]
 
-def create_table_users(session:'mysql.connector.connection_cext.CMySQLConnection'):
-    command = """CREATE TABLE users (
+    def invalidate(self, scope, id_number:str):
+        """drops the cached rows of one student, call it after every write of the student's results."""
+        key = (scope, id_number)
+        with self.lock:
+            self.clock += 1
+            self.invalidations.append((self.clock, key))
+            if key in self.entries:
+                self._drop(key)
+                self.invalidated += 1
+
+    def clear(self, scope=None):
+        """drops every student of the database scope, or of all databases."""
+        with self.lock:
+            self.clock += 1
+            self.invalidations.append((self.clock, scope))
+            for key in [key for key in self.entries if scope == None or key[0] == scope]:
+                self._drop(key)
+                self.invalidated += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"students": len(self.entries), "rows": self.rows, "max_rows": self.max_rows,
+                    "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "invalidated": self.invalidated}
+
+RESULT_CACHE = ResultCache()
+
+def invalidate_results(session, id_number:str=None):
+    """drops the cached results of one student, or of every student of the database of session."""
+    if id_number == None:
+        RESULT_CACHE.clear(cache_scope(session))
+    else:
+        RESULT_CACHE.invalidate(cache_scope(session), id_number)
+
+def result_cache_stats() -> dict:
+    """hit ratio, size and approximate memory use (bytes) of the result cache."""
+    return RESULT_CACHE.stats()
+
+# CREATE TABELES
+# the CREATE TABLE statements by table name, in the order the tables are created
+TABLE_DEFINITIONS = OrderedDict()
+TABLE_DEFINITIONS["users"] = """CREATE TABLE users (
                 user_id INT PRIMARY KEY AUTO_INCREMENT,
                 username VARCHAR(50) UNIQUE,
                 password VARCHAR(255),
@@ -43,23 +1203,7 @@ def create_table_users(session:'mysql.connector.connection_cext.CMySQLConnection
                 full_name VARCHAR(100),
                 phone_number VARCHAR(15)
                 );"""
-    
-    print("creating user table")
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    try:
-        cursor.execute(command)
-        print("OK")
-    except DatabaseError as de:
-        if de.errno == 1050:
-            print(de)
-            return
-        else:
-            print(de)
-            exit(1)
-
-def create_table_students(session:'mysql.connector.connection_cext.CMySQLConnection'):
-    command = """CREATE TABLE students (
+TABLE_DEFINITIONS["students"] = """CREATE TABLE students (
                 student_id INT PRIMARY KEY AUTO_INCREMENT,
                 id_number VARCHAR(10) UNIQUE,
                 first_name VARCHAR(50), 
@@ -69,22 +1213,7 @@ def create_table_students(session:'mysql.connector.connection_cext.CMySQLConnect
                 phone_number VARCHAR(15), 
                 address VARCHAR(255)
             );"""
-    print("creating students table")
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    try:
-        cursor.execute(command)
-        print("OK")
-    except DatabaseError as de:
-        if de.errno == 1050:
-            print(de)
-            return
-        else:
-            print(de)
-            exit(1)
-
-def create_table_subjects(session:'mysql.connector.connection_cext.CMySQLConnection'):
-    command = """CREATE TABLE subjects (
+TABLE_DEFINITIONS["subjects"] = """CREATE TABLE subjects (
                 subject_id INT PRIMARY KEY AUTO_INCREMENT, 
                 subject_name VARCHAR(50) UNIQUE, 
                 teacher_id INT,
@@ -94,26 +1223,10 @@ def create_table_subjects(session:'mysql.connector.connection_cext.CMySQLConnect
                 
                 FOREIGN KEY (teacher_id) REFERENCES users(user_id)                
             );"""
-
-    print("creating subjects table")
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    try:
-        cursor.execute(command)
-        print("OK")
-    except DatabaseError as de:
-        if de.errno == 1050:
-            print(de)
-            return
-        else:
-            print(de)
-            exit(1)
-
-def create_table_results(session:'mysql.connector.connection_cext.CMySQLConnection'):
-    # the UNIQUE (student_id, subject_id) command will make sure
-    # that the combination of student_id and subject_id is unique
-    # this will make sure a student has only one entry on one subject
-    command = """CREATE TABLE results (
+# the UNIQUE (student_id, subject_id) command will make sure
+# that the combination of student_id and subject_id is unique
+# this will make sure a student has only one entry on one subject
+TABLE_DEFINITIONS["results"] = """CREATE TABLE results (
                 result_id INT PRIMARY KEY AUTO_INCREMENT, 
                 student_id INT, 
                 subject_id INT,
@@ -125,41 +1238,138 @@ def create_table_results(session:'mysql.connector.connection_cext.CMySQLConnecti
                 FOREIGN KEY (student_id) REFERENCES students(student_id),
                 FOREIGN KEY (subject_id) REFERENCES subjects(subject_id)
             );"""
+TABLE_DEFINITIONS["student_stats"] = """CREATE TABLE student_stats (
+                student_id INT PRIMARY KEY,
+                result_count INT NOT NULL DEFAULT 0,
+                percent_count INT NOT NULL DEFAULT 0,
+                percent_sum DOUBLE NOT NULL DEFAULT 0,
+                total_average DOUBLE,
+                
+                FOREIGN KEY (student_id) REFERENCES students(student_id)
+            );"""
 
-    print("creating results table")
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
+def if_not_exists(statement:str) -> str:
+    """a CREATE TABLE statement that does nothing if the table exists."""
+    return statement.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ", 1)
+
+def create_databases(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str):
     try:
-        cursor.execute(command)
-        print("OK")
+        with open_cursor(session) as cursor:
+            print("Creating database {}".format(DB_NAME))
+            cursor.execute("create database {}".format(DB_NAME))
+            print("create_database: OK")
     except DatabaseError as de:
-        if de.errno == 1050:
-            print(de)
+        if de.errno == 1007:
+            print("create_database: database {} already exists.".format(DB_NAME))
             return
         else:
-            print(de)
-            exit(1)
+            print("Faild to create database, error:".format(de))
+        exit(1)
 
-# CREATE TRIGGERS
-def trigger_percent_results(session:'mysql.connector.connection_cext.CMySQLConnection'):
+def create_table_users(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    command = TABLE_DEFINITIONS["users"]
+    
+    print("creating user table")
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        try:
+            cursor.execute(command)
+            print("OK")
+        except DatabaseError as de:
+            if de.errno == 1050:
+                print(de)
+                return
+            else:
+                print(de)
+                exit(1)
+
+def create_table_students(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    command = TABLE_DEFINITIONS["students"]
+    print("creating students table")
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        try:
+            cursor.execute(command)
+            print("OK")
+        except DatabaseError as de:
+            if de.errno == 1050:
+                print(de)
+                return
+            else:
+                print(de)
+                exit(1)
+
+def create_table_subjects(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    command = TABLE_DEFINITIONS["subjects"]
+
+    print("creating subjects table")
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        try:
+            cursor.execute(command)
+            print("OK")
+        except DatabaseError as de:
+            if de.errno == 1050:
+                print(de)
+                return
+            else:
+                print(de)
+                exit(1)
+
+def create_table_results(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    command = TABLE_DEFINITIONS["results"]
+
+    print("creating results table")
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        try:
+            cursor.execute(command)
+            print("OK")
+        except DatabaseError as de:
+            if de.errno == 1050:
+                print(de)
+                return
+            else:
+                print(de)
+                exit(1)
+
+def create_table_student_stats(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
     """
-    creates a trigger that calculates and inserts/updates a percent
-    to the percent column in results table (points/total_points)*100
+    creates the student_stats table, one row per student with results:
+    number of results, number and sum of their percents and the average percent.\n
+    it is kept up to date by the triggers of trigger_student_stats().\n
+    returns True if the table was created, False if it already existed.
     """
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))    
-    # Drop triggers if they already exist
-    cursor.execute("DROP TRIGGER IF EXISTS insert_percent;")
-    cursor.execute("DROP TRIGGER IF EXISTS update_percent;")
-    
+    command = TABLE_DEFINITIONS["student_stats"]
+
+    print("creating student_stats table")
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        try:
+            cursor.execute(command)
+            print("OK")
+            return True
+        except DatabaseError as de:
+            if de.errno == 1050:
+                print(de)
+                return False
+            else:
+                print(de)
+                exit(1)
+
+# CREATE TRIGGERS
+def percent_trigger_statements(dialect_name:str) -> dict:
+    """the CREATE TRIGGER statements of trigger_percent_results() by trigger name."""
     # trigger on inserting result
     on_insert_trigger = """
                 CREATE TRIGGER insert_percent
                 BEFORE INSERT ON results FOR EACH ROW
                 BEGIN
                     DECLARE total INT;
-                    SELECT total_points INTO total FROM subjects WHERE subject_id = NEW.subject_id;
-                    SET NEW.percent = NEW.points / total;
+                    IF @bulk_load IS NULL THEN
+                        SELECT total_points INTO total FROM subjects WHERE subject_id = NEW.subject_id;
+                        SET NEW.percent = NEW.points / total;
+                    END IF;
                 END
                 """
     on_update_trigger = """
@@ -167,130 +1377,588 @@ def trigger_percent_results(session:'mysql.connector.connection_cext.CMySQLConne
                 BEFORE UPDATE ON results FOR EACH ROW
                 BEGIN
                     DECLARE total INT;
-                    SELECT total_points INTO total FROM subjects WHERE subject_id = NEW.subject_id;
-                    SET NEW.percent = NEW.points / total;
+                    IF @bulk_load IS NULL THEN
+                        SELECT total_points INTO total FROM subjects WHERE subject_id = NEW.subject_id;
+                        SET NEW.percent = NEW.points / total;
+                    END IF;
                 END
                 """
-    try:
-        cursor.execute(on_insert_trigger)
-        session.commit()
-        print("insert_percent trigger added")
-        
-        cursor.execute(on_update_trigger)
-        session.commit()
-        print("update_percent trigger added")
-        
-        return
-    except DatabaseError as de:
-        print(de)
-        session.rollback()
+    # SQLite can't change NEW in a BEFORE trigger, the percent is set right after the row is written
+    if dialect_name == "sqlite":
+        on_insert_trigger = """
+                CREATE TRIGGER insert_percent
+                AFTER INSERT ON results FOR EACH ROW
+                WHEN NOT bulk_load()
+                BEGIN
+                    UPDATE results
+                    SET percent = CAST(NEW.points AS REAL) / (SELECT total_points FROM subjects WHERE subject_id = NEW.subject_id)
+                    WHERE result_id = NEW.result_id;
+                END
+                """
+        on_update_trigger = """
+                CREATE TRIGGER update_percent
+                AFTER UPDATE OF points, subject_id ON results FOR EACH ROW
+                WHEN NOT bulk_load()
+                BEGIN
+                    UPDATE results
+                    SET percent = CAST(NEW.points AS REAL) / (SELECT total_points FROM subjects WHERE subject_id = NEW.subject_id)
+                    WHERE result_id = NEW.result_id;
+                END
+                """
+    return {"insert_percent": on_insert_trigger, "update_percent": on_update_trigger}
+
+def trigger_percent_results(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    """
+    creates a trigger that calculates and inserts/updates a percent
+    to the percent column in results table (points/total_points)*100\n
+    the triggers do nothing for a session in bulk load mode, see bulk_load_mode().
+    """
+    triggers = percent_trigger_statements(dialect(session))
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        # Drop triggers if they already exist
+        cursor.execute("DROP TRIGGER IF EXISTS insert_percent;")
+        cursor.execute("DROP TRIGGER IF EXISTS update_percent;")
+        try:
+            cursor.execute(triggers["insert_percent"])
+            session.commit()
+            print("insert_percent trigger added")
+            
+            cursor.execute(triggers["update_percent"])
+            session.commit()
+            print("update_percent trigger added")
+            
+            return
+        except DatabaseError as de:
+            print(de)
+            session.rollback()
+            return
+
+def student_stats_trigger_statements(dialect_name:str) -> dict:
+    """the CREATE TRIGGER statements of trigger_student_stats() by trigger name."""
+    if dialect_name == "sqlite":
+        # NEW.percent of a fresh row is still NULL here, update_percent sets it right after
+        # through an UPDATE which stats_update picks up. stats_update creates the stats row
+        # with result_count 0 if stats_insert did not run yet, so the order does not matter.
+        on_insert_trigger = """
+                CREATE TRIGGER stats_insert
+                AFTER INSERT ON results FOR EACH ROW
+                WHEN NOT bulk_load()
+                BEGIN
+                    INSERT INTO student_stats (student_id, result_count, percent_count, percent_sum)
+                    VALUES (NEW.student_id, 1, NEW.percent IS NOT NULL, IFNULL(NEW.percent, 0))
+                    ON CONFLICT (student_id) DO UPDATE SET result_count = result_count + 1,
+                        percent_count = percent_count + excluded.percent_count,
+                        percent_sum = percent_sum + excluded.percent_sum;
+                    UPDATE student_stats SET total_average = CASE WHEN percent_count > 0 THEN percent_sum / percent_count END
+                    WHERE student_id = NEW.student_id;
+                END
+                """
+        on_update_trigger = """
+                CREATE TRIGGER stats_update
+                AFTER UPDATE OF student_id, percent ON results FOR EACH ROW
+                WHEN NOT bulk_load() AND (OLD.student_id IS NOT NEW.student_id OR OLD.percent IS NOT NEW.percent)
+                BEGIN
+                    UPDATE student_stats SET result_count = result_count - (OLD.student_id IS NOT NEW.student_id),
+                        percent_count = percent_count - (OLD.percent IS NOT NULL),
+                        percent_sum = percent_sum - IFNULL(OLD.percent, 0)
+                    WHERE student_id = OLD.student_id;
+                    INSERT INTO student_stats (student_id, result_count, percent_count, percent_sum)
+                    VALUES (NEW.student_id, OLD.student_id IS NOT NEW.student_id, NEW.percent IS NOT NULL, IFNULL(NEW.percent, 0))
+                    ON CONFLICT (student_id) DO UPDATE SET result_count = result_count + excluded.result_count,
+                        percent_count = percent_count + excluded.percent_count,
+                        percent_sum = percent_sum + excluded.percent_sum;
+                    UPDATE student_stats SET total_average = CASE WHEN percent_count > 0 THEN percent_sum / percent_count END
+                    WHERE student_id IN (OLD.student_id, NEW.student_id);
+                END
+                """
+        on_delete_trigger = """
+                CREATE TRIGGER stats_delete
+                AFTER DELETE ON results FOR EACH ROW
+                WHEN NOT bulk_load()
+                BEGIN
+                    UPDATE student_stats SET result_count = result_count - 1,
+                        percent_count = percent_count - (OLD.percent IS NOT NULL),
+                        percent_sum = percent_sum - IFNULL(OLD.percent, 0)
+                    WHERE student_id = OLD.student_id;
+                    UPDATE student_stats SET total_average = CASE WHEN percent_count > 0 THEN percent_sum / percent_count END
+                    WHERE student_id = OLD.student_id;
+                END
+                """
+    else:
+        on_insert_trigger = """
+                CREATE TRIGGER stats_insert
+                AFTER INSERT ON results FOR EACH ROW
+                BEGIN
+                    IF @bulk_load IS NULL THEN
+                        INSERT INTO student_stats (student_id, result_count, percent_count, percent_sum)
+                        VALUES (NEW.student_id, 1, NEW.percent IS NOT NULL, IFNULL(NEW.percent, 0))
+                        ON DUPLICATE KEY UPDATE result_count = result_count + 1,
+                            percent_count = percent_count + (NEW.percent IS NOT NULL),
+                            percent_sum = percent_sum + IFNULL(NEW.percent, 0);
+                        UPDATE student_stats SET total_average = IF(percent_count > 0, percent_sum / percent_count, NULL)
+                        WHERE student_id = NEW.student_id;
+                    END IF;
+                END
+                """
+        on_update_trigger = """
+                CREATE TRIGGER stats_update
+                AFTER UPDATE ON results FOR EACH ROW
+                BEGIN
+                    DECLARE moved INT DEFAULT 0;
+                    IF NOT (OLD.student_id <=> NEW.student_id) THEN
+                        SET moved = 1;
+                    END IF;
+                    IF @bulk_load IS NULL AND (moved = 1 OR NOT (OLD.percent <=> NEW.percent)) THEN
+                        UPDATE student_stats SET result_count = result_count - moved,
+                            percent_count = percent_count - (OLD.percent IS NOT NULL),
+                            percent_sum = percent_sum - IFNULL(OLD.percent, 0)
+                        WHERE student_id = OLD.student_id;
+                        INSERT INTO student_stats (student_id, result_count, percent_count, percent_sum)
+                        VALUES (NEW.student_id, moved, NEW.percent IS NOT NULL, IFNULL(NEW.percent, 0))
+                        ON DUPLICATE KEY UPDATE result_count = result_count + moved,
+                            percent_count = percent_count + (NEW.percent IS NOT NULL),
+                            percent_sum = percent_sum + IFNULL(NEW.percent, 0);
+                        UPDATE student_stats SET total_average = IF(percent_count > 0, percent_sum / percent_count, NULL)
+                        WHERE student_id IN (OLD.student_id, NEW.student_id);
+                    END IF;
+                END
+                """
+        on_delete_trigger = """
+                CREATE TRIGGER stats_delete
+                AFTER DELETE ON results FOR EACH ROW
+                BEGIN
+                    IF @bulk_load IS NULL THEN
+                        UPDATE student_stats SET result_count = result_count - 1,
+                            percent_count = percent_count - (OLD.percent IS NOT NULL),
+                            percent_sum = percent_sum - IFNULL(OLD.percent, 0)
+                        WHERE student_id = OLD.student_id;
+                        UPDATE student_stats SET total_average = IF(percent_count > 0, percent_sum / percent_count, NULL)
+                        WHERE student_id = OLD.student_id;
+                    END IF;
+                END
+                """
+    return {"stats_insert": on_insert_trigger, "stats_update": on_update_trigger, "stats_delete": on_delete_trigger}
+
+def trigger_student_stats(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    """
+    creates the triggers that keep student_stats up to date when a result
+    is inserted, updated or deleted, so averages never have to re-read results.\n
+    every trigger only adds or subtracts the changed row and then recomputes
+    total_average = percent_sum / percent_count of the touched students.\n
+    like the percent triggers they do nothing for a session in bulk load mode.
+    """
+    triggers = student_stats_trigger_statements(dialect(session))
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        # Drop triggers if they already exist
+        cursor.execute("DROP TRIGGER IF EXISTS stats_insert;")
+        cursor.execute("DROP TRIGGER IF EXISTS stats_update;")
+        cursor.execute("DROP TRIGGER IF EXISTS stats_delete;")
+        try:
+            for trigger in triggers.values():
+                cursor.execute(trigger)
+            session.commit()
+            print("student_stats triggers added")
+        except DatabaseError as de:
+            print(de)
+            session.rollback()
+
+# MATERIALIZED AGGREGATE
+# the results of archived terms are no longer in results, archived_stats holds their sums
+STUDENT_AGGREGATES = """
+                SELECT student_id, SUM(result_count), SUM(percent_count), SUM(percent_sum),
+                       SUM(percent_sum) / NULLIF(SUM(percent_count), 0)
+                FROM (
+                    SELECT student_id, COUNT(*) AS result_count, COUNT(percent) AS percent_count, IFNULL(SUM(percent), 0) AS percent_sum
+                    FROM results
+                    GROUP BY student_id
+                    UNION ALL
+                    SELECT student_id, result_count, percent_count, percent_sum
+                    FROM archived_stats
+                ) AS live_and_archived
+                GROUP BY student_id
+                """
+
+@instrumented
+def rebuild_student_stats(session:'mysql.connector.connection_cext.CMySQLConnection'):
+    """
+    recomputes student_stats from the results table in one transaction,
+    needed once for results written before the triggers existed.\n
+    returns the number of students in student_stats.
+    """
+    with open_cursor(session) as cursor:
+        try:
+            cursor.execute("DELETE FROM student_stats")
+            cursor.execute("""
+                INSERT INTO student_stats (student_id, result_count, percent_count, percent_sum, total_average)
+                """ + STUDENT_AGGREGATES)
+            count = cursor.rowcount
+            session.commit()
+        except DatabaseError as de:
+            print(de)
+            session.rollback()
+            return None
+    print("student_stats rebuilt for {} students".format(count))
+    return count
+
+@instrumented
+def verify_student_stats(session:'mysql.connector.connection_cext.CMySQLConnection', tolerance:float=1e-6):
+    """
+    compares student_stats with a fresh aggregation of results.\n
+    returns a list of (student_id, stored, expected) for every student that differs,
+    stored and expected are (result_count, percent_count, total_average) or None for a missing row.
+    an empty list means student_stats is correct.
+    """
+    with open_cursor(session) as cursor:
+        cursor.execute(STUDENT_AGGREGATES)
+        expected = {row[0]: (row[1], row[2], row[4]) for row in cursor.fetchall()}
+        cursor.execute("SELECT student_id, result_count, percent_count, total_average FROM student_stats WHERE result_count > 0")
+        stored = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+
+    def same(a, b):
+        if a == None or b == None:
+            return a == b
+        return a[0] == b[0] and a[1] == b[1] and (a[2] == b[2] or (a[2] != None and b[2] != None and abs(float(a[2]) - float(b[2])) <= tolerance))
+
+    mismatches = []
+    for student_id in sorted(set(expected) | set(stored)):
+        if not same(stored.get(student_id), expected.get(student_id)):
+            mismatches.append((student_id, stored.get(student_id), expected.get(student_id)))
+    return mismatches
+
+# BULK LOAD MODE
+# the percent and student_stats triggers cost a few statements per written row. in bulk load
+# mode they are switched off for one session (the other sessions keep them): the rows are
+# written with raw points, afterwards the percents are computed with one UPDATE and
+# student_stats is rebuilt with one INSERT ... SELECT.
+PERCENT_TOLERANCE = 1e-5
+
+def set_bulk_load(session:'mysql.connector.connection_cext.CMySQLConnection', enabled:bool):
+    """switches the triggers of session off (enabled=True) or on again."""
+    if dialect(session) == "sqlite":
+        session.bulk_load = enabled
         return
+    with open_cursor(session) as cursor:
+        cursor.execute("SET @bulk_load = 1" if enabled else "SET @bulk_load = NULL")
+
+@instrumented
+def recompute_percents(session:'mysql.connector.connection_cext.CMySQLConnection', subject_id:int=None):
+    """
+    sets percent = points / total_points with one UPDATE for every result whose percent is
+    missing or wrong, only the results of subject_id if given.\n
+    returns the number of results changed.
+    """
+    if dialect(session) == "sqlite":
+        command = """
+                UPDATE results SET percent = CAST(results.points AS REAL) / subjects.total_points
+                FROM subjects
+                WHERE subjects.subject_id = results.subject_id
+                AND (results.percent IS NULL OR ABS(results.percent - CAST(results.points AS REAL) / subjects.total_points) > %s)
+                """
+    else:
+        command = """
+                UPDATE results INNER JOIN subjects
+                ON results.subject_id = subjects.subject_id
+                SET results.percent = results.points / subjects.total_points
+                WHERE (results.percent IS NULL OR ABS(results.percent - results.points / subjects.total_points) > %s)
+                """
+    params = (PERCENT_TOLERANCE,)
+    if subject_id != None:
+        command += "AND results.subject_id = %s"
+        params += (subject_id,)
+    with open_cursor(session) as cursor:
+        try:
+            cursor.execute(command, params)
+            changed = cursor.rowcount
+            session.commit()
+        except DatabaseError as de:
+            print(de)
+            session.rollback()
+            return None
+    if changed:
+        invalidate_results(session)
+    return changed
+
+@instrumented
+def verify_percents(session:'mysql.connector.connection_cext.CMySQLConnection', tolerance:float=PERCENT_TOLERANCE):
+    """
+    returns a list of (result_id, stored percent, expected percent) for every result whose
+    percent differs from points / total_points, an empty list means every percent is correct.
+    """
+    with open_cursor(session) as cursor:
+        cursor.execute("""
+                SELECT results.result_id, results.percent, results.points * 1.0 / subjects.total_points
+                FROM results INNER JOIN subjects
+                ON results.subject_id = subjects.subject_id
+                WHERE results.percent IS NULL OR ABS(results.percent - results.points * 1.0 / subjects.total_points) > %s
+                """, (tolerance,))
+        return [(result_id, stored, float(expected)) for result_id, stored, expected in cursor.fetchall()]
+
+@contextmanager
+def bulk_load_mode(session:'mysql.connector.connection_cext.CMySQLConnection', verify:bool=True):
+    """
+    with bulk_load_mode(session):
+        import_grades(session, "grades.csv")\n
+    writes of session inside the block run without the percent and student_stats triggers.
+    when the block ends, also by an exception, the percents are recomputed, student_stats
+    is rebuilt, the triggers are switched on again and the cached results are dropped.\n
+    if verify is True the percents and student_stats are checked afterwards and the
+    problems found are printed.\n
+    student_stats changes of other sessions during the block can be overwritten by
+    the rebuild, so run big loads when nobody else writes results.
+    """
+    set_bulk_load(session, True)
+    try:
+        yield session
+    finally:
+        try:
+            recompute_percents(session)
+            rebuild_student_stats(session)
+        finally:
+            set_bulk_load(session, False)
+            invalidate_results(session)
+        if verify:
+            wrong_percents = verify_percents(session)
+            wrong_stats = verify_student_stats(session)
+            if wrong_percents or wrong_stats:
+                print("bulk load: {} wrong percents, {} wrong student_stats rows".format(len(wrong_percents), len(wrong_stats)))
+
+@instrumented
+def update_total_points(session:'mysql.connector.connection_cext.CMySQLConnection', subject_name:str, total_points:int):
+    """
+    changes the total_points of a subject and recomputes the percents of its results,
+    which the percent triggers only do for results written afterwards.\n
+    returns the number of results changed, or None if the subject does not exist.
+    """
+    subject = subject_key(session, subject_name)
+    if subject == None:
+        print("subject {} not found.".format(subject_name))
+        return None
+    with open_cursor(session) as cursor:
+        cursor.execute("UPDATE subjects SET total_points = %s WHERE subject_id = %s", (total_points, subject[0]))
+    invalidate_reference_data(session, subject_name=subject_name)
+    changed = recompute_percents(session, subject[0])
+    invalidate_results(session)
+    return changed
+
+# INSERT DATA
+INSERT_USER = """
+                INSERT INTO users (username, password, email, role, full_name, phone_number)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """
+INSERT_STUDENT = """
+                INSERT INTO students (id_number, first_name, last_name, date_of_birth, email, phone_number, address)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """
+INSERT_SUBJECT = """
+                INSERT INTO subjects (subject_name, teacher_id, start_date, end_date, total_points)
+                VALUES (%s, %s, %s, %s, %s)
+                """
+INSERT_RESULT = """
+                INSERT INTO results (student_id, subject_id, points)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE points=VALUES(points)
+                """
+
+# BULK INSERT [ executemany() ]
+BATCH_SIZE = 1000
+
+BatchFailure = namedtuple("BatchFailure", ["batch", "first_row", "row_count", "error"])
+
+class BulkLoader:
+    """
+    collects rows for one parameterized INSERT command and writes them
+    with executemany() in batches of batch_size rows, one commit per batch.\n
+    a batch that fails is rolled back as a whole and recorded in failures
+    as a BatchFailure, the following batches are still written.\n
+    use it in a with statement so the last, not full, batch is flushed:\n
+    with BulkLoader(session, INSERT_STUDENT) as loader:
+        loader.add(row)
+    """
+    def __init__(self, session:'mysql.connector.connection_cext.CMySQLConnection', command:str, batch_size:int=BATCH_SIZE):
+        self.session = session
+        self.command = command
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+        self.batches = 0
+        self.rows_added = 0
+        self.rows_written = 0
+        self.failures = []
+        self.cursor = None
+
+    def add(self, row:tuple):
+        self.pending.append(row)
+        self.rows_added += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows = self.pending
+        self.pending = []
+        first_row = self.rows_added - len(rows)
+        if self.cursor == None:
+            self.cursor = new_cursor(self.session)
+        try:
+            self.cursor.executemany(self.command, rows)
+            self.session.commit()
+            self.rows_written += len(rows)
+        except Error as e:
+            self.session.rollback()
+            self.failures.append(BatchFailure(self.batches, first_row, len(rows), e))
+            print("batch {} (rows {}-{}) failed: {}".format(self.batches, first_row, first_row + len(rows) - 1, e))
+        self.batches += 1
+
+    def close(self):
+        self.flush()
+        if self.cursor != None:
+            close_cursor(self.cursor)
+            self.cursor = None
+
+    def __enter__(self):
+        return self
 
-# INSERT DATA
-def insert_user(session:'mysql.connector.connection_cext.CMySQLConnection', username:str, password:str, email:str, role:str, full_name:str, phone_number:str):
-    command = """
-                INSERT INTO users (username, password, email, role, full_name, phone_number)
-                VALUES ('{}', '{}', '{}', '{}', '{}', '{}')
-                """.format(username, password, email, role, full_name, phone_number)
-    
-    cursor = session.cursor()
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type == None:
+            self.close()
+        elif self.cursor != None:
+            close_cursor(self.cursor)
+            self.cursor = None
+
+@instrumented
+def bulk_insert(session:'mysql.connector.connection_cext.CMySQLConnection', command:str, rows, batch_size:int=BATCH_SIZE):
+    """
+    writes every row of rows (any iterable of tuples, also generators)
+    with the parameterized command in batches of batch_size.\n
+    returns the BulkLoader so the caller can check rows_written and failures.
+    """
     try:
-        cursor.execute("use {}".format(DB_NAME))
-        cursor.execute(command)
-        session.commit()
-    except DatabaseError as de:
-        if de.errno == 1062:
-            print("user name {} already exists, please choose a different user name.".format(username))
-            return
-        else:
-            print(de)
-            return
+        with BulkLoader(session, command, batch_size) as loader:
+            for row in rows:
+                loader.add(row)
+    finally:
+        # the rows have student_id, the result cache is keyed by id_number, so all of it goes
+        if command == INSERT_RESULT:
+            invalidate_results(session)
+    return loader
+
+@instrumented
+def insert_user(session:'mysql.connector.connection_cext.CMySQLConnection', username:str, password:str, email:str, role:str, full_name:str, phone_number:str, loader:BulkLoader=None):
+    """
+    inserts one user, password is stored as hash_password().\n
+    if a BulkLoader for INSERT_USER is given the row is only queued in it
+    and written together with the rest of its batch.
+    """
+    row = (username, hash_password(password), email, role, full_name, phone_number)
+    invalidate_reference_data(session, username=username)
+    if loader != None:
+        loader.add(row)
+        return
+
+    with open_cursor(session) as cursor:
+        try:
+            cursor.execute(INSERT_USER, row)
+            session.commit()
+        except DatabaseError as de:
+            if de.errno == 1062:
+                print("user name {} already exists, please choose a different user name.".format(username))
+                return
+            else:
+                print(de)
+                return
         
-def insert_student(session:'mysql.connector.connection_cext.CMySQLConnection',id_number:str, first_name:str, last_name:str, date_of_birth:str, email:str, phone_number:str, address:str):
-    command = """
-                INSERT INTO students (id_number, first_name, last_name, date_of_birth, email, phone_number, address)
-                VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}')
-                """.format(id_number, first_name, last_name, date_of_birth, email, phone_number, address)
-    
-    cursor = session.cursor()
-    try:
-        cursor.execute("use {}".format(DB_NAME))
-        cursor.execute(command)
-        session.commit()
-    except DatabaseError as de:
-        if de.errno == 1062:
-            print("student already exists.")
-            return
-        else:
-            print(de)
-            return
+@instrumented
+def insert_student(session:'mysql.connector.connection_cext.CMySQLConnection',id_number:str, first_name:str, last_name:str, date_of_birth:str, email:str, phone_number:str, address:str, loader:BulkLoader=None):
+    """
+    inserts one student.\n
+    if a BulkLoader for INSERT_STUDENT is given the row is only queued in it.
+    """
+    row = (id_number, first_name, last_name, date_of_birth, email, phone_number, address)
+    invalidate_reference_data(session, id_number=id_number)
+    if loader != None:
+        loader.add(row)
+        return
 
-def insert_subject(session:'mysql.connector.connection_cext.CMySQLConnection', subject_name:str, teacher_id:str, start_date:str, end_date:str, total_points:str):
-    command = """
-                INSERT INTO subjects (subject_name, teacher_id, start_date, end_date, total_points)
-                VALUES ('{}', '{}', '{}', '{}', '{}')
-                """.format(subject_name, teacher_id, start_date, end_date, total_points)
-    
-    cursor = session.cursor()
-    try:
-        cursor.execute("use {}".format(DB_NAME))
-        cursor.execute(command)
-        session.commit()
-    except DatabaseError as de:
-        if de.errno == 1062:
-            print("subject already exists.")
-            return
-        else:
-            print(de)
-            return
+    with open_cursor(session) as cursor:
+        try:
+            cursor.execute(INSERT_STUDENT, row)
+            session.commit()
+        except DatabaseError as de:
+            if de.errno == 1062:
+                print("student already exists.")
+                return
+            else:
+                print(de)
+                return
+
+@instrumented
+def insert_subject(session:'mysql.connector.connection_cext.CMySQLConnection', subject_name:str, teacher_id:str, start_date:str, end_date:str, total_points:str, loader:BulkLoader=None):
+    """
+    inserts one subject.\n
+    if a BulkLoader for INSERT_SUBJECT is given the row is only queued in it.
+    """
+    row = (subject_name, teacher_id, start_date, end_date, total_points)
+    invalidate_reference_data(session, subject_name=subject_name)
+    if loader != None:
+        loader.add(row)
+        return
+
+    with open_cursor(session) as cursor:
+        try:
+            cursor.execute(INSERT_SUBJECT, row)
+            session.commit()
+        except DatabaseError as de:
+            if de.errno == 1062:
+                print("subject already exists.")
+                return
+            else:
+                print(de)
+                return
 
-def populate_results_table(session: 'mysql.connector.connection_cext.CMySQLConnection', num_entries: int):
+@instrumented
+def populate_results_table(session: 'mysql.connector.connection_cext.CMySQLConnection', num_entries: int, batch_size: int = BATCH_SIZE):
     """
     Populates the results table with random data.
     
     Parameters:
     - session: MySQL connection object
     - num_entries: Number of random entries to insert
+    - batch_size: Number of rows written and committed together
     """
-    cursor = session.cursor()
-    cursor.execute("USE {}".format(DB_NAME))
-    
-    # Fetch all student_ids
-    cursor.execute("SELECT student_id FROM students;")
-    student_ids = [row[0] for row in cursor.fetchall()]
-    
-    # Fetch all subject_ids
-    cursor.execute("SELECT subject_id FROM subjects;")
-    subject_ids = [row[0] for row in cursor.fetchall()]
-    
-    # Generate random data and insert into results table
-    for _ in range(num_entries):
-        student_id = random.choice(student_ids)
-        subject_id = random.choice(subject_ids)
-        if subject_id == '9' or '10':
-            points = random.randint(0, 50)
-        else:
-            points = random.randint(0, 100)  # Assuming points are between 0 and 100
+    with open_cursor(session) as cursor:
+        # Fetch all student_ids
+        cursor.execute("SELECT student_id FROM students;")
+        student_ids = [row[0] for row in cursor.fetchall()]
         
-        # Insert data into results table
-        command = """
-            INSERT INTO results (student_id, subject_id, points)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE points=VALUES(points);
-        """
-        try:
-            cursor.execute(command, (student_id, subject_id, points))
-            session.commit()
-        except Error as e:
-            print(f"Error inserting data: {e}")
-            session.rollback()
+        # Fetch all subject_ids
+        cursor.execute("SELECT subject_id FROM subjects;")
+        subject_ids = [row[0] for row in cursor.fetchall()]
     
-    print(f"Inserted {num_entries} entries into the results table.")
-    cursor.close()
+    # Generate random data, the rows are produced lazily and written batch by batch
+    def random_results():
+        for _ in range(num_entries):
+            student_id = random.choice(student_ids)
+            subject_id = random.choice(subject_ids)
+            if subject_id == '9' or '10':
+                points = random.randint(0, 50)
+            else:
+                points = random.randint(0, 100)  # Assuming points are between 0 and 100
+            yield (student_id, subject_id, points)
+
+    loader = bulk_insert(session, INSERT_RESULT, random_results(), batch_size)
+    invalidate_results(session)
+    print(f"Inserted {loader.rows_written} of {num_entries} entries into the results table in {loader.batches} batches.")
+    return loader
 
-def populate_database(session:'mysql.connector.connection_cext.CMySQLConnection'):
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
+@instrumented
+def populate_database(session:'mysql.connector.connection_cext.CMySQLConnection', batch_size:int=BATCH_SIZE):
+    """
+    inserts the example teachers, parents, students and subjects.\n
+    the rows are queued in BulkLoaders and written in batches of batch_size
+    instead of one commit per row.
+    """
     #--INSERT TEACHERS -------------------------------------------------------------------------------------------#
     teachers = [
         ('john_doe', 'password', 'john.doe@example.com', 'teacher', 'John Doe', '1234567890'),
@@ -299,9 +1967,10 @@ def populate_database(session:'mysql.connector.connection_cext.CMySQLConnection'
         ('linda_white', 'lindapass', 'linda.white@school.com', 'teacher', 'Linda White', '0733445566'),
         ('michael_brown', 'michael123', 'michael.brown@school.com', 'teacher', 'Michael Brown', '0744556677')
     ]
+    users = BulkLoader(session, INSERT_USER, batch_size)
     print("inserting teachers")
     for teacher in teachers:
-        insert_user(session, teacher[0], teacher[1], teacher[2], teacher[3], teacher[4], teacher[5])
+        insert_user(session, teacher[0], teacher[1], teacher[2], teacher[3], teacher[4], teacher[5], loader=users)
     #--------------------------------------------------------------------------------------------------------#
 
     #--INSERT PARENTS -------------------------------------------------------------------------------------------#
@@ -319,7 +1988,8 @@ def populate_database(session:'mysql.connector.connection_cext.CMySQLConnection'
     ]
     print("inserting parents")
     for parent in parents:
-        insert_user(session, parent[0], parent[1], parent[2], parent[3], parent[4], parent[5])
+        insert_user(session, parent[0], parent[1], parent[2], parent[3], parent[4], parent[5], loader=users)
+    users.close()
     #--------------------------------------------------------------------------------------------------------#
 
     #--INSERT STUDENTS -------------------------------------------------------------------------------------------#
@@ -336,8 +2006,9 @@ def populate_database(session:'mysql.connector.connection_cext.CMySQLConnection'
         ('ST01234567', 'Elin', 'Eriksson', '2005-09-09', 'elin.eriksson@student.school.com', '0700123456', 'Odengatan 10, 113 22 Stockholm')
     ]
     print("inserting students")
-    for student in students:
-        insert_student(session, student[0], student[1], student[2], student[3], student[4], student[5], student[6])
+    with BulkLoader(session, INSERT_STUDENT, batch_size) as loader:
+        for student in students:
+            insert_student(session, student[0], student[1], student[2], student[3], student[4], student[5], student[6], loader=loader)
     #--------------------------------------------------------------------------------------------------------#
 
     #--INSERT SUBJECTS -------------------------------------------------------------------------------------------#
@@ -353,284 +2024,2505 @@ def populate_database(session:'mysql.connector.connection_cext.CMySQLConnection'
         ('Art', 'linda_white', '2024-09-01', '2024-12-15', 50),
         ('Music', 'michael_brown', '2024-09-01', '2024-12-15', 50)
     ]
-    cursor = session.cursor()
+    # select teachers of the subjects from users table by their username, all in one query
+    teacher_ids = cached_lookup_many(USER_KEYS, session, "SELECT username, user_id FROM users WHERE username IN ({})",
+                                     [subject[1] for subject in subjects])
     print("inserting subjects")
-    for subject in subjects:
-        # select target teacher of the subject from users table by identifying him using username
-        cursor.execute("SELECT user_id FROM users WHERE username='{}';".format(subject[1]))
-        teacher = cursor.fetchone() # save result of the quiry (its a tuple), returns none if user not found
-        if teacher:
-            insert_subject(session, subject[0], teacher[0], subject[2], subject[3], subject[4])
-        else:
-            print("teacher {} not found".format(subject[1]))
+    with BulkLoader(session, INSERT_SUBJECT, batch_size) as loader:
+        for subject in subjects:
+            teacher = teacher_ids.get(subject[1]) # None if user not found
+            if teacher:
+                insert_subject(session, subject[0], teacher, subject[2], subject[3], subject[4], loader=loader)
+            else:
+                print("teacher {} not found".format(subject[1]))
     #--------------------------------------------------------------------------------------------------------#
 
+# SYNTHETIC DATA
+# deterministic: the same seed and sizes always produce the same rows
+FIRST_NAMES = ["Erik", "Anna", "Oskar", "Sara", "Lukas", "Emma", "Viktor", "Matilda", "William", "Elin",
+               "Hugo", "Maja", "Liam", "Alva", "Noah", "Ella", "Adam", "Wilma", "Elias", "Saga"]
+LAST_NAMES = ["Johansson", "Nilsson", "Lindberg", "Larsson", "Andersson", "Karlsson", "Svensson",
+              "Gustafsson", "Pettersson", "Eriksson", "Olsson", "Persson", "Jonsson", "Berg", "Holm"]
+STREETS = ["Storgatan", "Drottninggatan", "Sveavägen", "Kungsgatan", "Vasagatan", "Hornsgatan", "Götgatan", "Odengatan"]
+
+# hashing 100000 passwords with PASSWORD_ITERATIONS would take hours, the generated users get
+# cheap hashes that login() raises to PASSWORD_ITERATIONS on their first login
+SYNTHETIC_PASSWORD_ITERATIONS = 100
+
+def generate_users(seed:int, teachers:int, parents:int):
+    """
+    yields INSERT_USER rows, teachers are named teacher_00000, teacher_00001, ... and parents parent_000000, ...\n
+    the password of user number i is password<i>, hashed with SYNTHETIC_PASSWORD_ITERATIONS.
+    """
+    rng = random.Random(seed)
+    for i in range(teachers):
+        yield ("teacher_{:05d}".format(i), hash_password("password{}".format(i), SYNTHETIC_PASSWORD_ITERATIONS), "teacher{}@school.com".format(i),
+               "teacher", "{} {}".format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)), "07{:08d}".format(i))
+    for i in range(parents):
+        yield ("parent_{:06d}".format(i), hash_password("password{}".format(i), SYNTHETIC_PASSWORD_ITERATIONS), "parent{}@example.com".format(i),
+               "parent", "{} {}".format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)), "08{:08d}".format(i))
+
+def generate_students(seed:int, students:int):
+    """yields INSERT_STUDENT rows with id numbers ST00000000, ST00000001, ..."""
+    rng = random.Random(seed + 1)
+    for i in range(students):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        yield ("ST{:08d}".format(i), first_name, last_name,
+               "{}-{:02d}-{:02d}".format(rng.randint(2004, 2008), rng.randint(1, 12), rng.randint(1, 28)),
+               "{}.{}{}@student.school.com".format(first_name, last_name, i).lower(), "07{:08d}".format(i),
+               "{} {}, 111 {:02d} Stockholm".format(rng.choice(STREETS), rng.randint(1, 99), rng.randint(10, 99)))
+
+def generate_subjects(seed:int, subjects:int, teacher_ids:list, terms:int=1):
+    """
+    yields INSERT_SUBJECT rows named Subject 0000, Subject 0001, ...\n
+    teacher_ids are the user_id of the teachers, the subjects are spread over
+    terms autumn/spring terms starting with autumn 2024.
+    """
+    rng = random.Random(seed + 2)
+    for i in range(subjects):
+        term = i % terms
+        year = 2024 + (term + 1) // 2
+        start_date, end_date = ("{}-09-01".format(year), "{}-12-15".format(year)) if term % 2 == 0 else ("{}-01-15".format(year), "{}-06-10".format(year))
+        yield ("Subject {:04d}".format(i), teacher_ids[i % len(teacher_ids)], start_date, end_date, rng.choice((50, 100, 100, 100)))
+
+def generate_results(seed:int, student_ids:list, subjects:list, results:int):
+    """
+    yields INSERT_RESULT rows (student_id, subject_id, points).\n
+    subjects is a list of (subject_id, total_points). every student gets
+    results // len(student_ids) different subjects (one more for the first students
+    when it does not divide evenly), so no row hits the UNIQUE (student_id, subject_id).
+    """
+    rng = random.Random(seed + 3)
+    per_student, extra = divmod(min(results, len(student_ids) * len(subjects)), len(student_ids))
+    for i, student_id in enumerate(student_ids):
+        count = per_student + (1 if i < extra else 0)
+        for subject_id, total_points in rng.sample(subjects, count):
+            # bell shaped points around 70% of the maximum
+            points = min(total_points, max(0, round(rng.gauss(0.7, 0.15) * total_points)))
+            yield (student_id, subject_id, points)
+
+@instrumented
+def populate_synthetic_data(session:'mysql.connector.connection_cext.CMySQLConnection', students:int=1000, subjects:int=50, results:int=10000, teachers:int=None, parents:int=None, terms:int=1, seed:int=0, batch_size:int=BATCH_SIZE):
+    """
+    fills an empty database with generated data of the given size through the bulk loader.\n
+    by default there is one teacher per 5 subjects and one parent per student,
+    the subjects are spread over terms terms.\n
+    returns a dict with the number of rows written to every table.
+    """
+    teachers = teachers if teachers != None else max(1, subjects // 5)
+    parents = parents if parents != None else students
+    written = {}
+    written["users"] = bulk_insert(session, INSERT_USER, generate_users(seed, teachers, parents), batch_size).rows_written
+    written["students"] = bulk_insert(session, INSERT_STUDENT, generate_students(seed, students), batch_size).rows_written
+
+    with open_cursor(session) as cursor:
+        cursor.execute("SELECT user_id FROM users WHERE role='teacher' ORDER BY user_id")
+        teacher_ids = [row[0] for row in cursor.fetchall()]
+    written["subjects"] = bulk_insert(session, INSERT_SUBJECT, generate_subjects(seed, subjects, teacher_ids, terms), batch_size).rows_written
+
+    with open_cursor(session) as cursor:
+        cursor.execute("SELECT student_id FROM students ORDER BY student_id")
+        student_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT subject_id, total_points FROM subjects ORDER BY subject_id")
+        subject_rows = [tuple(row) for row in cursor.fetchall()]
+    written["results"] = bulk_insert(session, INSERT_RESULT, generate_results(seed, student_ids, subject_rows, results), batch_size).rows_written
+    invalidate_results(session)
+    return written
+
 # SELECT, INSERT, UPDATE, INNER JOIN
+SELECT_RESULTS = """
+                SELECT subjects.subject_name, results.points, subjects.total_points, results.percent
+                FROM results INNER JOIN subjects
+                ON results.subject_id = subjects.subject_id
+                WHERE results.student_id = %s
+                """
+SELECT_SUBJECT_RESULTS = SELECT_RESULTS + "AND results.subject_id = %s"
+
+@instrumented
 def fetch_result(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str, subject_name=""):
     """
     used to fetch resutls of a student on a given subject.\n
     if subject name is not given it will fetch results of all subjects to that student.\n
     returns a list of the results as tupels if any,\n
-    else it will return empty list if result is empty
+    else it will return empty list if result is empty\n
+    only the terms that are not archived, see fetch_archived_result()
     """
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))    
-    
-    command = """
-                SELECT subjects.subject_name, results.points, subjects.total_points, results.percent
-                FROM results INNER JOIN subjects
-                ON results.subject_id = subjects.subject_id
-                WHERE results.student_id = (SELECT student_id FROM students WHERE id_number='{}')
-                """.format(id_number)
+    # parents mostly read results that did not change since the last read
+    scope = cache_scope(session)
+    cached = RESULT_CACHE.get(scope, id_number, subject_name)
+    if cached != None:
+        return cached
+    ticket = RESULT_CACHE.ticket()
+
+    # the keys come from the reference data cache, the query only filters by them
+    student_id = student_key(session, id_number)
+    if student_id == None:
+        return []
+    command = SELECT_RESULTS
+    params = (student_id,)
     # specify subject if given as a parameter
     if subject_name:
-        specify_subject = "AND subjects.subject_name='{}'".format(subject_name)
-        command += specify_subject
-    cursor.execute(command)
-    result = cursor.fetchall()
+        subject = subject_key(session, subject_name)
+        if subject == None:
+            return []
+        command = SELECT_SUBJECT_RESULTS
+        params += (subject[0],)
+    result = fetch_prepared(session, command, params)
+    RESULT_CACHE.put(scope, id_number, subject_name, result, ticket)
     return result
 
-# SELECT in SELECT
+# UPSERT
+def parse_points(points, total_points:int=None):
+    """
+    points (a string like "45" or a number) as an int, None if it is not a whole number,
+    negative or more than total_points (if given).
+    """
+    if isinstance(points, float) and not points.is_integer():
+        return None
+    try:
+        points = int(points)
+    except (TypeError, ValueError):
+        return None
+    if points < 0 or (total_points != None and points > total_points):
+        return None
+    return points
+
+@instrumented
 def insert_results(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str, subject_name:str, points:str):
     """
     function used by teachers to
     inserts given students points in a given subject
-    into results table.\n
+    into results table, or updates the points if the student already has a result in the subject.\n
+    the keys come from the reference data cache and the UNIQUE (student_id, subject_id)
+    turns the INSERT into an UPDATE for existing results, one statement when the keys are cached.\n
+    returns True if the result was written, False if the student or subject
+    does not exist, points is not a whole number from 0 to the total points of the subject
+    or an error occures.\n
     note: id_number is students id number
     """
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    # check if result already exist and only needs update
-    result = fetch_result(session, id_number, subject_name)
-    # UPDATE if result already exists in database
-    if result:
-        command = """
-                    UPDATE results
-                    SET points='{}'
-                    WHERE student_id=(SELECT student_id FROM students WHERE id_number='{}')
-                    AND subject_id=(SELECT subject_id FROM subjects WHERE subject_name='{}')
-                    """.format(points, id_number, subject_name)
-    # INSERT if result is being registered first time       
-    else:
-        command = """
-                    INSERT INTO results (student_id, subject_id, points)
-                    VALUES (
-                        (SELECT student_id FROM students WHERE id_number='{}'),
-                        (SELECT subject_id FROM subjects WHERE subject_name='{}'),
-                        '{}')
-                    """.format(id_number, subject_name, points)
+    student_id = student_key(session, id_number)
+    subject = subject_key(session, subject_name)
+    if student_id == None or subject == None:
+        print("student {} or subject {} not found.".format(id_number, subject_name))
+        return False
+    valid_points = parse_points(points, subject[1])
+    if valid_points == None:
+        print("invalid points {!r} for {}, expected 0 to {}.".format(points, subject_name, subject[1]))
+        return False
     try:
-        cursor.execute(command)
+        execute_prepared(session, INSERT_RESULT, (student_id, subject[0], valid_points))
         session.commit()
-        return
     except DatabaseError as de:
         print(de)
+        session.rollback()
+        return False
+    finally:
+        invalidate_results(session, id_number)
+    return True
+
+# BULK GRADE IMPORT
+GradeOutcome = namedtuple("GradeOutcome", ["row", "id_number", "subject_name", "points", "status", "error"])
+
+def read_grade_sheet(file):
+    """
+    yields (id_number, subject_name, points) rows of a class sheet in CSV format.\n
+    file is a file name or an open text file, a header line
+    id_number,subject_name,points is skipped.
+    """
+    if isinstance(file, str):
+        with open(file, newline="", encoding="utf-8") as sheet:
+            yield from read_grade_sheet(sheet)
         return
-    
-# FUNCTION and AGGREGATION [ AVG(), SUM() COUNT()]
-def create_function_total_avg(session:'mysql.connector.connection_cext.CMySQLConnection'):
+    for i, row in enumerate(csv.reader(file)):
+        if not row or (i == 0 and row[0].strip().lower() == "id_number"):
+            continue
+        row = [value.strip() for value in row[:3]]
+        yield tuple(row + [""] * (3 - len(row)))
+
+@instrumented
+def import_grades(session:'mysql.connector.connection_cext.CMySQLConnection', grades, batch_size:int=BATCH_SIZE):
     """
-    creates a function in the database\n
-    the function calculate the total average of a student
-    from the percent column in the results table
-    and returns a tupel (Decimal('total_ave'),).\n
-    cast the returned value to float dvs (float(returned value))
+    registers a whole class sheet of grades at once.\n
+    grades is a list (or any iterable) of (id_number, subject_name, points) tuples,
+    or a CSV file name / open file read with read_grade_sheet().\n
+    all student and subject keys not in the reference data cache are resolved with a few IN queries,
+    the results are then upserted with the bulk loader in batches of batch_size.\n
+    returns one GradeOutcome per row, status is "written", "unknown student",
+    "unknown subject", "invalid points" or "failed" (the batch of the row failed, see error).
+    """
+    if isinstance(grades, str) or hasattr(grades, "read"):
+        grades = read_grade_sheet(grades)
+    grades = list(grades)
+
+    student_ids = cached_lookup_many(STUDENT_KEYS, session, "SELECT id_number, student_id FROM students WHERE id_number IN ({})",
+                                     [grade[0] for grade in grades])
+    subjects = cached_lookup_many(SUBJECT_KEYS, session, "SELECT subject_name, subject_id, total_points FROM subjects WHERE subject_name IN ({})",
+                                  [grade[1] for grade in grades])
+    subject_ids = {name: subject[0] for name, subject in subjects.items()}
+    total_points = {name: subject[1] for name, subject in subjects.items()}
+
+    outcomes = []
+    queued = [] # index in outcomes of every row given to the loader, in loader order
+    with BulkLoader(session, INSERT_RESULT, batch_size) as loader:
+        for i, (id_number, subject_name, points) in enumerate(grades):
+            status = "written"
+            if id_number not in student_ids:
+                status = "unknown student"
+            elif subject_name not in subject_ids:
+                status = "unknown subject"
+            else:
+                valid_points = parse_points(points, total_points[subject_name])
+                if valid_points == None:
+                    status = "invalid points"
+                else:
+                    points = valid_points
+            outcomes.append(GradeOutcome(i, id_number, subject_name, points, status, None))
+            if status == "written":
+                queued.append(i)
+                loader.add((student_ids[id_number], subject_ids[subject_name], points))
+
+    for failure in loader.failures:
+        for i in queued[failure.first_row:failure.first_row + failure.row_count]:
+            outcomes[i] = outcomes[i]._replace(status="failed", error=failure.error)
+    for id_number in {outcomes[i].id_number for i in queued}:
+        invalidate_results(session, id_number)
+    return outcomes
+
+# GROUP COMMIT
+# one commit per grade makes the commits (fsync) the limit when many teachers enter grades
+# at once. GradeWriteQueue collects the grades of all callers and writes up to
+# GROUP_COMMIT_ROWS of them with one multi-row upsert and one commit.
+GROUP_COMMIT_ROWS = 500
+GROUP_COMMIT_MS = 20
+GROUP_COMMIT_IDLE_MS = 1
+WRITE_QUEUE_SIZE = 10000
+
+class GradeWriteQueue:
+    """
+    write-behind queue in front of insert_results().\n
+    with GradeWriteQueue(pool) as write_queue:
+        future = write_queue.submit("AB12345678", "Math", "45")
+        future.result()     # True once the grade is committed\n
+    a batch is written when it has max_rows grades, when its oldest grade waited max_delay_ms,
+    or when no new grade came for idle_ms (nobody else is submitting, waiting longer only adds latency).
+    submit() blocks while max_pending grades are waiting (backpressure) and raises queue.Full
+    if there is still no room after timeout seconds. close() writes every grade submitted
+    before it and stops the writer thread.
+    """
+    def __init__(self, pool:ConnectionPool, max_rows:int=GROUP_COMMIT_ROWS, max_delay_ms:float=GROUP_COMMIT_MS,
+                 max_pending:int=WRITE_QUEUE_SIZE, idle_ms:float=GROUP_COMMIT_IDLE_MS):
+        self.pool = pool
+        self.max_rows = max(1, max_rows)
+        self.max_delay = max_delay_ms / 1000
+        self.idle = idle_ms / 1000
+        self.pending = queue.Queue(maxsize=max(1, max_pending))
+        self.lock = threading.Lock()
+        self.closed = False
+        self.batches = 0
+        self.rows_written = 0
+        self.largest_batch = 0
+        self.writer = threading.Thread(target=self._run, name="grade-writer", daemon=True)
+        self.writer.start()
+
+    def submit(self, id_number:str, subject_name:str, points, timeout:float=None) -> Future:
+        """
+        queues one grade, returns a Future whose result is True when the grade is committed
+        and False if the student or subject does not exist or points is not a valid number.
+        """
+        future = Future()
+        # one deadline for the lock and the queue, timeout is the whole wait of submit()
+        deadline = time.monotonic() + timeout if timeout != None else None
+        if not self.lock.acquire(timeout=-1 if timeout == None else timeout):
+            raise queue.Full
+        try:
+            if self.closed:
+                raise RuntimeError("write queue is closed")
+            self.pending.put((id_number, subject_name, points, future),
+                             timeout=None if deadline == None else max(0, deadline - time.monotonic()))
+        finally:
+            self.lock.release()
+        return future
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.pending.put(None)
+        self.writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "rows_written": self.rows_written, "largest_batch": self.largest_batch,
+                "pending": self.pending.qsize()}
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.pending.get()
+            if item == None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_rows:
+                try:
+                    item = self.pending.get(timeout=max(0, min(self.idle, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+                if item == None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch:list):
+        try:
+            with self.pool.connection() as session:
+                self._write_batch(session, batch)
+        except Exception as e:
+            for grade in batch:
+                if not grade[3].done():
+                    grade[3].set_exception(e)
+
+    def _write_batch(self, session, batch:list):
+        student_ids = cached_lookup_many(STUDENT_KEYS, session, "SELECT id_number, student_id FROM students WHERE id_number IN ({})",
+                                         [grade[0] for grade in batch])
+        subjects = cached_lookup_many(SUBJECT_KEYS, session, "SELECT subject_name, subject_id, total_points FROM subjects WHERE subject_name IN ({})",
+                                      [grade[1] for grade in batch])
+        rows = []
+        written = []
+        for id_number, subject_name, points, future in batch:
+            points = parse_points(points, subjects[subject_name][1]) if subject_name in subjects else None
+            if id_number not in student_ids or points == None:
+                future.set_result(False)
+                continue
+            # a later grade of the same student and subject in the batch wins, like separate upserts
+            rows.append((student_ids[id_number], subjects[subject_name][0], points))
+            written.append((id_number, future))
+        if not rows:
+            return
+
+        # mysql.connector sends executemany() of an INSERT as one multi-row INSERT
+        with open_cursor(session) as cursor:
+            try:
+                cursor.executemany(INSERT_RESULT, rows)
+                session.commit()
+            except DatabaseError:
+                session.rollback()
+                raise
+            finally:
+                for id_number in {id_number for id_number, future in written}:
+                    invalidate_results(session, id_number)
+        self.batches += 1
+        self.rows_written += len(rows)
+        self.largest_batch = max(self.largest_batch, len(rows))
+        for id_number, future in written:
+            future.set_result(True)
+
+# EXPORT
+# the rows of the whole school do not fit in memory: they are read through an unbuffered
+# cursor, EXPORT_FETCH_SIZE rows at a time, and written out as they arrive.
+EXPORT_FETCH_SIZE = 1000
+EXPORT_COLUMNS = ("id_number", "first_name", "last_name", "subject_name", "start_date", "end_date", "points", "total_points", "percent")
+EXPORT_FORMATS = ("csv", "jsonl")
+
+def iter_results(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str="", subject_name:str="",
+                 start_date:str=None, end_date:str=None, fetch_size:int=EXPORT_FETCH_SIZE):
+    """
+    generator over every result row joined with its student and subject,
+    one tuple of EXPORT_COLUMNS per row, ordered by student and subject.\n
+    filters (all optional): one student, one subject, and subjects overlapping
+    the date range start_date..end_date ('YYYY-MM-DD').\n
+    the session can run no other query until the generator is finished or closed.
+    """
+    command = """
+                SELECT students.id_number, students.first_name, students.last_name,
+                       subjects.subject_name, subjects.start_date, subjects.end_date,
+                       results.points, subjects.total_points, results.percent
+                FROM results
+                INNER JOIN students ON results.student_id = students.student_id
+                INNER JOIN subjects ON results.subject_id = subjects.subject_id
+                """
+    conditions = []
+    params = ()
+    if id_number:
+        student_id = student_key(session, id_number)
+        if student_id == None:
+            return
+        conditions.append("results.student_id = %s")
+        params += (student_id,)
+    if subject_name:
+        subject = subject_key(session, subject_name)
+        if subject == None:
+            return
+        conditions.append("results.subject_id = %s")
+        params += (subject[0],)
+    if start_date:
+        conditions.append("subjects.end_date >= %s")
+        params += (start_date,)
+    if end_date:
+        conditions.append("subjects.start_date <= %s")
+        params += (end_date,)
+    if conditions:
+        command += "WHERE " + " AND ".join(conditions)
+    command += " ORDER BY results.student_id, results.subject_id"
+
+    with open_cursor(session, buffered=False) as cursor:
+        cursor.execute(command, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+
+def export_results(session:'mysql.connector.connection_cext.CMySQLConnection', file, format:str="csv", **filters):
+    """
+    writes the rows of iter_results() to file as CSV (with a header line) or JSON Lines.\n
+    file is a file name or an open text file, filters are passed on to iter_results().\n
+    returns the number of rows written.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError("format must be one of {}".format(", ".join(EXPORT_FORMATS)))
+    if isinstance(file, str):
+        with open(file, "w", newline="", encoding="utf-8") as opened:
+            return export_results(session, opened, format, **filters)
+
+    written = 0
+    if format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in iter_results(session, **filters):
+            writer.writerow(row)
+            written += 1
+    else:
+        for row in iter_results(session, **filters):
+            file.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=json_value) + "\n")
+            written += 1
+    return written
+
+# ARCHIVE
+# MySQL can not partition results (partitioned tables have no foreign keys, and results has
+# no term column in its unique key), so the live results table holds the open terms and every
+# closed term is moved to an archive file of its own. an archive file is columnar: a JSON
+# header and one fixed width column per field (student_id, subject_id, points, percent) in
+# the narrowest integer type that fits, sorted by student. the files are memory mapped and
+# the columns read as memoryviews of the map, so nothing is copied or parsed per row.
+# archived_terms lists the files, archived_stats keeps the sums of the archived percents
+# per student for student_stats and total_average. archived_terms stores the absolute path of
+# every file, ARCHIVE_DIR is next to this module so it does not depend on the working directory.
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+ARCHIVE_MAGIC = b"SCHARC01"
+ARCHIVE_ALIGNMENT = 8
+ARCHIVE_INT_TYPES = ("b", "h", "i", "q")
+
+ArchivedTerm = namedtuple("ArchivedTerm", ["start_date", "end_date", "file_name", "row_count"])
+
+TABLE_DEFINITIONS["archived_terms"] = """CREATE TABLE archived_terms (
+                archive_id INT PRIMARY KEY AUTO_INCREMENT,
+                start_date DATE,
+                end_date DATE,
+                file_name VARCHAR(255) NOT NULL,
+                row_count INT NOT NULL,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );"""
+TABLE_DEFINITIONS["archived_stats"] = """CREATE TABLE archived_stats (
+                student_id INT PRIMARY KEY,
+                result_count INT NOT NULL DEFAULT 0,
+                percent_count INT NOT NULL DEFAULT 0,
+                percent_sum DOUBLE NOT NULL DEFAULT 0,
+
+                FOREIGN KEY (student_id) REFERENCES students(student_id)
+            );"""
+
+def create_tables_archive(session:'mysql.connector.connection_cext.CMySQLConnection'):
+    with open_cursor(session) as cursor:
+        cursor.execute(if_not_exists(TABLE_DEFINITIONS["archived_terms"]))
+        cursor.execute(if_not_exists(TABLE_DEFINITIONS["archived_stats"]))
+
+def archive_int_type(values:list) -> str:
+    """the smallest array typecode that holds every value."""
+    low, high = min(values, default=0), max(values, default=0)
+    for typecode in ARCHIVE_INT_TYPES:
+        limit = 1 << (8 * array.array(typecode).itemsize - 1)
+        if -limit <= low and high < limit:
+            return typecode
+    raise ValueError("value out of range: {}".format(low if low < 0 else high))
+
+def write_archive(path:str, start_date:str, end_date:str, rows:list):
+    """
+    writes rows (student_id, subject_id, points, percent) sorted by student_id and subject_id
+    to the archive file path, a missing percent is stored as NaN.\n
+    the file is written under a temporary name and renamed when complete.
+    """
+    columns = []
+    for i, name in enumerate(("student_id", "subject_id", "points")):
+        values = [row[i] for row in rows]
+        columns.append((name, array.array(archive_int_type(values), values)))
+    columns.append(("percent", array.array("f", [float("nan") if row[3] == None else row[3] for row in rows])))
+    header = {"start_date": start_date, "end_date": end_date, "rows": len(rows), "byteorder": sys.byteorder, "columns": []}
+    # the column offsets depend on the header length, which depends on the offsets
+    offset = 0
+    while True:
+        header["columns"] = []
+        position = offset
+        for name, values in columns:
+            header["columns"].append({"name": name, "type": values.typecode, "offset": position})
+            position += -(-len(values.tobytes()) // ARCHIVE_ALIGNMENT) * ARCHIVE_ALIGNMENT
+        encoded = json.dumps(header).encode("utf-8")
+        start = -(-(len(ARCHIVE_MAGIC) + 4 + len(encoded)) // ARCHIVE_ALIGNMENT) * ARCHIVE_ALIGNMENT
+        if start == offset:
+            break
+        offset = start
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(ARCHIVE_MAGIC + len(encoded).to_bytes(4, "little") + encoded)
+        for (name, values), column in zip(columns, header["columns"]):
+            file.write(b"\0" * (column["offset"] - file.tell()))
+            values.tofile(file)
+        file.write(b"\0" * (-file.tell() % ARCHIVE_ALIGNMENT))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+class ResultArchive:
+    """
+    a memory mapped archive file.\n
+    the columns are memoryviews into the map, numpy.frombuffer() turns them into arrays
+    without a copy. rows() finds the rows of one student by binary search on student_id.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.file.close()
+            raise
+        if self.map[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError("{} is not an archive file".format(path))
+        length = int.from_bytes(self.map[len(ARCHIVE_MAGIC):len(ARCHIVE_MAGIC) + 4], "little")
+        self.header = json.loads(self.map[len(ARCHIVE_MAGIC) + 4:len(ARCHIVE_MAGIC) + 4 + length])
+        if self.header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError("{} was written on a {} endian machine".format(path, self.header["byteorder"]))
+        self.row_count = self.header["rows"]
+        self.start_date, self.end_date = self.header["start_date"], self.header["end_date"]
+        view = memoryview(self.map)
+        self.columns = {}
+        for column in self.header["columns"]:
+            size = array.array(column["type"]).itemsize * self.row_count
+            self.columns[column["name"]] = view[column["offset"]:column["offset"] + size].cast(column["type"])
+        view.release()
+
+    def rows(self, student_id:int=None, subject_id:int=None):
+        """yields (student_id, subject_id, points, percent) of every row, or of one student and/or subject."""
+        students, subjects = self.columns["student_id"], self.columns["subject_id"]
+        points, percents = self.columns["points"], self.columns["percent"]
+        if student_id != None:
+            rows = range(bisect.bisect_left(students, student_id), bisect.bisect_right(students, student_id))
+        else:
+            rows = range(self.row_count)
+        for i in rows:
+            if subject_id == None or subjects[i] == subject_id:
+                percent = percents[i]
+                yield (students[i], subjects[i], points[i], None if percent != percent else percent)
+
+    def close(self):
+        for column in getattr(self, "columns", {}).values():
+            column.release()
+        self.columns = {}
+        self.map.close()
+        self.file.close()
+
+ARCHIVES = {}
+ARCHIVES_LOCK = threading.Lock()
+
+def open_archive(path:str) -> ResultArchive:
+    """the ResultArchive of path, opened once per process and shared by every thread."""
+    with ARCHIVES_LOCK:
+        archive = ARCHIVES.get(path)
+        if archive == None:
+            archive = ARCHIVES[path] = ResultArchive(path)
+        return archive
+
+def close_archives():
+    with ARCHIVES_LOCK:
+        for archive in ARCHIVES.values():
+            archive.close()
+        ARCHIVES.clear()
+
+def closed_terms(session:'mysql.connector.connection_cext.CMySQLConnection', before:str=None) -> list:
+    """(start_date, end_date) of every term with live results that ended before the date before (default: today)."""
+    with open_cursor(session) as cursor:
+        cursor.execute("""
+                SELECT DISTINCT subjects.start_date, subjects.end_date
+                FROM subjects
+                WHERE subjects.end_date < %s
+                AND EXISTS (SELECT 1 FROM results WHERE results.subject_id = subjects.subject_id)
+                ORDER BY subjects.start_date, subjects.end_date
+                """, (before or time.strftime("%Y-%m-%d"),))
+        return [(str(start_date), str(end_date)) for start_date, end_date in cursor.fetchall()]
+
+ARCHIVE_TERM_ROWS = """
+                SELECT results.student_id, results.subject_id, results.points, results.percent
+                FROM results INNER JOIN subjects
+                ON results.subject_id = subjects.subject_id
+                WHERE subjects.start_date = %s AND subjects.end_date = %s
+                ORDER BY results.student_id, results.subject_id
+                """
+
+@instrumented
+def archive_term(session:'mysql.connector.connection_cext.CMySQLConnection', start_date:str, end_date:str, directory:str=ARCHIVE_DIR):
     """
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    command = """                
+    moves the results of the subjects running from start_date to end_date out of the results
+    table into a new archive file in directory.\n
+    the file is written first, then in one transaction the file is registered in archived_terms,
+    the results are read again with their rows locked, the percents are added to archived_stats
+    and the results are deleted, with the student_stats triggers off so student_stats keeps
+    counting the archived results.\n
+    the term has to be closed: if its results changed since the file was written nothing is deleted.\n
+    returns the number of results archived, or None if an error occures.
+    """
+    with open_cursor(session) as cursor:
+        cursor.execute(ARCHIVE_TERM_ROWS, (start_date, end_date))
+        rows = [tuple(row) for row in cursor.fetchall()]
+    if not rows:
+        return 0
+
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "results_{}_{}_{}.col".format(start_date, end_date, time.strftime("%Y%m%d%H%M%S")))
+    write_archive(path, start_date, end_date, rows)
+
+    stats = {}
+    for student_id, subject_id, points, percent in rows:
+        counts = stats.setdefault(student_id, [0, 0, 0.0])
+        counts[0] += 1
+        if percent != None:
+            counts[1] += 1
+            counts[2] += percent
+    subject_ids = sorted({row[1] for row in rows})
+    set_bulk_load(session, True)
+    try:
+        with open_cursor(session) as cursor:
+            cursor.execute("INSERT INTO archived_terms (start_date, end_date, file_name, row_count) VALUES (%s, %s, %s, %s)",
+                           (start_date, end_date, path, len(rows)))
+            # the file holds the rows as they were read above, a result updated since then would be
+            # deleted with its new value lost. the rows stay locked until the commit
+            cursor.execute(ARCHIVE_TERM_ROWS + "FOR UPDATE", (start_date, end_date))
+            if [tuple(row) for row in cursor.fetchall()] != rows:
+                raise DatabaseError(msg="results of {} - {} changed while archiving".format(start_date, end_date))
+            cursor.executemany("""
+                INSERT INTO archived_stats (student_id, result_count, percent_count, percent_sum)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE result_count = result_count + VALUES(result_count),
+                    percent_count = percent_count + VALUES(percent_count),
+                    percent_sum = percent_sum + VALUES(percent_sum)
+                """, [(student_id, *counts) for student_id, counts in stats.items()])
+            cursor.execute("DELETE FROM results WHERE subject_id IN ({})".format(", ".join(["%s"] * len(subject_ids))), subject_ids)
+            if cursor.rowcount != len(rows):
+                raise DatabaseError(msg="results of {} - {} changed while archiving".format(start_date, end_date))
+        session.commit()
+    except DatabaseError as de:
+        print(de)
+        session.rollback()
+        os.remove(path)
+        return None
+    finally:
+        set_bulk_load(session, False)
+        invalidate_results(session)
+    return len(rows)
+
+def archive_closed_terms(session:'mysql.connector.connection_cext.CMySQLConnection', before:str=None, directory:str=ARCHIVE_DIR) -> int:
+    """archives every term of closed_terms(), returns the number of results archived."""
+    archived = 0
+    for start_date, end_date in closed_terms(session, before):
+        count = archive_term(session, start_date, end_date, directory)
+        print("archived {} - {}: {} results".format(start_date, end_date, "error" if count == None else count))
+        archived += count or 0
+    return archived
+
+def archived_terms(session:'mysql.connector.connection_cext.CMySQLConnection', start_date:str=None, end_date:str=None) -> list:
+    """ArchivedTerm of every archive file, only the terms overlapping start_date..end_date if given."""
+    command = "SELECT start_date, end_date, file_name, row_count FROM archived_terms"
+    conditions = []
+    params = ()
+    if start_date:
+        conditions.append("end_date >= %s")
+        params += (start_date,)
+    if end_date:
+        conditions.append("start_date <= %s")
+        params += (end_date,)
+    if conditions:
+        command += " WHERE " + " AND ".join(conditions)
+    command += " ORDER BY start_date, archive_id"
+    with open_cursor(session) as cursor:
+        cursor.execute(command, params)
+        return [ArchivedTerm(str(row[0]), str(row[1]), row[2], row[3]) for row in cursor.fetchall()]
+
+@instrumented
+def fetch_archived_result(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str, subject_name:str="",
+                          start_date:str=None, end_date:str=None, directory:str=ARCHIVE_DIR) -> list:
+    """
+    like fetch_result(), for the archived terms: returns a list of
+    (subject_name, points, total_points, percent) read from the archive files of the terms
+    overlapping start_date..end_date (default: every archived term).\n
+    raises ValueError if the archive file of one of these terms is missing.
+    """
+    student_id = student_key(session, id_number)
+    if student_id == None:
+        return []
+    subject_id = None
+    if subject_name:
+        subject = subject_key(session, subject_name)
+        if subject == None:
+            return []
+        subject_id = subject[0]
+    rows = []
+    for term in archived_terms(session, start_date, end_date):
+        # file_name is absolute, os.path.join() only uses directory for older rows with a bare file name
+        path = os.path.join(directory, term.file_name)
+        try:
+            archive = open_archive(path)
+        except FileNotFoundError as e:
+            raise ValueError("archive file {} of the term {} - {} is missing".format(path, term.start_date, term.end_date)) from e
+        rows.extend(archive.rows(student_id, subject_id))
+    if not rows:
+        return []
+    with open_cursor(session) as cursor:
+        subject_ids = sorted({row[1] for row in rows})
+        cursor.execute("SELECT subject_id, subject_name, total_points FROM subjects WHERE subject_id IN ({})".format(
+            ", ".join(["%s"] * len(subject_ids))), subject_ids)
+        subjects = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    return [(subjects[row[1]][0], row[2], subjects[row[1]][1], row[3]) for row in rows]
+
+# FUNCTION and AGGREGATION [ AVG(), SUM() COUNT()]
+TOTAL_AVERAGE_FUNCTION = """
                 CREATE FUNCTION total_average(student INT)
                 RETURNS DECIMAL(5,2)
                 DETERMINISTIC
                 BEGIN
                     DECLARE total_avg DECIMAL(5,2);
-                    SELECT AVG(percent) INTO total_avg
+                    DECLARE archived_sum DOUBLE DEFAULT 0;
+                    DECLARE archived_count INT DEFAULT 0;
+                    SELECT percent_sum, percent_count INTO archived_sum, archived_count
+                    FROM archived_stats
+                    WHERE student_id = student;
+                    SELECT (IFNULL(SUM(percent), 0) + archived_sum) / NULLIF(COUNT(percent) + archived_count, 0) INTO total_avg
                     FROM results
                     WHERE student_id = student;
                     RETURN total_avg;
                 END
                 """
+
+def create_function_total_avg(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    """
+    creates a function in the database\n
+    the function calculate the total average of a student
+    from the percent column in the results table and the archived_stats of archived terms
+    and returns a tupel (Decimal('total_ave'),).\n
+    cast the returned value to float dvs (float(returned value))
+    """
+    command = TOTAL_AVERAGE_FUNCTION
     print("creating function in database.")
+    # SQLiteSession registers total_average() on every connection it opens
+    if dialect(session) == "sqlite":
+        print("OK")
+        return
+    with open_cursor(session) as cursor:
+        cursor.execute("use {}".format(DB_NAME))
+        try:
+            cursor.execute("DROP FUNCTION IF EXISTS total_average;")
+            cursor.execute(command)
+            session.commit()
+            print("OK")
+        except DatabaseError as de:
+            print(de)
+            session.rollback()
+    
+def create_schema(session:'mysql.connector.connection_cext.CMySQLConnection', DB_NAME:str=DB_NAME):
+    """
+    creates the tables, the percent and student_stats triggers and the total_average function
+    in the database DB_NAME, then applies the MIGRATIONS.
+    """
+    create_table_users(session, DB_NAME)
+    create_table_students(session, DB_NAME)
+    create_table_subjects(session, DB_NAME)
+    create_table_results(session, DB_NAME)
+    stats_created = create_table_student_stats(session, DB_NAME)
+    create_tables_archive(session)
+    trigger_percent_results(session, DB_NAME)
+    trigger_student_stats(session, DB_NAME)
+    create_function_total_avg(session, DB_NAME)
+    # results that already existed are not in the new table yet
+    if stats_created:
+        rebuild_student_stats(session)
+    migrate(session)
+
+# MIGRATIONS
+# the tables themselves are created by create_schema(), everything that changes the schema
+# afterwards is a numbered migration. schema_migrations holds the versions applied so far.
+# indexes are added and dropped online on MySQL (ALGORITHM=INPLACE, LOCK=NONE: reads and
+# writes go on while the index builds).
+Index = namedtuple("Index", ["name", "table", "columns"])
+# upgrade, if given, is a function(session) run after the indexes, a migration with an upgrade can not be reverted
+Migration = namedtuple("Migration", ["version", "description", "add_indexes", "drop_indexes", "upgrade"], defaults=(None,))
+
+MIGRATIONS = [
+    Migration(1, "index results by student and percent for the averages",
+              (Index("idx_results_student_percent", "results", ("student_id", "percent")),), ()),
+    Migration(2, "index results by subject and points for per-subject statistics",
+              (Index("idx_results_subject_points", "results", ("subject_id", "points")),), ()),
+    Migration(3, "index users by username and password for login",
+              (Index("idx_users_login", "users", ("username", "password")),), ()),
+    Migration(4, "index student_stats by average for the paginated ranking",
+              (Index("idx_student_stats_average", "student_stats", ("total_average DESC", "student_id")),), ()),
+    # login() finds the user by username (UNIQUE) and checks the hash in Python
+    Migration(5, "store password hashes instead of plaintext passwords",
+              (), (Index("idx_users_login", "users", ("username", "password")),), lambda session: hash_plaintext_passwords(session)),
+]
+
+def add_index(session:'mysql.connector.connection_cext.CMySQLConnection', index:Index):
+    """creates index, nothing happens if it already exists."""
+    with open_cursor(session) as cursor:
+        if dialect(session) == "sqlite":
+            cursor.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(index.name, index.table, ", ".join(index.columns)))
+            return
+        try:
+            cursor.execute("ALTER TABLE {} ADD INDEX {} ({}), ALGORITHM=INPLACE, LOCK=NONE".format(
+                index.table, index.name, ", ".join(index.columns)))
+        except DatabaseError as de:
+            # 1061: duplicate key name
+            if de.errno != 1061:
+                raise
+
+def drop_index(session:'mysql.connector.connection_cext.CMySQLConnection', index:Index):
+    """drops index, nothing happens if it does not exist."""
+    with open_cursor(session) as cursor:
+        if dialect(session) == "sqlite":
+            cursor.execute("DROP INDEX IF EXISTS {}".format(index.name))
+            return
+        try:
+            cursor.execute("ALTER TABLE {} DROP INDEX {}, ALGORITHM=INPLACE, LOCK=NONE".format(index.table, index.name))
+        except DatabaseError as de:
+            # 1091: can't drop, the index does not exist
+            if de.errno != 1091:
+                raise
+
+TABLE_DEFINITIONS["schema_migrations"] = """CREATE TABLE schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255),
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );"""
+
+def create_table_schema_migrations(session:'mysql.connector.connection_cext.CMySQLConnection'):
+    with open_cursor(session) as cursor:
+        cursor.execute(if_not_exists(TABLE_DEFINITIONS["schema_migrations"]))
+
+def schema_version(session:'mysql.connector.connection_cext.CMySQLConnection') -> int:
+    """the highest migration version applied to the database of session, 0 if none."""
+    create_table_schema_migrations(session)
+    with open_cursor(session) as cursor:
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        version = cursor.fetchone()[0]
+    return version or 0
+
+def migrate(session:'mysql.connector.connection_cext.CMySQLConnection', target:int=None):
+    """
+    brings the database of session to migration version target (default: the latest).\n
+    a higher target applies the missing migrations in order, a lower one reverts the
+    applied migrations above it, newest first, up to the first one with an upgrade.\n
+    returns the version the database is at afterwards.
+    """
+    if target == None:
+        target = MIGRATIONS[-1].version if MIGRATIONS else 0
+    version = schema_version(session)
+    with open_cursor(session) as cursor:
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+    for migration in MIGRATIONS:
+        if migration.version > target or migration.version in applied:
+            continue
+        print("migration {}: {}".format(migration.version, migration.description))
+        for index in migration.drop_indexes:
+            drop_index(session, index)
+        for index in migration.add_indexes:
+            add_index(session, index)
+        if migration.upgrade != None:
+            migration.upgrade(session)
+        with open_cursor(session) as cursor:
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (migration.version, migration.description))
+        session.commit()
+        version = max(version, migration.version)
+
+    for migration in reversed(MIGRATIONS):
+        if migration.version <= target or migration.version not in applied:
+            continue
+        if migration.upgrade != None:
+            print("migration {} can not be reverted".format(migration.version))
+            break
+        print("reverting migration {}: {}".format(migration.version, migration.description))
+        for index in migration.add_indexes:
+            drop_index(session, index)
+        for index in migration.drop_indexes:
+            add_index(session, index)
+        with open_cursor(session) as cursor:
+            cursor.execute("DELETE FROM schema_migrations WHERE version = %s", (migration.version,))
+        session.commit()
+    return schema_version(session)
+
+# BOOTSTRAP
+# create_schema() runs every CREATE and drops and recreates the triggers and the function
+# each time. bootstrap_schema() keeps a fingerprint (sha256 of the statement) of every table,
+# trigger, function and migration in schema_objects and only creates what is missing or
+# changed, so starting on a database that is up to date costs one query.
+SchemaObject = namedtuple("SchemaObject", ["kind", "name", "statement"])
+
+TABLE_DEFINITIONS["schema_objects"] = """CREATE TABLE schema_objects (
+                kind VARCHAR(20),
+                name VARCHAR(64),
+                fingerprint CHAR(64) NOT NULL,
+                
+                PRIMARY KEY (kind, name)
+            );"""
+
+def schema_objects(dialect_name:str) -> list:
+    """every table, trigger, function and migration the module expects, in the order they are created."""
+    objects = [SchemaObject("table", name, statement) for name, statement in TABLE_DEFINITIONS.items()]
+    for triggers in (percent_trigger_statements(dialect_name), student_stats_trigger_statements(dialect_name)):
+        objects += [SchemaObject("trigger", name, statement) for name, statement in triggers.items()]
+    # SQLiteSession registers total_average() on every connection it opens
+    if dialect_name != "sqlite":
+        objects.append(SchemaObject("function", "total_average", TOTAL_AVERAGE_FUNCTION))
+    objects += [SchemaObject("migration", str(migration.version), repr((migration.description, migration.add_indexes, migration.drop_indexes)))
+                for migration in MIGRATIONS]
+    return objects
+
+def object_fingerprint(dialect_name:str, schema_object:SchemaObject) -> str:
+    # indentation and line breaks of the statement do not count
+    text = "\0".join((dialect_name, schema_object.kind, schema_object.name, " ".join(schema_object.statement.split())))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def schema_fingerprint(dialect_name:str) -> str:
+    """one fingerprint of the whole schema the module expects."""
+    digest = hashlib.sha256()
+    for schema_object in schema_objects(dialect_name):
+        digest.update(object_fingerprint(dialect_name, schema_object).encode("ascii"))
+    return digest.hexdigest()
+
+def existing_tables(session:'mysql.connector.connection_cext.CMySQLConnection') -> set:
+    with open_cursor(session) as cursor:
+        if dialect(session) == "sqlite":
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        else:
+            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")
+        return {row[0] for row in cursor.fetchall()}
+
+@instrumented
+def bootstrap_schema(session:'mysql.connector.connection_cext.CMySQLConnection') -> list:
+    """
+    brings the database of session to the schema of the module in one pass.\n
+    the fingerprints stored in schema_objects are read with one query, when they all match
+    nothing else happens. otherwise missing tables are created (a table that exists is left
+    as it is, its changes are migrations), triggers and functions whose statement changed
+    are dropped and created again, the missing migrations are applied and the new
+    fingerprints are stored.\n
+    returns the (kind, name) of every object that was created or applied, an empty list
+    if the database was up to date.
+    """
+    dialect_name = dialect(session)
+    expected = OrderedDict(((schema_object.kind, schema_object.name), (schema_object, object_fingerprint(dialect_name, schema_object)))
+                           for schema_object in schema_objects(dialect_name))
     try:
-        cursor.execute("DROP FUNCTION IF EXISTS total_average;")
-        cursor.execute(command)
-        session.commit()
-        print("OK")
-    except DatabaseError as de:
-        print(de)
+        with open_cursor(session) as cursor:
+            cursor.execute("SELECT kind, name, fingerprint FROM schema_objects")
+            stored = {(kind, name): fingerprint for kind, name, fingerprint in cursor.fetchall()}
+    except DatabaseError:
+        # a new database, or one created by create_schema()
         session.rollback()
-    finally:
-        return
-    
+        stored = {}
+    changed = [key for key, (schema_object, fingerprint) in expected.items() if stored.get(key) != fingerprint]
+    if not changed:
+        return []
+
+    tables = existing_tables(session)
+    created_tables = []
+    applied = []
+    with open_cursor(session) as cursor:
+        for kind, name in changed:
+            schema_object = expected[(kind, name)][0]
+            if kind == "table":
+                if name in tables:
+                    if (kind, name) in stored:
+                        print("table {} differs from its definition, change it with a migration".format(name))
+                    continue
+                print("creating {} table".format(name))
+                cursor.execute(schema_object.statement)
+                created_tables.append(name)
+            elif kind in ("trigger", "function"):
+                print("creating {} {}".format(kind, name))
+                cursor.execute("DROP {} IF EXISTS {}".format(kind.upper(), name))
+                cursor.execute(schema_object.statement)
+            if kind != "table" or name in created_tables:
+                applied.append((kind, name))
+    session.commit()
+    # results that already existed are not in the new table yet
+    if "student_stats" in created_tables:
+        rebuild_student_stats(session)
+    if any(kind == "migration" for kind, name in changed):
+        migrate(session)
+
+    with open_cursor(session) as cursor:
+        cursor.execute("DELETE FROM schema_objects")
+        cursor.executemany("INSERT INTO schema_objects (kind, name, fingerprint) VALUES (%s, %s, %s)",
+                           [(kind, name, fingerprint) for (kind, name), (schema_object, fingerprint) in expected.items()])
+    session.commit()
+    return applied
+
+# PLAN CHECKS
+# EXPLAIN of the hot queries, a query whose plan reads a whole table (MySQL type ALL or
+# index, SQLite SCAN) is reported unless the table is in its allowed list. run it against
+# a database with realistic data: on nearly empty tables the planners prefer scans.
+PlanCheck = namedtuple("PlanCheck", ["name", "command", "params", "allowed_scans"])
+PlanProblem = namedtuple("PlanProblem", ["name", "table", "detail"])
+
+def plan_checks(session:'mysql.connector.connection_cext.CMySQLConnection') -> list:
+    """the hot queries of the module, with parameters taken from existing rows."""
+    with open_cursor(session) as cursor:
+        cursor.execute("SELECT student_id, subject_id FROM results ORDER BY result_id LIMIT 1")
+        student_id, subject_id = cursor.fetchone() or (1, 1)
+        cursor.execute("SELECT id_number FROM students WHERE student_id = %s", (student_id,))
+        id_number = (cursor.fetchone() or ("",))[0]
+        cursor.execute("SELECT subject_name FROM subjects WHERE subject_id = %s", (subject_id,))
+        subject_name = (cursor.fetchone() or ("",))[0]
+        cursor.execute("SELECT username FROM users ORDER BY user_id LIMIT 1")
+        username = (cursor.fetchone() or ("",))[0]
+
+    return [
+        PlanCheck("login", LOGIN_USER, (username,), ()),
+        PlanCheck("student_key", SELECT_STUDENT_KEY, (id_number,), ()),
+        PlanCheck("subject_key", SELECT_SUBJECT_KEY, (subject_name,), ()),
+        PlanCheck("user_key", SELECT_USER_KEY, (username,), ()),
+        PlanCheck("fetch_result", SELECT_RESULTS, (student_id,), ()),
+        PlanCheck("fetch_result_subject", SELECT_SUBJECT_RESULTS, (student_id, subject_id), ()),
+        PlanCheck("total_ave", SELECT_STUDENT_STATS, (student_id,), ()),
+        PlanCheck("fetch_ranking_page", ranking_page_command(False, True), (0.5, 0.5, student_id, PAGE_SIZE + 1), ()),
+        PlanCheck("fetch_ranking_subject_page", ranking_page_command(True, True),
+                  (subject_id, 10, 10, 1000, PAGE_SIZE + 1), ()),
+        PlanCheck("fetch_ranking_unranked_page", SELECT_UNRANKED_PAGE, (student_id, PAGE_SIZE + 1), ()),
+        PlanCheck("fetch_ranking_subject_unranked_page", SELECT_SUBJECT_UNRANKED_PAGE, (subject_id, student_id, PAGE_SIZE + 1), ()),
+        # a ranking lists every student, reading all of students is expected
+        PlanCheck("fetch_ranking", SELECT_RANKING.format(rank="RANK()"), (), ("students",)),
+        PlanCheck("fetch_ranking_subject", SELECT_SUBJECT_RANKING.format(rank="RANK()"), (subject_name,), ("students",)),
+    ]
+
+def full_scans(session:'mysql.connector.connection_cext.CMySQLConnection', command:str, params=()) -> list:
+    """(table, plan line) of every full table scan in the plan of command."""
+    scans = []
+    if dialect(session) == "sqlite":
+        for row in explain_statement(session, command, params):
+            detail = str(row[-1])
+            words = detail.split()
+            if len(words) >= 2 and words[0] == "SCAN" and not words[1].startswith("(") and words[1] != "CONSTANT":
+                scans.append((words[1], detail))
+        return scans
+
+    with open_cursor(session) as cursor:
+        cursor.execute("EXPLAIN " + command, params)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+    for row in rows:
+        plan = dict(zip(columns, row))
+        table = plan.get("table") or ""
+        if plan.get("type") in ("ALL", "index") and not table.startswith("<"):
+            scans.append((table, "type={} key={} rows={}".format(plan.get("type"), plan.get("key"), plan.get("rows"))))
+    return scans
+
+def check_query_plans(session:'mysql.connector.connection_cext.CMySQLConnection', verbose:bool=True) -> list:
+    """
+    runs EXPLAIN on every query of plan_checks().\n
+    returns a list of PlanProblem, one per full table scan that is not allowed,
+    an empty list means every hot query uses an index.
+    """
+    problems = []
+    for check in plan_checks(session):
+        found = [PlanProblem(check.name, table, detail) for table, detail in full_scans(session, check.command, check.params)
+                 if table not in check.allowed_scans]
+        problems.extend(found)
+        if verbose:
+            print("{}: {}".format(check.name, "OK" if not found else "full scan of " + ", ".join(problem.table for problem in found)))
+    return problems
+
+SELECT_STUDENT_STATS = "SELECT total_average, result_count FROM student_stats WHERE student_id=%s"
+
+@instrumented
 def total_ave(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str):
     """
     teachers can use it to sort students with rank.\n
     parents can use it to see what rank their child is\n
-    uses the function total_average in the database
-    to calculate the average of a student and
+    reads the total average of a student from the student_stats table,
+    which the triggers keep up to date, in one query and
     returns a lst where
-    lst[0] is the total average of the student and
-    lst[1] is the number of subjects reported for that student using SUM()
+    lst[0] is the total average of the student (rounded to 2 decimals like total_average) and
+    lst[1] is the number of subjects reported for that student
     returns None if there is no data or if error occures.
     """
-    
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    
-    # get the student_id of the student with help of id_number
-    cursor.execute("SELECT student_id FROM students WHERE id_number='{}';".format(id_number))
-    student_id = cursor.fetchone()
-    if not student_id:
-        # print("student with id number {} not found.".format(id_number))
-        cursor.close()
-        return
-    student_id = student_id[0]
-    
-    # get number of subjects reported (inserted results) for that student
-    cursor.execute("SELECT COUNT(*) FROM results WHERE student_id='{}';".format(student_id))
-    subject_count = cursor.fetchone()[0]
-    if subject_count == 0:
-        # print("the student has not subject reported to results")
-        cursor.close()
-        return
-    
-    # get total number of subjects in the subjects table
-    cursor.execute("SELECT COUNT(*) FROM subjects;")
-    total_subjects = cursor.fetchone()[0]
-    
-    # get total average using total_average function in database
     try:
-        cursor.execute("SELECT total_average('{}') FROM results where student_id='{}';".format(student_id, student_id))        
-        total_average = cursor.fetchall()[0][0]
-        cursor.close()
-        return (float(total_average), subject_count)
+        student_id = student_key(session, id_number)
+        if student_id == None:
+            return
+        rows = fetch_prepared(session, SELECT_STUDENT_STATS, (student_id,))
+        stats = rows[0] if rows else None
     except DatabaseError as de:
-        cursor.close()
         print(de)
         return
+    # student not found or no subject reported to results
+    if not stats or stats[1] == 0 or stats[0] == None:
+        return
+    return (round(float(stats[0]), 2), stats[1])
+
+# WINDOW FUNCTION [ RANK(), DENSE_RANK() ]
+StudentRank = namedtuple("StudentRank", ["rank", "id_number", "total_average", "subject_count"])
+
+# {rank} is RANK() or DENSE_RANK()
+SELECT_RANKING = """
+                SELECT {rank} OVER (ORDER BY ROUND(student_stats.total_average, 2) DESC) AS student_rank,
+                       students.id_number,
+                       ROUND(student_stats.total_average, 2) AS total_average,
+                       IFNULL(student_stats.result_count, 0) AS subject_count
+                FROM students LEFT JOIN student_stats
+                ON student_stats.student_id = students.student_id
+                ORDER BY IFNULL(student_stats.result_count, 0) = 0, student_rank, students.id_number
+                """
+SELECT_SUBJECT_RANKING = """
+                SELECT {rank} OVER (ORDER BY ROUND(AVG(results.percent), 2) DESC) AS student_rank,
+                       students.id_number,
+                       ROUND(AVG(results.percent), 2) AS total_average,
+                       COUNT(results.result_id) AS subject_count
+                FROM students LEFT JOIN results
+                ON results.student_id = students.student_id
+                AND results.subject_id = (SELECT subject_id FROM subjects WHERE subject_name=%s)
+                GROUP BY students.student_id, students.id_number
+                ORDER BY COUNT(results.result_id) = 0, student_rank, students.id_number
+                """
+
+@instrumented
+def fetch_ranking(session:'mysql.connector.connection_cext.CMySQLConnection', subject_name:str="", dense:bool=False):
+    """
+    ranks every student in one query instead of calling total_ave() per student.\n
+    the averages over all subjects are read from student_stats,
+    the ones of a single subject are aggregated from results.\n
+    the average is rounded to 2 decimals like total_average in the database
+    and students with the same rounded average share a rank.\n
+    dense=False uses RANK() (1, 1, 3), dense=True uses DENSE_RANK() (1, 1, 2).\n
+    if subject_name is given only results of that subject are ranked.\n
+    returns a list of StudentRank tuples ordered from highest to lowest average,
+    students without results come last with rank, total_average set to None.
+    """
+    rank_function = "DENSE_RANK()" if dense else "RANK()"
+    params = ()
+    if subject_name:
+        # one subject: aggregate its results, restricting the join so students
+        # without that subject still show up
+        command = SELECT_SUBJECT_RANKING.format(rank=rank_function)
+        params = (subject_name,)
+    else:
+        # all subjects: the averages are already in student_stats
+        command = SELECT_RANKING.format(rank=rank_function)
+    with open_cursor(session) as cursor:
+        cursor.execute(command, params)
+        rows = cursor.fetchall()
+
+    ranking = []
+    for student_rank, id_number, total_average, subject_count in rows:
+        if subject_count == 0 or total_average == None:
+            ranking.append(StudentRank(None, id_number, None, 0))
+        else:
+            ranking.append(StudentRank(student_rank, id_number, float(total_average), subject_count))
+    return ranking
 
-def rank_students(session:'mysql.connector.connection_cext.CMySQLConnection'):
+@instrumented
+def rank_students(session:'mysql.connector.connection_cext.CMySQLConnection', subject_name:str="", dense:bool=False):
     """
     for teachers\n
-    uses the function total_ave() to get total average of every student then
-    rank students from highest to lowest according total average.\n
+    uses the function fetch_ranking() to get total average and rank of every student
+    in one query and prints them from highest to lowest according total average.\n
     """
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    
-    # get id numbers of all students from database
-    command = """
-                SELECT id_number FROM students;
-                """
-    cursor.execute(command)
-    students = cursor.fetchall()    
+    print_ranking(fetch_ranking(session, subject_name, dense))
+
+def print_ranking(ranking:list):
+    """prints a list of StudentRank from highest to lowest total average."""
     # if students table is empty
-    if not students:
+    if not ranking:
         print("no students in database.")
         return
-    # id_numbers = ["CD23456789", "GH45678901"]
-    id_numbers = []
-    for i in range(0,len(students)):
-        id_numbers.append(students[i][0])
-    
-    # average of all students in a list
-    ave_lst = []
-    for i in range(0,len(id_numbers)):
-        ave_lst.append(total_ave(session, id_numbers[i]))
-    
-    print("Student id\t\t\tTotal average\t\tNumber of subjects")
-    for i in range(0, len(ave_lst)):
-        if ave_lst[i] == None:
-            print("{}\t\t\tNone\t\t\tNone".format(id_numbers[i]))
+
+    print("Rank\tStudent id\t\t\tTotal average\t\tNumber of subjects")
+    for row in ranking:
+        if row.rank == None:
+            print("-\t{}\t\t\tNone\t\t\tNone".format(row.id_number))
+        else:
+            print("{}\t{}\t\t\t{}\t\t\t{}".format(row.rank, row.id_number, row.total_average, row.subject_count))
+
+# PAGINATION
+# keyset (seek) pagination, never OFFSET: a page starts right after the last row of the
+# previous page, found through an index, so page 1000 costs as much as page 1.
+# the position is handed to the caller as an opaque token.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+Page = namedtuple("Page", ["rows", "next_token"])
+
+def encode_page_token(state:dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_page_token(token:str, kind:str, **listing) -> dict:
+    """the state of a token made by encode_page_token(), ValueError if it is not a token of this listing."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid page token") from e
+    if not isinstance(state, dict) or state.get("kind") != kind or any(state.get(key) != value for key, value in listing.items()):
+        raise ValueError("page token does not belong to this listing")
+    return state
+
+def page_limit(page_size:int) -> int:
+    return max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+@instrumented
+def list_students_page(session:'mysql.connector.connection_cext.CMySQLConnection', page_token:str=None, page_size:int=PAGE_SIZE):
+    """
+    one page of (id_number, first_name, last_name) of all students, ordered by id_number.\n
+    returns a Page, pass its next_token to get the following page, None after the last page.
+    """
+    page_size = page_limit(page_size)
+    command = "SELECT id_number, first_name, last_name FROM students"
+    params = ()
+    if page_token:
+        state = decode_page_token(page_token, "students")
+        command += " WHERE id_number > %s"
+        params = (state["after"],)
+    command += " ORDER BY id_number LIMIT %s"
+    with open_cursor(session) as cursor:
+        cursor.execute(command, params + (page_size + 1,))
+        rows = cursor.fetchall()
+    if len(rows) <= page_size:
+        return Page(rows, None)
+    rows = rows[:page_size]
+    return Page(rows, encode_page_token({"kind": "students", "after": rows[-1][0]}))
+
+@instrumented
+def fetch_result_page(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str, page_token:str=None, page_size:int=PAGE_SIZE):
+    """
+    one page of the (subject_name, points, total_points, percent) rows of fetch_result(),
+    ordered by subject.\n
+    returns a Page, pass its next_token to get the following page, None after the last page.
+    """
+    page_size = page_limit(page_size)
+    student_id = student_key(session, id_number)
+    if student_id == None:
+        return Page([], None)
+    command = """
+                SELECT subjects.subject_name, results.points, subjects.total_points, results.percent, results.subject_id
+                FROM results INNER JOIN subjects
+                ON results.subject_id = subjects.subject_id
+                WHERE results.student_id = %s
+                """
+    params = (student_id,)
+    if page_token:
+        state = decode_page_token(page_token, "results", id_number=id_number)
+        command += "AND results.subject_id > %s "
+        params += (state["after"],)
+    command += "ORDER BY results.subject_id LIMIT %s"
+    with open_cursor(session) as cursor:
+        cursor.execute(command, params + (page_size + 1,))
+        rows = cursor.fetchall()
+    next_token = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_token = encode_page_token({"kind": "results", "id_number": id_number, "after": rows[-1][4]})
+    return Page([row[:4] for row in rows], next_token)
+
+def ranking_page_command(subject:bool, seek:bool) -> str:
+    """
+    the ranked rows of fetch_ranking_page(): rank key (the average rounded like fetch_ranking()),
+    seek values, id_number and subject count, of all subjects or of one subject (subject_id the
+    first parameter), after the seek values of the previous page if seek is True.\n
+    the page size is the last parameter.
+    """
+    if not subject:
+        command = """
+                SELECT ROUND(student_stats.total_average, 2), student_stats.total_average, student_stats.student_id,
+                       students.id_number, student_stats.result_count
+                FROM student_stats INNER JOIN students
+                ON students.student_id = student_stats.student_id
+                WHERE student_stats.total_average IS NOT NULL
+                """
+        if seek:
+            command += """AND (student_stats.total_average < %s
+                     OR (student_stats.total_average = %s AND student_stats.student_id > %s))
+                """
+        return command + "ORDER BY student_stats.total_average DESC, student_stats.student_id LIMIT %s"
+    command = """
+                SELECT ROUND(results.percent, 2), results.points, results.result_id, students.id_number, 1
+                FROM results INNER JOIN students
+                ON students.student_id = results.student_id
+                WHERE results.subject_id = %s AND results.percent IS NOT NULL
+                """
+    if seek:
+        command += """AND (results.points < %s OR (results.points = %s AND results.result_id < %s))
+                """
+    return command + "ORDER BY results.points DESC, results.result_id DESC LIMIT %s"
+
+# the students without results (in one subject) after the ranked ones, by student key
+SELECT_UNRANKED_PAGE = """
+                SELECT students.student_id, students.id_number
+                FROM students LEFT JOIN student_stats
+                ON student_stats.student_id = students.student_id
+                WHERE (student_stats.student_id IS NULL OR student_stats.total_average IS NULL)
+                AND students.student_id > %s
+                ORDER BY students.student_id LIMIT %s
+                """
+SELECT_SUBJECT_UNRANKED_PAGE = """
+                SELECT students.student_id, students.id_number
+                FROM students LEFT JOIN results
+                ON results.student_id = students.student_id AND results.subject_id = %s
+                WHERE (results.result_id IS NULL OR results.percent IS NULL)
+                AND students.student_id > %s
+                ORDER BY students.student_id LIMIT %s
+                """
+
+@instrumented
+def fetch_ranking_page(session:'mysql.connector.connection_cext.CMySQLConnection', subject_name:str="", dense:bool=False,
+                       page_token:str=None, page_size:int=PAGE_SIZE):
+    """
+    one page of the ranking of fetch_ranking(), as StudentRank tuples with the same ranks.\n
+    students with the same rounded average are ordered by their exact average
+    (by points for one subject), not by id_number like fetch_ranking() does.
+    students without results follow the ranked ones, ordered by student key.\n
+    returns a Page, pass its next_token to get the following page, None after the last page.
+    """
+    page_size = page_limit(page_size)
+    listing = {"subject_name": subject_name, "dense": bool(dense)}
+    if page_token:
+        state = decode_page_token(page_token, "ranking", **listing)
+    else:
+        state = {"kind": "ranking", **listing, "phase": "ranked", "after": None, "key": None, "rank": 0, "position": 0}
+
+    subject_id = None
+    if subject_name:
+        subject = subject_key(session, subject_name)
+        if subject == None:
+            return Page([], None)
+        subject_id = subject[0]
+
+    ranking = []
+    with open_cursor(session) as cursor:
+        if state["phase"] == "ranked":
+            command = ranking_page_command(subject_id != None, state["after"] != None)
+            params = () if subject_id == None else (subject_id,)
+            if state["after"] != None:
+                params += (state["after"][0], state["after"][0], state["after"][1])
+            cursor.execute(command, params + (page_size + 1,))
+            rows = cursor.fetchall()
+            for key, seek, row_id, id_number, subject_count in rows[:page_size]:
+                state["position"] += 1
+                if key != state["key"]:
+                    state["rank"] = state["rank"] + 1 if dense else state["position"]
+                    state["key"] = key
+                ranking.append(StudentRank(state["rank"], id_number, float(key), subject_count))
+                state["after"] = [seek, row_id]
+            if len(rows) > page_size:
+                return Page(ranking, encode_page_token(state))
+            state.update(phase="unranked", after=0)
+
+        # students without results (in the subject), after the ranked ones
+        if subject_id == None:
+            command = SELECT_UNRANKED_PAGE
+            params = (state["after"],)
+        else:
+            command = SELECT_SUBJECT_UNRANKED_PAGE
+            params = (subject_id, state["after"])
+        remaining = page_size - len(ranking)
+        cursor.execute(command, params + (remaining + 1,))
+        rows = cursor.fetchall()
+    for student_id, id_number in rows[:remaining]:
+        ranking.append(StudentRank(None, id_number, None, 0))
+        state["after"] = student_id
+    if len(rows) > remaining:
+        return Page(ranking, encode_page_token(state))
+    return Page(ranking, None)
+
+# LEADERBOARD
+# "what rank is my child" without ranking every student: the students with results are
+# kept in memory in an indexable skip list ordered like fetch_ranking(), so rank, top-k
+# and percentile queries and the update after a new grade all take O(log n).
+class IndexableSkipList:
+    """
+    sorted list of unique keys with O(log n) insert, remove, index (number of smaller keys)
+    and access by position. every link stores how many keys it skips.
+    """
+    MAX_LEVEL = 32
+
+    def __init__(self, seed:int=None):
+        self.random = random.Random(seed)
+        self.size = 0
+        self.level = 1
+        # node: [key, next nodes per level, widths per level]
+        self.head = [None, [None] * self.MAX_LEVEL, [1] * self.MAX_LEVEL]
+
+    def __len__(self):
+        return self.size
+
+    def _path(self, key):
+        """the last node before key on every level and the position of each of them."""
+        path = [None] * self.MAX_LEVEL
+        positions = [0] * self.MAX_LEVEL
+        node, position = self.head, 0
+        for level in range(self.MAX_LEVEL - 1, -1, -1):
+            while node[1][level] != None and node[1][level][0] < key:
+                position += node[2][level]
+                node = node[1][level]
+            path[level] = node
+            positions[level] = position
+        return path, positions
+
+    def insert(self, key):
+        path, positions = self._path(key)
+        level = 1
+        while level < self.MAX_LEVEL and self.random.random() < 0.5:
+            level += 1
+        node = [key, [None] * level, [0] * level]
+        position = positions[0] + 1
+        for i in range(self.MAX_LEVEL):
+            if i < level:
+                node[1][i] = path[i][1][i]
+                node[2][i] = path[i][2][i] - (position - 1 - positions[i])
+                path[i][1][i] = node
+                path[i][2][i] = position - positions[i]
+            else:
+                path[i][2][i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        path, positions = self._path(key)
+        node = path[0][1][0]
+        if node == None or node[0] != key:
+            raise KeyError(key)
+        for i in range(self.MAX_LEVEL):
+            if i < len(node[1]):
+                path[i][1][i] = node[1][i]
+                path[i][2][i] += node[2][i] - 1
+            else:
+                path[i][2][i] -= 1
+        self.size -= 1
+
+    def index(self, key) -> int:
+        """number of keys smaller than key."""
+        return self._path(key)[1][0]
+
+    def __getitem__(self, position:int):
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        node, remaining = self.head, position + 1
+        for level in range(self.MAX_LEVEL - 1, -1, -1):
+            while node[1][level] != None and node[2][level] <= remaining:
+                remaining -= node[2][level]
+                node = node[1][level]
+            if remaining == 0:
+                return node[0]
+
+    def __iter__(self):
+        node = self.head[1][0]
+        while node != None:
+            yield node[0]
+            node = node[1][0]
+
+class Leaderboard:
+    """
+    in-memory ranking of the students with results, the same ranks as fetch_ranking().\n
+    leaderboard = Leaderboard.build(session)
+    leaderboard.rank("AB12345678")
+    register_result(session, "AB12345678", "Math", "45", leaderboard=leaderboard)\n
+    build() reads student_stats once, refresh_student() re-reads one student after a new grade.
+    """
+    def __init__(self):
+        self.entries = IndexableSkipList()      # (-average, id_number)
+        self.distinct = IndexableSkipList()     # (-average,) of every average some student has
+        self.students = {}                      # id_number -> (average, subject_count)
+        self.counts = {}                        # average -> number of students with it
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, session:'mysql.connector.connection_cext.CMySQLConnection'):
+        leaderboard = cls()
+        for id_number, average, subject_count in leaderboard_rows(session):
+            leaderboard.update(id_number, average, subject_count)
+        return leaderboard
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, id_number:str, average, subject_count:int=0):
+        """sets the rounded average of a student, None removes the student."""
+        average = None if average == None else float(average)
+        with self.lock:
+            old = self.students.pop(id_number, None)
+            if old != None:
+                self.entries.remove((-old[0], id_number))
+                self.counts[old[0]] -= 1
+                if self.counts[old[0]] == 0:
+                    del self.counts[old[0]]
+                    self.distinct.remove((-old[0],))
+            if average == None:
+                return
+            self.students[id_number] = (average, subject_count)
+            self.entries.insert((-average, id_number))
+            if average not in self.counts:
+                self.counts[average] = 0
+                self.distinct.insert((-average,))
+            self.counts[average] += 1
+
+    def refresh_student(self, session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str):
+        """re-reads the average of one student from student_stats."""
+        rows = leaderboard_rows(session, id_number)
+        if rows:
+            self.update(id_number, rows[0][1], rows[0][2])
         else:
-            print("{}\t\t\t{}\t\t\t{}".format(id_numbers[i], ave_lst[i][0], ave_lst[i][1]))
+            self.update(id_number, None)
+
+    def rank(self, id_number:str, dense:bool=False):
+        """rank of the student like fetch_ranking(), None if the student has no results."""
+        with self.lock:
+            return self._rank(id_number, dense)
+
+    def _rank(self, id_number:str, dense:bool):
+        student = self.students.get(id_number)
+        if student == None:
+            return None
+        if dense:
+            return self.distinct.index((-student[0],)) + 1
+        # students with a higher average come before (-average, "")
+        return self.entries.index((-student[0], "")) + 1
+
+    def top(self, k:int, dense:bool=False) -> list:
+        """the first k StudentRank tuples of the ranking."""
+        with self.lock:
+            ranking = []
+            rank = 0
+            previous = None
+            for position, (key, id_number) in enumerate(self.entries, 1):
+                if position > k:
+                    break
+                if key != previous:
+                    rank = rank + 1 if dense else position
+                    previous = key
+                ranking.append(StudentRank(rank, id_number, -key, self.students[id_number][1]))
+            return ranking
+
+    def percentile(self, id_number:str):
+        """percentage of the ranked students with a lower average than the student, None if not ranked."""
+        with self.lock:
+            student = self.students.get(id_number)
+            if student == None:
+                return None
+            # students with a lower average come after every (-average, id_number) key of this average
+            lower = len(self.entries) - self.entries.index((-student[0], "\uffff"))
+            return 100.0 * lower / len(self.entries)
 
+    def average_at_percentile(self, percentile:float):
+        """the average that percentile percent of the ranked students are below, None if empty."""
+        with self.lock:
+            if not len(self.entries):
+                return None
+            position = min(len(self.entries) - 1, max(0, int(len(self.entries) * (1 - percentile / 100.0))))
+            return -self.entries[position][0]
+
+    def check(self, session:'mysql.connector.connection_cext.CMySQLConnection') -> list:
+        """
+        compares the leaderboard with fetch_ranking().\n
+        returns (id_number, leaderboard (rank, average, subject_count), database (rank, average, subject_count))
+        for every student that differs, an empty list means the leaderboard is correct.
+        """
+        expected = {row.id_number: (row.rank, row.total_average, row.subject_count)
+                    for row in fetch_ranking(session) if row.rank != None}
+        with self.lock:
+            stored = {id_number: (self._rank(id_number, False), average, count)
+                      for id_number, (average, count) in self.students.items()}
+        return [(id_number, stored.get(id_number), expected.get(id_number))
+                for id_number in sorted(set(stored) | set(expected)) if stored.get(id_number) != expected.get(id_number)]
+
+def leaderboard_rows(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str=None) -> list:
+    """(id_number, rounded average, subject_count) of every student with an average, or of one student."""
+    command = """
+                SELECT students.id_number, ROUND(student_stats.total_average, 2), student_stats.result_count
+                FROM student_stats INNER JOIN students
+                ON students.student_id = student_stats.student_id
+                WHERE student_stats.total_average IS NOT NULL
+                """
+    params = ()
+    if id_number != None:
+        student_id = student_key(session, id_number)
+        if student_id == None:
+            return []
+        command += "AND student_stats.student_id = %s"
+        params = (student_id,)
+    with open_cursor(session) as cursor:
+        cursor.execute(command, params)
+        return [(row[0], float(row[1]), row[2]) for row in cursor.fetchall()]
+
+@instrumented
 def show_student_result(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str, subject_name:str=""):
     """
     for parents, to check their childs points in one or all subjects\n
     uses the function fetch_result() to do this.
     """
-    result = fetch_result(session, id_number, subject_name)
+    print_student_result(fetch_result(session, id_number, subject_name))
+
+def print_student_result(result:list):
+    """prints the (subject_name, points, total_points, percent) rows of fetch_result()."""
     if result == None or len(result) == 0:
         result = [("NONE")]
     print("Subject\t\tPoints\t\tMaximum possible points\t\tPercent")
     for i in range(0,len(result)):
         print("{}\t\t{}\t\t{}\t\t\t\t{}".format(result[i][0], result[i][1], result[i][2], result[i][3]))
 
-def register_result(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str, subject_name:str, points:str):
+@instrumented
+def register_result(session:'mysql.connector.connection_cext.CMySQLConnection', id_number:str, subject_name:str, points:str,
+                    write_queue:GradeWriteQueue=None, leaderboard:Leaderboard=None):
     """
     for teachers to register result of a student in a subject\n
-    uses the function insert_results() to do this
+    uses the function insert_results() to do this, or the group commit of write_queue if given
+    and waits until the result is committed.\n
+    if leaderboard is given the new average of the student is updated in it.
     """
     try:
-        insert_results(session, id_number, subject_name, points)
-        print("result registered successfully.")
+        if write_queue != None:
+            registered = write_queue.submit(id_number, subject_name, points).result()
+        else:
+            registered = insert_results(session, id_number, subject_name, points)
+        if registered:
+            if leaderboard != None:
+                leaderboard.refresh_student(session, id_number)
+            print("result registered successfully.")
+        else:
+            print("Error: result not registered.")
         return
     except:
         print("Error: result not registered.")
         return
 
+# PASSWORDS
+# users.password holds "pbkdf2_sha256$<iterations>$<salt>$<hash>" (salt and hash base64),
+# never the password itself. the iteration count is stored with every hash, login()
+# rehashes a password whose count is below PASSWORD_ITERATIONS.
+PASSWORD_ALGORITHM = "pbkdf2_sha256"
+PASSWORD_ITERATIONS = 200000
+PASSWORD_SALT_BYTES = 16
+LOGIN_USER = "SELECT user_id, password, role FROM users WHERE username=%s"
+
+def hash_password(password:str, iterations:int=PASSWORD_ITERATIONS, salt:bytes=None) -> str:
+    """a salted PBKDF2-SHA256 hash of password to store in users.password."""
+    salt = salt if salt != None else secrets.token_bytes(PASSWORD_SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "{}${}${}${}".format(PASSWORD_ALGORITHM, iterations, base64.b64encode(salt).decode(), base64.b64encode(digest).decode())
+
+def is_password_hash(stored) -> bool:
+    return isinstance(stored, str) and stored.startswith(PASSWORD_ALGORITHM + "$") and stored.count("$") == 3
+
+def verify_password(password:str, stored:str) -> bool:
+    """True if password matches the hash stored, in constant time."""
+    if not is_password_hash(stored):
+        return False
+    iterations, salt, digest = stored.split("$")[1:]
+    try:
+        expected = base64.b64decode(digest)
+        computed = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(computed, expected)
+
+@lru_cache(maxsize=1)
+def unknown_user_hash() -> str:
+    """compared against when the username does not exist, so an unknown user takes as long as a wrong password."""
+    return hash_password("", salt=b"\0" * PASSWORD_SALT_BYTES)
+
+@instrumented
+def hash_plaintext_passwords(session:'mysql.connector.connection_cext.CMySQLConnection', batch_size:int=BATCH_SIZE):
+    """
+    replaces every password of users that is not a hash yet by its hash_password(),
+    batch_size users per commit.\n
+    every hash costs PASSWORD_ITERATIONS rounds, they are computed by one thread
+    per CPU (hashlib releases the GIL while hashing).\n
+    returns the number of passwords hashed.
+    """
+    with open_cursor(session) as cursor:
+        cursor.execute("SELECT user_id, password FROM users ORDER BY user_id")
+        plaintext = [(user_id, password) for user_id, password in cursor.fetchall() if password != None and not is_password_hash(password)]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        for start in range(0, len(plaintext), batch_size):
+            batch = plaintext[start:start + batch_size]
+            hashes = executor.map(hash_password, [password for user_id, password in batch])
+            with open_cursor(session) as cursor:
+                # a password changed meanwhile is left alone
+                cursor.executemany("UPDATE users SET password = %s WHERE user_id = %s AND password = %s",
+                                   [(hashed, user_id, password) for hashed, (user_id, password) in zip(hashes, batch)])
+            session.commit()
+            print("hashed {} of {} passwords".format(start + len(batch), len(plaintext)))
+    return len(plaintext)
+
+@instrumented
+def set_password(session:'mysql.connector.connection_cext.CMySQLConnection', username:str, password:str):
+    """
+    stores the hash of a new password for username.\n
+    returns True if the user exists. the sessions of the user stay valid,
+    call SessionStore.revoke_user() to end them.
+    """
+    with open_cursor(session) as cursor:
+        cursor.execute("UPDATE users SET password = %s WHERE username = %s", (hash_password(password), username))
+        changed = cursor.rowcount
+    session.commit()
+    return changed > 0
+
+# a login is split in steps so the hashing (tens of milliseconds) runs without a connection:
+# login_user() reads the hash, check_login() and hash_password() need no connection and
+# rehash_password() writes the stronger hash. login() runs them on one session,
+# pooled_login() and login_async() hold a pooled connection only for the queries.
+@instrumented
+def login_user(session:'mysql.connector.connection_cext.CMySQLConnection', username:str):
+    """(user_id, password hash, role) of username, None if there is no such user."""
+    rows = fetch_prepared(session, LOGIN_USER, (username,))
+    return tuple(rows[0]) if rows else None
+
+def check_login(user, password:str) -> bool:
+    """True if password matches the hash of user from login_user(), takes as long for user None."""
+    return verify_password(password, user[1] if user else unknown_user_hash()) and user != None
+
+def needs_rehash(user) -> bool:
+    """True if the hash of user from login_user() has fewer than PASSWORD_ITERATIONS rounds."""
+    return int(user[1].split("$")[1]) < PASSWORD_ITERATIONS
+
+@instrumented
+def rehash_password(session:'mysql.connector.connection_cext.CMySQLConnection', user, password_hash:str):
+    """replaces the hash of user from login_user() by password_hash, unless the password changed meanwhile."""
+    with open_cursor(session) as cursor:
+        cursor.execute("UPDATE users SET password = %s WHERE user_id = %s AND password = %s", (password_hash, user[0], user[1]))
+    session.commit()
+
+@instrumented
 def login(session:'mysql.connector.connection_cext.CMySQLConnection', username:str, password:str):
-    command = """
-                SELECT username, password, role FROM users
-                WHERE username='{}' AND password='{}'
-                """.format(username, password)
-    
-    cursor = session.cursor()
-    cursor.execute("use {}".format(DB_NAME))
-    cursor.execute(command)
-    username_password = cursor.fetchone()
-    # print(username_password)
-    if username_password:
-        return username_password[2]
-    else:
+    """
+    checks password against the stored hash of username.\n
+    returns the role of the user, or False if the username or password is wrong.\n
+    the hash is checked while session is held, with a ConnectionPool use pooled_login().
+    """
+    user = login_user(session, username)
+    if not check_login(user, password):
+        return False
+    if needs_rehash(user):
+        rehash_password(session, user, hash_password(password))
+    return user[2]
+
+@instrumented
+def pooled_login(pool:ConnectionPool, username:str, password:str):
+    """login() that gives the connection back to pool while the password is hashed."""
+    with pool.connection() as session:
+        user = login_user(session, username)
+    if not check_login(user, password):
+        return False
+    if needs_rehash(user):
+        password_hash = hash_password(password)
+        with pool.connection() as session:
+            rehash_password(session, user, password_hash)
+    return user[2]
+
+# SESSIONS
+# a login is checked against the database once, after that a token stands for the user.
+# SessionStore keeps the identity of every token in memory, so checking a token costs
+# neither a query nor a hash. tokens expire SESSION_TTL seconds after login, and when
+# more than MAX_SESSIONS are open the least recently used one is dropped.
+SESSION_TTL = 8 * 3600
+MAX_SESSIONS = 100000
+SESSION_TOKEN_BYTES = 32
+
+Identity = namedtuple("Identity", ["username", "role", "created"])
+
+class SessionStore:
+    """
+    token = sessions.create("teacher_00001", "teacher")
+    sessions.get(token)          # Identity, or None if unknown, expired or revoked
+    sessions.revoke(token)
+    """
+    def __init__(self, max_sessions:int=MAX_SESSIONS, ttl:float=SESSION_TTL):
+        self.tokens = LRUCache(max_sessions, ttl)
+
+    def create(self, username:str, role:str) -> str:
+        token = secrets.token_urlsafe(SESSION_TOKEN_BYTES)
+        self.tokens.put(token, Identity(username, role, time.time()))
+        return token
+
+    def get(self, token:str):
+        if not token:
+            return None
+        return self.tokens.get(token)
+
+    def revoke(self, token:str):
+        if token:
+            self.tokens.invalidate(token)
+
+    def revoke_user(self, username:str) -> int:
+        """ends every session of username, returns how many there were."""
+        return self.tokens.invalidate_where(lambda token, identity: identity.username == username)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def stats(self) -> dict:
+        return self.tokens.stats()
+
+def authenticate(session:'mysql.connector.connection_cext.CMySQLConnection', sessions:SessionStore, username:str, password:str):
+    """login() that opens a session: returns (token, role), or None if the login failed."""
+    role = login(session, username, password)
+    if not role:
+        return None
+    return sessions.create(username, role), role
+
+def authorize(sessions:SessionStore, token:str, roles:tuple) -> Identity:
+    """the Identity of token if its role is one of roles, None otherwise."""
+    identity = sessions.get(token)
+    if identity == None or identity.role not in roles:
+        return None
+    return identity
+
+# ASYNC DATA ACCESS
+# the MySQL driver blocks, so the async functions run the normal data-access functions
+# in a small thread pool, each call with a pooled connection of its own.
+# time.monotonic() by which the current request of SchoolService has to be answered, None outside of a request
+REQUEST_DEADLINE = contextvars.ContextVar("request_deadline", default=None)
+
+class AsyncPool:
+    """
+    asyncio front end of a backend (MySQLBackend or SQLiteBackend) with its own ConnectionPool.\n
+    at most max_concurrency calls run at the same time (by default pool_size, one per connection),
+    every other call waits on a semaphore without holding a thread or a connection,
+    so thousands of concurrent lookups can share a few connections.\n
+    cancelling run() (asyncio.wait_for() of a timeout) can't stop a call that already runs in its
+    worker thread, the call keeps its connection until it returns. a call of a request whose
+    REQUEST_DEADLINE passed before it got a connection is dropped without running.\n
+    async with AsyncPool(backend) as db:
+        result = await fetch_result_async(db, "AB12345678")
+    """
+    def __init__(self, backend, pool_size:int=POOL_SIZE, max_concurrency:int=None):
+        self.pool = backend.create_pool(pool_size)
+        self.max_concurrency = max(1, max_concurrency or pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="school-db")
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def _call(self, function, args, kwargs, deadline:float=None):
+        # nobody waits for the result of a request that timed out while this call waited for a thread or connection
+        if deadline != None and time.monotonic() >= deadline:
+            raise asyncio.TimeoutError
+        with self.pool.connection() as session:
+            if deadline != None and time.monotonic() >= deadline:
+                raise asyncio.TimeoutError
+            return function(session, *args, **kwargs)
+
+    async def compute(self, function, *args):
+        """awaits function(*args) in a thread of the default executor, without a connection (password hashing)."""
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def run(self, function, *args, **kwargs):
+        """awaits function(session, *args, **kwargs) on a pooled connection in a worker thread."""
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._call, function, args, kwargs, REQUEST_DEADLINE.get())
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown, True)
+        self.pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+async def fetch_result_async(db:AsyncPool, id_number:str, subject_name:str=""):
+    """async fetch_result()."""
+    return await db.run(fetch_result, id_number, subject_name)
+
+async def total_ave_async(db:AsyncPool, id_number:str):
+    """async total_ave()."""
+    return await db.run(total_ave, id_number)
+
+async def fetch_ranking_async(db:AsyncPool, subject_name:str="", dense:bool=False):
+    """async fetch_ranking()."""
+    return await db.run(fetch_ranking, subject_name, dense)
+
+async def login_async(db:AsyncPool, username:str, password:str):
+    """async login(), returns the role or False. the password is hashed without holding a connection."""
+    user = await db.run(login_user, username)
+    if not await db.compute(check_login, user, password):
         return False
+    if needs_rehash(user):
+        password_hash = await db.compute(hash_password, password)
+        await db.run(rehash_password, user, password_hash)
+    return user[2]
+
+async def register_result_async(db:AsyncPool, id_number:str, subject_name:str, points:str):
+    """async insert_results(), returns True if the result was registered."""
+    return await db.run(insert_results, id_number, subject_name, points)
+
+# SHARDING
+# one database per school. a shard is a MySQL server (or a directory of SQLite files)
+# holding the databases of many schools, ShardRouter knows which school is on which shard
+# and sends every operation to the database of its school.
+SCHOOL_KEY = re.compile(r"^[A-Za-z0-9_]{1,40}$")
+
+def check_school(school:str) -> str:
+    # the key becomes part of a database name, so it is never taken as it comes
+    if not isinstance(school, str) or not SCHOOL_KEY.match(school):
+        raise ValueError("school key must be 1 to 40 letters, digits or _: {!r}".format(school))
+    return school
+
+class MySQLShard:
+    """a MySQL server, the database of school "x" is school_x."""
+    def __init__(self, host:str, username:str, password:str, prefix:str="school_"):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.prefix = prefix
+
+    def backend(self, school:str):
+        return MySQLBackend(self.host, self.username, self.password, self.prefix + check_school(school))
+
+class SQLiteShard:
+    """a directory of SQLite files school_x.db, or one in memory database per school if directory is None."""
+    def __init__(self, directory:str=None):
+        self.directory = directory
+
+    def backend(self, school:str):
+        check_school(school)
+        if self.directory == None:
+            return SQLiteBackend()
+        return SQLiteBackend("{}/school_{}.db".format(self.directory.rstrip("/"), school))
+
+SchoolRank = namedtuple("SchoolRank", ["rank", "school", "id_number", "total_average", "subject_count"])
+
+class ShardRouter:
+    """
+    routes the operations of a school to its database.\n
+    router = ShardRouter({"db1": MySQLShard("db1.local", "root", "pw"), "db2": MySQLShard("db2.local", "root", "pw")})
+    router.add_school("oak_hill")          # placed by hash and bootstrapped
+    router.fetch_result("oak_hill", "AB12345678")
+    with router.connection("oak_hill") as session:
+        show_student_result(session, "AB12345678")\n
+    a school without an explicit shard is placed by rendezvous hashing of its key, so adding
+    a shard only moves new schools, never the ones already placed.
+    """
+    def __init__(self, shards:dict, pool_size:int=POOL_SIZE, max_parallel:int=16):
+        if not shards:
+            raise ValueError("at least one shard is needed")
+        self.shards = shards
+        self.pool_size = pool_size
+        self.max_parallel = max_parallel
+        self.schools = {}   # school -> shard name
+        self.backends = {}  # school -> backend
+        self.pools = {}     # school -> ConnectionPool, opened on first use
+        self.lock = threading.Lock()
+
+    def place(self, school:str) -> str:
+        """the shard a new school goes to (highest hash of shard and school)."""
+        return max(self.shards, key=lambda shard: hashlib.sha1("{}/{}".format(shard, school).encode()).digest())
+
+    def add_school(self, school:str, shard:str=None, bootstrap:bool=True) -> str:
+        """
+        registers school on shard (default: place()) and, if bootstrap is True, creates its
+        database, tables, triggers and function. returns the shard name.
+        """
+        check_school(school)
+        shard = shard or self.place(school)
+        if shard not in self.shards:
+            raise KeyError("unknown shard: {}".format(shard))
+        with self.lock:
+            if school in self.schools:
+                return self.schools[school]
+        # the school is routed only once its schema exists, a failed bootstrap leaves it unknown
+        backend = self.shards[shard].backend(school)
+        try:
+            if bootstrap:
+                backend.bootstrap()
+        except BaseException:
+            if isinstance(backend, SQLiteBackend):
+                backend.close()
+            raise
+        with self.lock:
+            if school not in self.schools:
+                self.schools[school] = shard
+                self.backends[school] = backend
+                return shard
+            # added by another thread meanwhile
+            shard = self.schools[school]
+        if isinstance(backend, SQLiteBackend):
+            backend.close()
+        return shard
+
+    def shard_of(self, school:str) -> str:
+        if school not in self.schools:
+            raise KeyError("unknown school: {}".format(school))
+        return self.schools[school]
+
+    def pool(self, school:str) -> ConnectionPool:
+        self.shard_of(school)
+        with self.lock:
+            pool = self.pools.get(school)
+            if pool == None:
+                pool = self.pools[school] = self.backends[school].create_pool(self.pool_size)
+            return pool
+
+    @contextmanager
+    def connection(self, school:str):
+        with self.pool(school).connection() as session:
+            yield session
+
+    def run(self, school:str, function, *args, **kwargs):
+        """function(session, *args, **kwargs) on the database of school."""
+        with self.connection(school) as session:
+            return function(session, *args, **kwargs)
+
+    def scatter(self, function, *args, schools:list=None, **kwargs) -> dict:
+        """runs function(session, *args, **kwargs) on every school (or the given ones) in parallel, returns {school: result}."""
+        schools = list(self.schools) if schools == None else schools
+        if not schools:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(schools))) as executor:
+            futures = {school: executor.submit(self.run, school, function, *args, **kwargs) for school in schools}
+            return {school: future.result() for school, future in futures.items()}
+
+    def fetch_result(self, school:str, id_number:str, subject_name:str=""):
+        return self.run(school, fetch_result, id_number, subject_name)
+
+    def insert_results(self, school:str, id_number:str, subject_name:str, points:str):
+        return self.run(school, insert_results, id_number, subject_name, points)
+
+    def total_ave(self, school:str, id_number:str):
+        return self.run(school, total_ave, id_number)
+
+    def login(self, school:str, username:str, password:str):
+        return self.run(school, login, username, password)
+
+    def fetch_ranking(self, school:str, subject_name:str="", dense:bool=False):
+        return self.run(school, fetch_ranking, subject_name, dense)
+
+    def fetch_ranking_all(self, subject_name:str="", dense:bool=False, limit:int=None) -> list:
+        """
+        ranks the students of all schools together (scatter-gather) as SchoolRank tuples,
+        students with the same rounded average share a rank like in fetch_ranking().\n
+        with limit only the best limit students are returned, and every school
+        only sends its best limit students.
+        """
+        if limit != None and limit <= MAX_PAGE_SIZE:
+            pages = self.scatter(fetch_ranking_page, subject_name, dense, page_size=limit)
+            rankings = {school: page.rows for school, page in pages.items()}
+        else:
+            rankings = self.scatter(fetch_ranking, subject_name, dense)
+
+        rows = [(school, row) for school, ranking in rankings.items() for row in ranking]
+        ranked = sorted((item for item in rows if item[1].rank != None),
+                        key=lambda item: (-item[1].total_average, item[0], item[1].id_number))
+        unranked = sorted((item for item in rows if item[1].rank == None), key=lambda item: (item[0], item[1].id_number))
+
+        merged = []
+        rank = 0
+        previous = None
+        for position, (school, row) in enumerate(ranked, 1):
+            if row.total_average != previous:
+                rank = rank + 1 if dense else position
+                previous = row.total_average
+            merged.append(SchoolRank(rank, school, row.id_number, row.total_average, row.subject_count))
+        merged.extend(SchoolRank(None, school, row.id_number, None, 0) for school, row in unranked)
+        return merged[:limit] if limit != None else merged
+
+    def close(self):
+        with self.lock:
+            pools, self.pools = list(self.pools.values()), {}
+            backends = list(self.backends.values())
+        for pool in pools:
+            pool.close()
+        for backend in backends:
+            if hasattr(backend, "close"):
+                backend.close()
+
+# SERVICE
+# JSON lines over TCP, one request or response per line:
+#   -> {"id": 1, "op": "login", "args": {"username": "...", "password": "..."}}
+#   <- {"id": 1, "ok": true, "result": {"role": "teacher", "token": "..."}}
+#   -> {"id": 2, "op": "show", "args": {"id_number": "...", "subject_name": ""}}
+#   <- {"id": 2, "ok": false, "error": "timeout"}
+# a client may send many requests without waiting (pipelining), the responses come back
+# as they finish and are matched by id. login and logout are handled in order, every
+# other request of a connection runs concurrently on the AsyncPool.
+# after a login the connection acts with the session of its token; a request on another
+# connection (or another service sharing the SessionStore) passes the token in "args".
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+REQUEST_TIMEOUT = 10        # seconds per request
+MAX_PIPELINE = 32           # requests in flight per client connection
+MAX_REQUEST_SIZE = 64 * 1024
+
+# operation: roles allowed to run it
+SERVICE_ROLES = {
+    "rank": ("teacher",),
+    "show": ("teacher", "parent"),
+    "register": ("teacher",),
+}
+
+class ServiceError(Exception):
+    """a request the service refused or could not answer, the message is sent to the client."""
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+class SchoolService:
+    """
+    multi-client front end of the teacher and parent operations.\n
+    service = SchoolService(MySQLBackend("localhost", "root", "longpassword"))
+    asyncio.run(service.serve_forever())\n
+    port 0 picks a free port, service.port holds the real one after start().
+    sessions is the SessionStore of the logins, by default one of its own.
+    """
+    def __init__(self, backend, host:str=SERVICE_HOST, port:int=SERVICE_PORT, pool_size:int=POOL_SIZE, max_concurrency:int=None,
+                 request_timeout:float=REQUEST_TIMEOUT, max_pipeline:int=MAX_PIPELINE, sessions:SessionStore=None):
+        self.backend = backend
+        self.sessions = sessions if sessions != None else SessionStore()
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.max_pipeline = max_pipeline
+        self.db = None
+        self.server = None
+
+    async def start(self):
+        self.db = AsyncPool(self.backend, self.pool_size, self.max_concurrency)
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, limit=MAX_REQUEST_SIZE)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self.server == None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.server != None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.db != None:
+            await self.db.close()
+            self.db = None
+
+    async def dispatch(self, client:dict, op:str, args:dict):
+        """runs one operation for a client, client["token"] is the session token of its login."""
+        if op == "login":
+            username = str(args.get("username", ""))
+            role = await login_async(self.db, username, str(args.get("password", "")))
+            if not role:
+                client["token"] = None
+                return False
+            client["token"] = self.sessions.create(username, role)
+            return {"role": role, "token": client["token"]}
+        token = str(args.get("token") or client["token"] or "")
+        if op == "logout":
+            self.sessions.revoke(token)
+            client["token"] = None
+            return True
+        if op not in SERVICE_ROLES:
+            raise ServiceError("unknown operation: {}".format(op))
+        identity = self.sessions.get(token)
+        if identity == None and token:
+            raise ServiceError("session expired")
+        if identity == None or identity.role not in SERVICE_ROLES[op]:
+            raise ServiceError("not allowed")
+
+        if op == "rank":
+            ranking = await fetch_ranking_async(self.db, str(args.get("subject_name", "")), bool(args.get("dense", False)))
+            return [row._asdict() for row in ranking]
+        if op == "show":
+            return await fetch_result_async(self.db, str(args.get("id_number", "")), str(args.get("subject_name", "")))
+        if op == "register":
+            return await register_result_async(self.db, str(args.get("id_number", "")), str(args.get("subject_name", "")), str(args.get("points", "")))
+
+    async def _respond(self, client:dict, request_id, op:str, args:dict, writer, write_lock, in_flight=None):
+        response = {"id": request_id}
+        # the worker threads check it, wait_for() alone only stops waiting for them
+        REQUEST_DEADLINE.set(time.monotonic() + self.request_timeout)
+        try:
+            response["result"] = await asyncio.wait_for(self.dispatch(client, op, args), self.request_timeout)
+            response["ok"] = True
+        except asyncio.TimeoutError:
+            response.update(ok=False, error="timeout")
+        except ServiceError as e:
+            response.update(ok=False, error=str(e))
+        except (Error, PoolError) as e:
+            print("service: {} failed: {}".format(op, e), file=sys.stderr)
+            response.update(ok=False, error="database error")
+        except Exception as e:
+            # every request id gets an answer, a client without a timeout would wait for it forever
+            print("service: {} failed: {!r}".format(op, e), file=sys.stderr)
+            response.update(ok=False, error="internal error")
+        finally:
+            if in_flight != None:
+                in_flight.release()
+        try:
+            line = (json.dumps(response, default=json_value) + "\n").encode()
+        except (TypeError, ValueError) as e:
+            print("service: {} returned a result that is not JSON: {}".format(op, e), file=sys.stderr)
+            await self._respond_error(writer, write_lock, request_id, "internal error")
+            return
+        async with write_lock:
+            try:
+                writer.write(line)
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def _handle_client(self, reader, writer):
+        client = {"token": None}
+        write_lock = asyncio.Lock()
+        in_flight = asyncio.Semaphore(self.max_pipeline)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    await self._respond_error(writer, write_lock, None, "request too large")
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    request_id, op, args = request.get("id"), request.get("op"), request.get("args") or {}
+                    if not isinstance(args, dict):
+                        raise ValueError("args must be an object")
+                except (ValueError, AttributeError) as e:
+                    await self._respond_error(writer, write_lock, None, "bad request: {}".format(e))
+                    continue
+
+                if op in ("login", "logout"):
+                    # later requests of this connection depend on the role, so wait for the requests
+                    # already in flight and answer the login before reading the next line
+                    if tasks:
+                        await asyncio.gather(*tasks, return_exceptions=True)
+                    await self._respond(client, request_id, op, args, writer, write_lock)
+                    continue
+                await in_flight.acquire()
+                task = asyncio.create_task(self._respond(client, request_id, op, args, writer, write_lock, in_flight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _respond_error(self, writer, write_lock, request_id, error:str):
+        async with write_lock:
+            try:
+                writer.write((json.dumps({"id": request_id, "ok": False, "error": error}) + "\n").encode())
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+def serve(backend, host:str=SERVICE_HOST, port:int=SERVICE_PORT, **kwargs):
+    """runs a SchoolService in the foreground until interrupted."""
+    service = SchoolService(backend, host, port, **kwargs)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+def start_service_thread(backend, host:str=SERVICE_HOST, port:int=SERVICE_PORT, **kwargs):
+    """
+    runs a SchoolService on its own event loop in a daemon thread and returns it once it listens.
+    """
+    service = SchoolService(backend, host, port, **kwargs)
+    started = threading.Event()
+    failure = []
+
+    async def run():
+        try:
+            await service.start()
+        except BaseException as e:
+            failure.append(e)
+            started.set()
+            return
+        started.set()
+        await service.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(run(),), name="school-service", daemon=True).start()
+    started.wait()
+    if failure:
+        raise failure[0]
+    return service
+
+class ServiceClient:
+    """
+    blocking client of a SchoolService.\n
+    call() sends one request and waits for its response; send() and receive() pipeline
+    many requests on one connection, responses are matched by id.\n
+    token continues the session of an earlier login(), every request carries it.
+    """
+    def __init__(self, host:str=SERVICE_HOST, port:int=SERVICE_PORT, timeout:float=None, token:str=None):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.file = self.socket.makefile("rwb")
+        self.next_id = 0
+        self.pending = {}
+        self.token = token
+
+    def send(self, op:str, **args):
+        """sends a request without waiting, returns its id."""
+        if self.token and op not in ("login", "logout"):
+            args.setdefault("token", self.token)
+        self.next_id += 1
+        self.file.write((json.dumps({"id": self.next_id, "op": op, "args": args}) + "\n").encode())
+        self.file.flush()
+        return self.next_id
+
+    def receive(self, request_id:int):
+        """waits for the response of request_id, responses of other requests are kept for later."""
+        while request_id not in self.pending:
+            line = self.file.readline()
+            if not line:
+                raise ConnectionError("service closed the connection")
+            response = json.loads(line)
+            self.pending[response.get("id")] = response
+        return self.pending.pop(request_id)
+
+    def call(self, op:str, **args):
+        response = self.receive(self.send(op, **args))
+        if not response["ok"]:
+            raise ServiceError(response["error"])
+        return response["result"]
+
+    def login(self, username:str, password:str):
+        """returns the role of the user, or False if the login failed."""
+        session = self.call("login", username=username, password=password)
+        self.token = session["token"] if session else None
+        return session["role"] if session else False
+
+    def logout(self):
+        self.call("logout", token=self.token or "")
+        self.token = None
+
+    def ranking(self, subject_name:str="", dense:bool=False):
+        return [StudentRank(**row) for row in self.call("rank", subject_name=subject_name, dense=dense)]
+
+    def student_result(self, id_number:str, subject_name:str=""):
+        return self.call("show", id_number=id_number, subject_name=subject_name)
+
+    def register_result(self, id_number:str, subject_name:str, points:str):
+        return self.call("register", id_number=id_number, subject_name=subject_name, points=points)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
 
 # RUN ############################################
-def main():
-    session = connect_db("localhost", "root", "longpassword")
-    cursor = session.cursor()
+def main(host:str=SERVICE_HOST, port:int=SERVICE_PORT):
+    """
+    interactive menu, a thin client of the service at host:port.
+    if no service is running there, one is started in this process.
+    """
+    try:
+        client = ServiceClient(host, port)
+    except OSError:
+        service = start_service_thread(MySQLBackend("localhost", "root", "longpassword"), host, port)
+        client = ServiceClient(host, service.port)
     print("\nWellcome to School data base")
     while(True):
         username = input("User name: ")
         password = input("password: ")
-        loggedin = login(session, username, password)
+        try:
+            loggedin = client.login(username, password)
+        except ServiceError as e:
+            print("Error: {}".format(e))
+            loggedin = False
         if loggedin != False:
             print("role: {}".format(loggedin))
             while(True):
                 print("\nChoose options below:")
-                if loggedin == "teacher":
-                    print("1: show students rank.\n2: show student points\n3: register points.\n4: Exit")
-                    choice = input("option: ")
-                    if choice == '1':
-                        rank_students(session)
-                        continue
-                    elif choice == '2':
-                        id_number = input("student id number: ")
-                        subject_name = input("subject name. (Optional): ")
-                        show_student_result(session, id_number, subject_name)
-                        continue
-                    elif choice == '3':
-                        id_number = input("student id number: ")
-                        subject_name = input("subject name: ")
-                        points = input("points: ")
-                        register_result(session, id_number, subject_name, points)
-                        continue
-                    elif choice == '4':
-                        break
-                elif loggedin == "parent":
-                    print("1: show student points.\n2: Exit.")
-                    choice = input("option: ")
-                    if choice == '1':
-                        id_number = input("student id number: ")
-                        subject_name = input("subject name. (Optional): ")
-                        show_student_result(session, id_number, subject_name)
-                        continue
-                    elif choice == '2':
-                        break
-                    else:
-                        print("unrecognized choice")
-                        continue
+                try:
+                    if loggedin == "teacher":
+                        print("1: show students rank.\n2: show student points\n3: register points.\n4: Exit")
+                        choice = input("option: ")
+                        if choice == '1':
+                            print_ranking(client.ranking())
+                            continue
+                        elif choice == '2':
+                            id_number = input("student id number: ")
+                            subject_name = input("subject name. (Optional): ")
+                            print_student_result(client.student_result(id_number, subject_name))
+                            continue
+                        elif choice == '3':
+                            id_number = input("student id number: ")
+                            subject_name = input("subject name: ")
+                            points = input("points: ")
+                            if client.register_result(id_number, subject_name, points):
+                                print("result registered successfully.")
+                            else:
+                                print("Error: result not registered.")
+                            continue
+                        elif choice == '4':
+                            client.logout()
+                            break
+                    elif loggedin == "parent":
+                        print("1: show student points.\n2: Exit.")
+                        choice = input("option: ")
+                        if choice == '1':
+                            id_number = input("student id number: ")
+                            subject_name = input("subject name. (Optional): ")
+                            print_student_result(client.student_result(id_number, subject_name))
+                            continue
+                        elif choice == '2':
+                            client.logout()
+                            break
+                        else:
+                            print("unrecognized choice")
+                            continue
+                except ServiceError as e:
+                    print("Error: {}".format(e))
+                    continue
                 
         else:
             print("login unsuccessful")
@@ -638,17 +4530,41 @@ def main():
 
 #-----------------------------------------------------------------------#
 # CREATE AND POPULATE DATABASE                                          #
+# MySQLBackend("localhost", "root", "longpassword").bootstrap()         #
+# or step by step:                                                      #
 # session = connect_db("localhost", "root", "longpassword")             #
 # create_databases(session, DB_NAME)                                    #
 # create_table_users(session)                                           #
 # create_table_students(session)                                        #
 # create_table_subjects(session)                                        #
 # create_table_results(session)                                         #
+# create_table_student_stats(session)                                   #
 # trigger_percent_results(session)                                      #
+# trigger_student_stats(session)                                        #
 # populate_database(session)                                            #
 # create_function_total_avg(session)                                    #
 # populate_results_table(session, 200)                                  #
+# rebuild_student_stats(session) / verify_student_stats(session)        #
+# migrate(session) / check_query_plans(session)                         #
 #-----------------------------------------------------------------------#
 
 # RUN TERMINAL PROGRAM
-main()
+# python final_project.py serve          starts the service
+# python final_project.py migrate [N]    brings the schema to migration N (default: the latest)
+# python final_project.py check-plans    EXPLAIN of the hot queries, fails on a full table scan
+# python final_project.py archive [DATE] moves the terms that ended before DATE (default: today) to ARCHIVE_DIR
+# python final_project.py                menu, connects to the running service
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["serve"]:
+        serve(MySQLBackend("localhost", "root", "longpassword"))
+    elif sys.argv[1:2] == ["migrate"]:
+        session = MySQLBackend("localhost", "root", "longpassword").connect()
+        print("schema version: {}".format(migrate(session, int(sys.argv[2]) if len(sys.argv) > 2 else None)))
+    elif sys.argv[1:2] == ["check-plans"]:
+        session = MySQLBackend("localhost", "root", "longpassword").connect()
+        sys.exit(1 if check_query_plans(session) else 0)
+    elif sys.argv[1:2] == ["archive"]:
+        session = MySQLBackend("localhost", "root", "longpassword").connect()
+        print("{} results archived".format(archive_closed_terms(session, sys.argv[2] if len(sys.argv) > 2 else None)))
+    else:
+        main()
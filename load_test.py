@@ -0,0 +1,273 @@
+"""
+load test for final_project.py
+
+simulates concurrent teachers and parents running the flows of the menu in
+main(): teachers rank students, show points and register points, parents
+show the points of their child. every virtual user is a thread that logs in
+once and then runs operations picked by the weights of its profile, with a
+random think time in between. the functions of the module are called
+directly on pooled connections.
+
+    python load_test.py
+    python load_test.py --profile exam_week --teachers 20 --parents 200 --duration 30 --output after.json
+    python load_test.py --baseline before.json          # run and compare with an earlier report
+    python load_test.py --compare before.json after.json
+
+the report has throughput, p50/p95/p99 latency and error rate per operation.
+"""
+import argparse
+import bisect
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import final_project as fp
+from benchmark import git_commit, percentile
+
+
+# weights of the operations of every role, think time between operations and data skew:
+# student_skew is the zipf exponent of the students teachers look at (0 = uniform),
+# hot_subjects the share of subjects that get the grades (exam week: a few exams at once)
+PROFILES = {
+    "normal": {
+        "teacher": {"rank": 2, "show": 5, "register": 3},
+        "parent": {"show": 1},
+        "think_ms": 500,
+        "student_skew": 0.0,
+        "hot_subjects": 1.0,
+    },
+    "exam_week": {
+        "teacher": {"rank": 1, "show": 2, "register": 7},
+        "parent": {"show": 1},
+        "think_ms": 100,
+        "student_skew": 0.8,
+        "hot_subjects": 0.1,
+    },
+}
+
+class SkewedChoice:
+    """picks index i of n with a probability proportional to 1 / (i + 1) ** skew."""
+    def __init__(self, n:int, skew:float):
+        self.cumulative = []
+        total = 0.0
+        for i in range(n):
+            total += 1.0 / (i + 1) ** skew
+            self.cumulative.append(total)
+
+    def pick(self, rng:random.Random) -> int:
+        return min(len(self.cumulative) - 1, bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1]))
+
+class Recorder:
+    """latencies and errors per operation, every thread writes to its own lists."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def thread_recorder(self):
+        samples, errors = {}, {}
+        with self.lock:
+            self.samples[threading.get_ident()] = samples
+            self.errors[threading.get_ident()] = errors
+        def record(operation:str, seconds:float, failed:bool):
+            samples.setdefault(operation, []).append(seconds)
+            if failed:
+                errors[operation] = errors.get(operation, 0) + 1
+        return record
+
+    def merged(self):
+        samples, errors = {}, {}
+        with self.lock:
+            for thread_samples in self.samples.values():
+                for operation, values in thread_samples.items():
+                    samples.setdefault(operation, []).extend(values)
+            for thread_errors in self.errors.values():
+                for operation, count in thread_errors.items():
+                    errors[operation] = errors.get(operation, 0) + count
+        return samples, errors
+
+def summarize(samples:list, errors:int, duration:float):
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throughput": len(samples) / duration if duration else None,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+def make_backend(options):
+    if options.backend == "mysql":
+        return fp.MySQLBackend(options.host, options.user, options.password, options.database)
+    # a file: an in memory database locks the whole table for every writer
+    path = options.sqlite_path or os.path.join(tempfile.mkdtemp(prefix="school_load_"), "load.db")
+    return fp.SQLiteBackend(path)
+
+def virtual_user(role:str, index:int, options, profile:dict, pool, record, stop_at:float, seed:int, students:SkewedChoice):
+    rng = random.Random(seed)
+    operations = list(profile[role])
+    weights = [profile[role][operation] for operation in operations]
+    hot_subjects = max(1, int(options.subjects * profile["hot_subjects"]))
+    if role == "teacher":
+        user_index = index % max(1, options.subjects // 5)
+        username, password = "teacher_{:05d}".format(user_index), "password{}".format(user_index)
+    else:
+        user_index = index % options.students
+        username, password = "parent_{:06d}".format(user_index), "password{}".format(user_index)
+    child = "ST{:08d}".format(user_index)
+
+    def timed(operation:str, call):
+        failed = True
+        start = time.perf_counter()
+        try:
+            failed = call() == False
+        except Exception:
+            pass
+        record(operation, time.perf_counter() - start, failed)
+
+    def run(operation:str, function, *args):
+        def call():
+            with pool.connection() as session:
+                return function(session, *args)
+        timed(operation, call)
+
+    # the password is hashed without holding a connection, like the service does
+    timed("login", lambda: fp.pooled_login(pool, username, password))
+    while time.monotonic() < stop_at:
+        operation = rng.choices(operations, weights)[0]
+        if operation == "rank":
+            run("rank", fp.fetch_ranking)
+        elif operation == "show":
+            id_number = child if role == "parent" else "ST{:08d}".format(students.pick(rng))
+            subject_name = "" if rng.random() < 0.7 else "Subject {:04d}".format(rng.randrange(options.subjects))
+            run("show", fp.fetch_result, id_number, subject_name)
+        elif operation == "register":
+            run("register", fp.insert_results, "ST{:08d}".format(students.pick(rng)),
+                "Subject {:04d}".format(rng.randrange(hot_subjects)), str(rng.randint(0, 50)))
+        think_ms = options.think_ms if options.think_ms != None else profile["think_ms"]
+        if think_ms > 0:
+            time.sleep(min(rng.expovariate(1000.0 / think_ms), max(0, stop_at - time.monotonic())))
+
+def run_load(options):
+    profile = PROFILES[options.profile]
+    backend = make_backend(options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend.bootstrap()
+    pool = backend.create_pool(options.pool_size)
+    with pool.connection() as session:
+        with fp.open_cursor(session) as cursor:
+            cursor.execute("SELECT COUNT(*) FROM students")
+            empty = cursor.fetchone()[0] == 0
+        if empty:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fp.populate_synthetic_data(session, students=options.students, subjects=options.subjects,
+                                           results=options.results, seed=options.seed)
+
+    students = SkewedChoice(options.students, profile["student_skew"] if options.skew == None else options.skew)
+    recorder = Recorder()
+    start = time.monotonic()
+    stop_at = start + options.duration
+    threads = []
+    users = [("teacher", i) for i in range(options.teachers)] + [("parent", i) for i in range(options.parents)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n, (role, index) in enumerate(users):
+            thread = threading.Thread(target=lambda role=role, index=index, n=n: virtual_user(
+                role, index, options, profile, pool, recorder.thread_recorder(), stop_at, options.seed * 100003 + n, students))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+    duration = time.monotonic() - start
+    pool.close()
+    if options.backend == "sqlite":
+        backend.close()
+
+    samples, errors = recorder.merged()
+    return {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": options.backend,
+        "profile": options.profile,
+        "teachers": options.teachers,
+        "parents": options.parents,
+        "duration_s": duration,
+        "data": {"students": options.students, "subjects": options.subjects, "results": options.results},
+        "operations": {operation: summarize(values, errors.get(operation, 0), duration) for operation, values in sorted(samples.items())},
+    }
+
+def print_report(report:dict):
+    print("{} users ({} teachers, {} parents), profile {}, {:.1f} s on {}".format(
+        report["teachers"] + report["parents"], report["teachers"], report["parents"], report["profile"],
+        report["duration_s"], report["backend"]))
+    print("Operation\tCount\tOps/s\tErrors\tp50 ms\tp95 ms\tp99 ms\tMax ms")
+    for operation, stats in report["operations"].items():
+        print("{}\t\t{}\t{:.1f}\t{:.2%}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}".format(
+            operation, stats["count"], stats["throughput"], stats["error_rate"],
+            stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["max_ms"]))
+
+def print_comparison(before:dict, after:dict):
+    """throughput and latency of after relative to before, per operation."""
+    print("comparing {} ({}) with {} ({})".format(before.get("commit"), before.get("started"), after.get("commit"), after.get("started")))
+    print("Operation\tOps/s\t\t\tp50 ms\t\t\tp95 ms\t\t\tp99 ms\t\t\tErrors")
+    def change(old, new):
+        return "{:.2f} -> {:.2f} ({:+.0%})".format(old, new, (new - old) / old if old else 0)
+    for operation in sorted(set(before["operations"]) & set(after["operations"])):
+        old, new = before["operations"][operation], after["operations"][operation]
+        print("{}\t\t{}\t{}\t{}\t{}\t{:.2%} -> {:.2%}".format(
+            operation, change(old["throughput"], new["throughput"]), change(old["p50_ms"], new["p50_ms"]),
+            change(old["p95_ms"], new["p95_ms"]), change(old["p99_ms"], new["p99_ms"]), old["error_rate"], new["error_rate"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="replay concurrent teacher and parent workloads against final_project.py")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="normal")
+    parser.add_argument("--teachers", type=int, default=5)
+    parser.add_argument("--parents", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--think-ms", type=float, default=None, help="mean think time, default from the profile")
+    parser.add_argument("--skew", type=float, default=None, help="zipf exponent of the students teachers pick, default from the profile")
+    parser.add_argument("--pool-size", type=int, default=fp.POOL_SIZE)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--subjects", type=int, default=50)
+    parser.add_argument("--results", type=int, default=40000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--sqlite-path", default="", help="default: a new file in a temporary directory")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="school_load_test", help="used as it is if it already has students")
+    parser.add_argument("--output", default="", help="write the JSON report to this file")
+    parser.add_argument("--baseline", default="", help="JSON report of an earlier run to compare with")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="only compare two JSON reports")
+    options = parser.parse_args(argv)
+
+    if options.compare:
+        with open(options.compare[0]) as before, open(options.compare[1]) as after:
+            print_comparison(json.load(before), json.load(after))
+        return
+
+    print("running {} for {} s ...".format(options.profile, options.duration), file=sys.stderr)
+    report = run_load(options)
+    print_report(report)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(json.dumps(report, indent=2) + "\n")
+    if options.baseline:
+        with open(options.baseline) as file:
+            print_comparison(json.load(file), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+tests of final_project.py on SQLite, no MySQL server needed.\n
+    python -m unittest test_final_project
+"""
+import contextlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import final_project as fp
+
+
+class SQLiteTestCase(unittest.TestCase):
+    """a new SQLite database in a temporary directory with a small synthetic school for every test."""
+    students = 50
+    subjects = 4
+    results = 150
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="school_test_")
+        self.backend = fp.SQLiteBackend(os.path.join(self.directory, "school.db"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.backend.bootstrap()
+        self.pool = self.backend.create_pool(2)
+        self.session = self.pool.acquire()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fp.populate_synthetic_data(self.session, students=self.students, subjects=self.subjects, results=self.results)
+        fp.clear_reference_cache()
+        fp.invalidate_results(self.session)
+
+    def tearDown(self):
+        self.pool.release(self.session)
+        self.pool.close()
+        self.backend.close()
+        fp.close_archives()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def query(self, command:str, params=()) -> list:
+        with fp.open_cursor(self.session) as cursor:
+            cursor.execute(command, params)
+            return cursor.fetchall()
+
+    def execute(self, command:str, params=()):
+        with fp.open_cursor(self.session) as cursor:
+            cursor.execute(command, params)
+        self.session.commit()
+
+
+class ArchiveTermTest(SQLiteTestCase):
+    def closed_term(self):
+        return fp.closed_terms(self.session, "2100-01-01")[0]
+
+    def test_archive_term_moves_results(self):
+        start_date, end_date = self.closed_term()
+        before = fp.total_ave(self.session, "ST00000003")
+        count = fp.archive_term(self.session, start_date, end_date, self.directory)
+        self.assertGreater(count, 0)
+        self.assertEqual(len(fp.archived_terms(self.session)), 1)
+        self.assertEqual(fp.total_ave(self.session, "ST00000003"), before)
+
+    def test_update_while_archiving_deletes_nothing(self):
+        start_date, end_date = self.closed_term()
+        result_id, points = self.query("""
+                SELECT results.result_id, results.points
+                FROM results INNER JOIN subjects
+                ON results.subject_id = subjects.subject_id
+                WHERE subjects.start_date = %s AND subjects.end_date = %s
+                ORDER BY results.result_id LIMIT 1
+                """, (start_date, end_date))[0]
+        write_archive = fp.write_archive
+        other_pool = self.backend.create_pool(1)
+
+        def update_after_write(*args):
+            # another teacher corrects a grade after the rows were read, before they are deleted
+            write_archive(*args)
+            with other_pool.connection() as other:
+                with fp.open_cursor(other) as cursor:
+                    cursor.execute("UPDATE results SET points = %s WHERE result_id = %s", (points + 1, result_id))
+                other.commit()
+
+        try:
+            with mock.patch.object(fp, "write_archive", update_after_write), contextlib.redirect_stdout(io.StringIO()):
+                count = fp.archive_term(self.session, start_date, end_date, self.directory)
+        finally:
+            other_pool.close()
+        self.assertEqual(count, None)
+        self.assertEqual(self.query("SELECT points FROM results WHERE result_id = %s", (result_id,)), [(points + 1,)])
+        self.assertEqual(fp.archived_terms(self.session), [])
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".col")], [])
+
+
+
+class InsertResultsTest(SQLiteTestCase):
+    def test_invalid_points_are_rejected(self):
+        before = self.query("SELECT COUNT(*), SUM(points) FROM results")
+        with contextlib.redirect_stdout(io.StringIO()):
+            for points in ("abc", "", "-1", "4.5", None, "1000"):
+                self.assertFalse(fp.insert_results(self.session, "ST00000001", "Subject 0001", points), points)
+        self.assertEqual(self.query("SELECT COUNT(*), SUM(points) FROM results"), before)
+
+    def test_points_are_stored_as_numbers(self):
+        self.assertTrue(fp.insert_results(self.session, "ST00000001", "Subject 0001", " 7 "))
+        rows = self.query("""
+                SELECT results.points FROM results
+                INNER JOIN students ON students.student_id = results.student_id
+                INNER JOIN subjects ON subjects.subject_id = results.subject_id
+                WHERE students.id_number = %s AND subjects.subject_name = %s
+                """, ("ST00000001", "Subject 0001"))
+        self.assertEqual(rows, [(7,)])
+        self.assertIsInstance(rows[0][0], int)
+
+    def test_import_grades_checks_the_range(self):
+        outcomes = fp.import_grades(self.session, [("ST00000001", "Subject 0001", "5"), ("ST00000002", "Subject 0001", "1000")])
+        self.assertEqual([outcome.status for outcome in outcomes], ["written", "invalid points"])
+
+
+class ResultCacheTest(SQLiteTestCase):
+    id_number = "ST00000001"
+
+    def keys(self):
+        student_id = self.query("SELECT student_id FROM students WHERE id_number = %s", (self.id_number,))[0][0]
+        subject_id, total_points = self.query("SELECT subject_id, total_points FROM subjects WHERE subject_name = %s", ("Subject 0001",))[0]
+        return student_id, subject_id, total_points
+
+    def assert_cached_then_fresh(self, write):
+        """a read before write is cached, the read after it sees the write."""
+        before = fp.fetch_result(self.session, self.id_number)
+        hits = fp.result_cache_stats()["hits"]
+        self.assertEqual(fp.fetch_result(self.session, self.id_number), before)
+        self.assertEqual(fp.result_cache_stats()["hits"], hits + 1)
+        write()
+        misses = fp.result_cache_stats()["misses"]
+        after = fp.fetch_result(self.session, self.id_number)
+        self.assertEqual(fp.result_cache_stats()["misses"], misses + 1)
+        self.assertEqual(after, self.query(fp.SELECT_RESULTS, (self.keys()[0],)))
+        return before, after
+
+    def test_insert_results_invalidates(self):
+        before, after = self.assert_cached_then_fresh(lambda: fp.insert_results(self.session, self.id_number, "Subject 0001", "3"))
+        self.assertIn(("Subject 0001", 3), [row[:2] for row in after])
+
+    def test_bulk_insert_invalidates(self):
+        student_id, subject_id, total_points = self.keys()
+        before, after = self.assert_cached_then_fresh(lambda: fp.bulk_insert(self.session, fp.INSERT_RESULT, [(student_id, subject_id, 4)]))
+        self.assertIn(("Subject 0001", 4), [row[:2] for row in after])
+
+    def test_recompute_percents_invalidates(self):
+        student_id, subject_id, total_points = self.keys()
+        fp.insert_results(self.session, self.id_number, "Subject 0001", "5")
+        # a percent that went wrong behind the back of the cache, recompute_percents() repairs it
+        self.execute("UPDATE results SET percent = 0.99 WHERE student_id = %s AND subject_id = %s", (student_id, subject_id))
+        fp.invalidate_results(self.session)
+        before, after = self.assert_cached_then_fresh(lambda: self.assertEqual(fp.recompute_percents(self.session), 1))
+        self.assertIn(("Subject 0001", 0.99), [(row[0], round(row[3], 2)) for row in before])
+        self.assertIn(("Subject 0001", round(5 / total_points, 2)), [(row[0], round(row[3], 2)) for row in after])
+
+
+class IndexableSkipListTest(unittest.TestCase):
+    def test_matches_sorted_list(self):
+        rng = random.Random(7)
+        skip_list = fp.IndexableSkipList(seed=3)
+        keys = set()
+        for step in range(3000):
+            if keys and rng.random() < 0.4:
+                key = rng.choice(sorted(keys))
+                skip_list.remove(key)
+                keys.remove(key)
+            else:
+                key = rng.randrange(500)
+                if key not in keys:
+                    skip_list.insert(key)
+                    keys.add(key)
+            if step % 100 == 0:
+                expected = sorted(keys)
+                self.assertEqual(len(skip_list), len(expected))
+                self.assertEqual(list(skip_list), expected)
+                self.assertEqual([skip_list[i] for i in range(len(expected))], expected)
+                for probe in range(-1, 502, 7):
+                    self.assertEqual(skip_list.index(probe), sum(1 for key in expected if key < probe))
+                if expected:
+                    self.assertEqual(skip_list[-1], expected[-1])
+        with self.assertRaises(IndexError):
+            skip_list[len(keys)]
+        with self.assertRaises(KeyError):
+            skip_list.remove(1000)
+
+
+class LeaderboardTest(unittest.TestCase):
+    def expected_ranking(self, averages:dict, dense:bool) -> list:
+        """(rank, id_number, average) computed with sorted() like fetch_ranking() ranks."""
+        ordered = sorted(averages.items(), key=lambda item: (-item[1], item[0]))
+        ranking = []
+        for position, (id_number, average) in enumerate(ordered, 1):
+            if ranking and ranking[-1][2] == average:
+                rank = ranking[-1][0]
+            else:
+                rank = len({a for i, a in ordered[:position]}) if dense else position
+            ranking.append((rank, id_number, average))
+        return ranking
+
+    def test_ranks_match_sorted_with_ties(self):
+        rng = random.Random(11)
+        leaderboard = fp.Leaderboard()
+        averages = {}
+        # few distinct averages, so most students share theirs with others
+        choices = [0.5, 0.55, 0.6, 0.75, 0.9, 1.0]
+        for step in range(1500):
+            id_number = "ST{:08d}".format(rng.randrange(120))
+            if rng.random() < 0.2:
+                leaderboard.update(id_number, None)
+                averages.pop(id_number, None)
+            else:
+                average = rng.choice(choices)
+                leaderboard.update(id_number, average, 3)
+                averages[id_number] = average
+            if step % 50 == 0:
+                for dense in (False, True):
+                    expected = self.expected_ranking(averages, dense)
+                    self.assertEqual([(row.rank, row.id_number, row.total_average) for row in leaderboard.top(len(expected) + 5, dense)],
+                                     expected)
+                    self.assertEqual([(row.rank, row.id_number) for row in leaderboard.top(10, dense)],
+                                     [(rank, id_number) for rank, id_number, average in expected[:10]])
+                    for rank, id_number, average in expected:
+                        self.assertEqual(leaderboard.rank(id_number, dense), rank)
+                for id_number, average in averages.items():
+                    lower = sum(1 for other in averages.values() if other < average)
+                    self.assertAlmostEqual(leaderboard.percentile(id_number), 100.0 * lower / len(averages))
+                self.assertEqual(len(leaderboard), len(averages))
+        self.assertEqual(leaderboard.rank("ST99999999"), None)
+
+
+class ShardRouterTest(unittest.TestCase):
+    def test_failed_bootstrap_leaves_school_unrouted(self):
+        router = fp.ShardRouter({"missing": fp.SQLiteShard("/nonexistent/school_shards")})
+        with self.assertRaises(Exception), contextlib.redirect_stdout(io.StringIO()):
+            router.add_school("oak_hill")
+        with self.assertRaises(KeyError):
+            router.shard_of("oak_hill")
+
+    def test_add_school(self):
+        router = fp.ShardRouter({"memory": fp.SQLiteShard()})
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(router.add_school("oak_hill"), "memory")
+            self.assertEqual(router.add_school("oak_hill"), "memory")
+        self.assertEqual(router.shard_of("oak_hill"), "memory")
+
+
+class SchoolServiceTest(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = fp.start_service_thread(self.backend, port=0, pool_size=1)
+        self.client = fp.ServiceClient(port=self.service.port, timeout=10)
+        self.assertEqual(self.client.login("parent_000001", "password1"), "parent")
+
+    def tearDown(self):
+        self.client.close()
+        super().tearDown()
+
+    def test_unexpected_error_is_answered(self):
+        async def broken(db, id_number, subject_name=""):
+            raise KeyError(id_number)
+        with mock.patch.object(fp, "fetch_result_async", broken), contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaisesRegex(fp.ServiceError, "internal error"):
+                self.client.student_result("ST00000001")
+        self.assertTrue(self.client.student_result("ST00000001"))
+
+    def test_result_that_is_not_json_is_answered(self):
+        async def not_json(db, id_number, subject_name=""):
+            return object()
+        with mock.patch.object(fp, "fetch_result_async", not_json), contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaisesRegex(fp.ServiceError, "internal error"):
+                self.client.student_result("ST00000001")
+
+
+if __name__ == "__main__":
+    unittest.main()